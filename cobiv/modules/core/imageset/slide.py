@@ -31,7 +31,7 @@ class Slide(Image):
         self.bind(mode=self.on_mode)
         self.bind(texture_size=self.on_texture_size)
 
-        file_fs = session.get_filesystem(cursor.repo_key)
+        file_fs = session.get_cached_filesystem(cursor.repo_key)
         memory_data = file_fs.getbytes(cursor.filename)
 
         im = CoreImage(io.BytesIO(memory_data), ext=cursor.get_tag(0, 'ext', 0))
@@ -0,0 +1,173 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+from fs.mode import Mode
+from fs.wrapfs import WrapFS
+
+logger = logging.getLogger(__name__)
+
+MAX_SIZE = 256 * 1024 * 1024
+""" Default maximum number of bytes kept in the cache """
+READ_AHEAD_WORKERS = 2
+""" Number of files read ahead at the same time """
+
+
+class ByteCache(object):
+    """Content of the repository files read lately or read ahead, bounded in memory.
+
+    Files are read ahead in background threads, in the order given, so that the next images are already in memory
+    when the viewer asks for them. Asking for a file being read ahead waits for that read instead of starting another
+    one. The least recently used files are dropped once the cache is full.
+    """
+
+    def __init__(self, get_filesystem, max_size=MAX_SIZE, workers=READ_AHEAD_WORKERS):
+        """Constructor
+
+        :param get_filesystem: function giving the filesystem of a repository for the calling thread from its key
+        :param max_size: maximum number of bytes kept
+        :param workers: number of files read ahead at the same time
+        """
+        self.get_filesystem = get_filesystem
+        self.max_size = max_size
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        """ content by (repository key, name), the most recently used last """
+        self.size = 0
+        self.pending = {}
+        """ Future of the reads ahead by (repository key, name) """
+        self.executor = None
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, repo_key, name):
+        """Get the content of a file if it is in the cache, without reading it.
+
+        :return: content, or None
+        """
+        key = (repo_key, name)
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def getbytes(self, repo_key, name, filesystem=None, store=True):
+        """Get the content of a file, from the cache or from the read ahead of the file if any, or else by reading it.
+
+        :param repo_key: key of the repository
+        :param name: path of the file in the repository
+        :param filesystem: filesystem of the repository for the calling thread, or None to get it from its key
+        :param store: False not to keep a file read by this call, for reads which won't happen again soon
+        :return: content
+        """
+        data = self.get(repo_key, name)
+        if data is not None:
+            return data
+
+        with self.lock:
+            future = self.pending.get((repo_key, name))
+        if future is not None:
+            try:
+                return future.result()
+            except CancelledError:
+                pass
+            except Exception as e:
+                # read it again, to give the error to the caller
+                logger.debug("read ahead of {} failed: {}".format(name, e))
+
+        if filesystem is None:
+            filesystem = self.get_filesystem(repo_key)
+        data = filesystem.getbytes(name)
+        if store:
+            self._store((repo_key, name), data)
+        return data
+
+    def read_ahead(self, items):
+        """Read files in the background, in the given order. Reads asked for by a previous call and not started yet are
+        cancelled, so that the read ahead follows the last direction of the navigation.
+
+        :param items: list of (repository key, name)
+        """
+        with self.lock:
+            wanted = set(items)
+            for key, future in list(self.pending.items()):
+                if key not in wanted and future.cancel():
+                    del self.pending[key]
+            for key in items:
+                if key in self.entries or key in self.pending:
+                    continue
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers)
+                self.pending[key] = self.executor.submit(self._read, key)
+
+    def _read(self, key):
+        try:
+            data = self.get_filesystem(key[0]).getbytes(key[1])
+            self._store(key, data)
+            return data
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def _store(self, key, data):
+        if len(data) > self.max_size:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self, *args):
+        """Drop all the cached files, when files of the repositories changed."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def close(self):
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+class CachedFS(WrapFS):
+    """Filesystem of a repository reading the files through a ByteCache. A file in the cache is opened from memory,
+    the others being opened from the repository as usual."""
+
+    def __init__(self, wrap_fs, cache, repo_key, store=True):
+        """Constructor
+
+        :param wrap_fs: filesystem of the repository for the calling thread
+        :param cache: ByteCache
+        :param repo_key: key of the repository
+        :param store: False not to keep the files read whole through this filesystem in the cache
+        """
+        super(CachedFS, self).__init__(wrap_fs)
+        self.cache = cache
+        self.repo_key = repo_key
+        self.store = store
+
+    def readbytes(self, path):
+        return self.cache.getbytes(self.repo_key, path, filesystem=self._wrap_fs, store=self.store)
+
+    getbytes = readbytes
+
+    def openbin(self, path, mode='r', buffering=-1, **options):
+        if not Mode(mode).writing:
+            data = self.cache.get(self.repo_key, path)
+            if data is not None:
+                return io.BytesIO(data)
+        return super(CachedFS, self).openbin(path, mode=mode, buffering=buffering, **options)
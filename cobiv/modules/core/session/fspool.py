@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+
+from fs import open_fs
+
+logger = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = 300.0
+""" Delay in seconds after which a handle not handed out is closed """
+CHECK_DELAY = 60.0
+""" Delay in seconds after which a handle not handed out is checked before being handed out again """
+EVICTION_INTERVAL = 30.0
+""" Minimum delay in seconds between two looks for idle handles """
+
+
+def is_shareable(filesystem):
+    """Tell if a filesystem can be used by several threads at the same time without contention, as local filesystems
+    can. Network filesystems serialize their requests on a single connection even when they are thread safe."""
+    meta = filesystem.getmeta()
+    return meta.get('thread_safe', False) and not meta.get('network', False)
+
+
+class PooledHandle(object):
+    __slots__ = ['filesystem', 'last_used']
+
+    def __init__(self, filesystem, last_used):
+        self.filesystem = filesystem
+        self.last_used = last_used
+
+
+class FilesystemPool(object):
+    """Filesystems of the repositories, with a handle by repository and by thread.
+
+    Local filesystems are shared by all threads. The other ones are opened from their url by each thread the first time
+    it asks for them, so that the viewer, the thumbnail loader and the scans don't wait on the same connection. Handles
+    not used for a while are closed by their thread, the handles of the threads which ended are closed by any thread,
+    and a handle idle for some time is checked before being handed out again, to replace a dropped connection.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, check_delay=CHECK_DELAY, opener=open_fs, clock=time.time):
+        """Constructor
+
+        :param idle_timeout: delay after which an idle handle is closed
+        :param check_delay: delay after which an idle handle is checked before being handed out
+        :param opener: function opening a filesystem from its url
+        :param clock: function giving the current time
+        """
+        self.idle_timeout = idle_timeout
+        self.check_delay = check_delay
+        self.opener = opener
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.shared = {}
+        """ filesystem shared by all threads by key """
+        self.urls = {}
+        """ url of the filesystems opened by thread by key """
+        self.handles = {}
+        """ PooledHandle by (key, thread) """
+        self.last_eviction = clock()
+
+    def add(self, key, filesystem, url=None):
+        """Add the filesystem of a repository.
+
+        :param key: key of the repository
+        :param filesystem: filesystem opened by the calling thread
+        :param url: url to open the filesystem in other threads, or None to share the filesystem with all threads
+        """
+        with self.lock:
+            to_close = self._take_handles(lambda handle_key, thread: handle_key == key)
+            self.shared.pop(key, None)
+            self.urls.pop(key, None)
+            if url is None or is_shareable(filesystem):
+                self.shared[key] = filesystem
+            else:
+                self.urls[key] = url
+                self.handles[(key, threading.current_thread())] = PooledHandle(filesystem, self.clock())
+        self._close(to_close)
+
+    def get(self, key):
+        """Get the handle of the filesystem of a repository for the calling thread, opening it if needed.
+
+        :param key: key of the repository
+        :return: filesystem
+        :raise KeyError: if the repository has no filesystem
+        """
+        now = self.clock()
+        thread = threading.current_thread()
+        with self.lock:
+            filesystem = self.shared.get(key)
+            if filesystem is not None:
+                return filesystem
+            url = self.urls[key]
+            to_close = self._evict(now)
+            handle = self.handles.get((key, thread))
+            idle = now - handle.last_used if handle is not None else 0
+            if handle is not None:
+                handle.last_used = now
+        self._close(to_close)
+
+        if handle is not None and (handle.filesystem.isclosed() or
+                                   idle > self.check_delay and not self._is_healthy(handle.filesystem)):
+            logger.info("reopening filesystem {}".format(url))
+            self._close([handle.filesystem])
+            handle = None
+
+        if handle is None:
+            handle = PooledHandle(self.opener(url), now)
+            with self.lock:
+                self.handles[(key, thread)] = handle
+        return handle.filesystem
+
+    def __contains__(self, key):
+        return key in self.shared or key in self.urls
+
+    def close(self):
+        """Close all the filesystems."""
+        with self.lock:
+            to_close = list(self.shared.values()) + self._take_handles(lambda key, thread: True)
+            self.shared.clear()
+            self.urls.clear()
+        self._close(to_close)
+
+    def _take_handles(self, predicate):
+        keys = [handle_key for handle_key in self.handles if predicate(*handle_key)]
+        return [self.handles.pop(handle_key).filesystem for handle_key in keys]
+
+    def _evict(self, now):
+        """Take out the handles of the calling thread idle for too long and those of the ended threads, to call with the
+        lock held. The handles of the other threads are left alone, as they may be in use.
+
+        :return: filesystems to close
+        """
+        if now - self.last_eviction < EVICTION_INTERVAL:
+            return []
+        self.last_eviction = now
+        current = threading.current_thread()
+        return self._take_handles(lambda key, thread: not thread.is_alive() or
+                                  thread is current and now - self.handles[(key, thread)].last_used > self.idle_timeout)
+
+    @staticmethod
+    def _is_healthy(filesystem):
+        try:
+            filesystem.getinfo('/')
+            return True
+        except Exception as e:
+            logger.warning("filesystem {} is not responding: {}".format(filesystem, e))
+            return False
+
+    @staticmethod
+    def _close(filesystems):
+        for filesystem in filesystems:
+            try:
+                filesystem.close()
+            except Exception as e:
+                logger.warning("could not close filesystem {}: {}".format(filesystem, e))
@@ -5,7 +5,9 @@ import copy
 
 from cobiv.libs.templite import Templite
 from cobiv.modules.core.entity import Entity
+from cobiv.modules.core.session.bytecache import ByteCache, CachedFS
 from cobiv.modules.core.session.cursor import Cursor
+from cobiv.modules.core.session.fspool import FilesystemPool
 
 
 class CoreVariables:
@@ -87,7 +89,8 @@ class HistoryContext:
 class Session(Entity):
     cursor = None
     fields = {}
-    active_fs = {}
+    filesystems = None
+    byte_cache = None
     cmd_actions = {}
     cmd_hotkeys = {}
     mimetype_actions = {}
@@ -101,6 +104,8 @@ class Session(Entity):
 
     def __init__(self):
         self.cursor = Cursor()
+        self.filesystems = FilesystemPool()
+        self.byte_cache = ByteCache(self.get_filesystem)
         CoreVariables(self)
 
     def set_cursor(self, new_cursor):
@@ -115,10 +120,27 @@ class Session(Entity):
         return Templite(original_text.replace("%{", "${write(").replace("}%", ")}$")).render(**self.fields)
 
     def get_filesystem(self, key):
-        return self.active_fs[key]
-
-    def add_filesystem(self, key, filesystem):
-        self.active_fs[key] = filesystem
+        """Get the filesystem of a repository for the calling thread, see FilesystemPool."""
+        return self.filesystems.get(key)
+
+    def add_filesystem(self, key, filesystem, url=None):
+        """Add the filesystem of a repository.
+
+        :param key: key of the repository
+        :param filesystem: filesystem opened by the calling thread
+        :param url: url of the filesystem, to open a handle in each thread, or None to share it with all threads
+        """
+        self.filesystems.add(key, filesystem, url)
+
+    def get_cached_filesystem(self, key, store=True, filesystem=None):
+        """Get the filesystem of a repository for the calling thread, reading the files through the byte cache.
+
+        :param key: key of the repository
+        :param store: False not to keep the files read whole in the cache
+        :param filesystem: filesystem of the repository to wrap, or None for the one of the calling thread
+        """
+        return CachedFS(filesystem if filesystem is not None else self.get_filesystem(key), self.byte_cache, key,
+                        store=store)
 
     def set_action(self, name, fn, profile="default"):
         if name in self.cmd_actions:
@@ -10,9 +10,13 @@ import PIL
 from PIL import Image, ImageFile
 
 from cobiv.modules.core.entity import Entity
+from cobiv.modules.core.thumbloader.thumbnail import resize_thumbnail
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+ARCHIVE_BATCH_SIZE = 50
+""" Maximum number of thumbnails created in one pass over an archive """
+
 
 class ThumbLoader(Entity):
     logger = logging.getLogger(__name__)
@@ -64,15 +68,17 @@ class ThumbLoader(Entity):
             while self.thread_alive:
                 if not self.queue_empty:
                     try:
-                        file_id, filename, repo_key, file_type = self.to_cache.popleft()
-
-                        if file_type=='book':
-                            pass
-                        else:
-                            thumb_filename = self.get_fullpath_from_file_id(file_id)
-                            if not os.path.exists(thumb_filename):
-                                self.create_thumbnail_data(repo_key, filename, self.cell_size, thumb_filename)
-                                time.sleep(0.5)
+                        created = False
+                        for file_id, filename, repo_key, file_type in self.next_batch():
+                            if file_type=='book':
+                                pass
+                            else:
+                                thumb_filename = self.get_fullpath_from_file_id(file_id)
+                                if not os.path.exists(thumb_filename):
+                                    self.create_thumbnail_data(repo_key, filename, self.cell_size, thumb_filename)
+                                    created = True
+                        if created:
+                            time.sleep(0.5)
                     except IndexError:
                         self.queue_empty = True
                         time.sleep(2.0)
@@ -81,6 +87,31 @@ class ThumbLoader(Entity):
         except KeyboardInterrupt:
             pass
 
+    def next_batch(self):
+        """Take the next items to create from the queue. The items following the first one in the same archive are
+        taken with it, up to ARCHIVE_BATCH_SIZE, and sorted by their offset in the archive so that the archive is read
+        in one pass.
+
+        :return: list of (file_id, filename, repo_key, file_type)
+        """
+        item = self.to_cache.popleft()
+        repo_key = item[2]
+        # books have no file of their own to read
+        if item[3] == 'book' or repo_key not in self.session.filesystems:
+            return [item]
+        get_member_offset = getattr(self.session.get_filesystem(repo_key), 'get_member_offset', None)
+        if get_member_offset is None:
+            return [item]
+
+        items = [item]
+        try:
+            while len(items) < ARCHIVE_BATCH_SIZE and self.to_cache[0][2] == repo_key:
+                items.append(self.to_cache.popleft())
+        except IndexError:
+            pass
+        items.sort(key=lambda i: get_member_offset(i[1]) or 0)
+        return items
+
     def append(self, *items):
         for item in items:
             self.to_cache.append(item)
@@ -99,15 +130,17 @@ class ThumbLoader(Entity):
         for file_id in items:
             try:
                 os.remove(self.get_fullpath_from_file_id(file_id))
-            except WindowsError:
+            except OSError:
                 pass
 
     def create_thumbnail_data(self, repo_key, filename, size, destination):
         self.logger.debug("creating thumbnail for " + filename)
 
-        file_fs = self.session.get_filesystem(repo_key)
+        # thumbnails are created once, they don't take the place of the images read ahead
+        file_fs = self.session.get_cached_filesystem(repo_key, store=False)
         data = file_fs.getbytes(filename)
         img = Image.open(io.BytesIO(data))
+        img.draft('RGB', (size, size))
         try:
             img.load()
         except SyntaxError as e:
@@ -119,17 +152,7 @@ class ThumbLoader(Entity):
         except:
             pass
 
-        if img.size[1] > img.size[0]:
-            baseheight = size
-            hpercent = (baseheight / float(img.size[1]))
-            wsize = int((float(img.size[0]) * float(hpercent)))
-            hsize = size
-        else:
-            basewidth = size
-            wpercent = (basewidth / float(img.size[0]))
-            hsize = int((float(img.size[1]) * float(wpercent)))
-            wsize = size
-        img = img.resize((wsize, hsize), PIL.Image.ANTIALIAS)
+        img = resize_thumbnail(img, size)
 
         img.convert('RGB').save(destination, format='PNG', optimize=True)
         return destination
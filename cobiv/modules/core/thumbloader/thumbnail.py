@@ -0,0 +1,37 @@
+import io
+
+from PIL import Image
+
+
+def resize_thumbnail(img, size):
+    """Resize an image so that its largest side is the size of the thumbnails.
+
+    :param img: PIL image
+    :param size: size of the thumbnails
+    :return: resized PIL image
+    """
+    if img.size[1] > img.size[0]:
+        wsize = int(float(img.size[0]) * size / float(img.size[1]))
+        hsize = size
+    else:
+        wsize = size
+        hsize = int(float(img.size[1]) * size / float(img.size[0]))
+    return img.resize((max(1, wsize), max(1, hsize)), Image.LANCZOS)
+
+
+def create_thumbnail(img, size):
+    """Create the thumbnail of an image not loaded yet, JPEG images being decoded directly at a reduced scale.
+
+    :param img: PIL image
+    :param size: size of the thumbnails
+    :return: RGB PIL image
+    """
+    img.draft('RGB', (size, size))
+    return resize_thumbnail(img, size).convert('RGB')
+
+
+def thumbnail_to_bytes(img):
+    """Encode a thumbnail in the PNG format of the thumbnail files."""
+    data = io.BytesIO()
+    img.save(data, format='PNG', optimize=True)
+    return data.getvalue()
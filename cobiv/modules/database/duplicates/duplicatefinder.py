@@ -0,0 +1,119 @@
+import threading
+
+from kivy.clock import Clock
+
+from cobiv.modules.core.entity import Entity
+from cobiv.modules.database.duplicates.exactdupes import find_exact_duplicates
+from cobiv.modules.database.duplicates.phashindex import PerceptualHashIndex
+from cobiv.modules.database.sqlitedb.scan.hashing import DEFAULT_ALGORITHM
+
+
+class DuplicateFinder(Entity):
+    """Find the images looking alike, comparing the perceptual hashes computed by updatedb, and the files with
+    identical contents."""
+
+    def __init__(self):
+        super(DuplicateFinder, self).__init__()
+        self.conn = None
+        self.index = None
+
+    def get_name(self=None):
+        return "duplicate_finder"
+
+    def build_yaml_config(self, config):
+        config[self.get_name()] = {
+            'distance': 2
+        }
+        return config
+
+    def ready(self):
+        super(DuplicateFinder, self).ready()
+        self.conn = self.lookup('sqlite_ds', 'Datasource').get_connection()
+        self.get_session().set_action("find-dupes", self.find_dupes)
+        self.get_session().set_action("dedupe", self.dedupe)
+
+    def get_index(self):
+        algorithm = self.lookup('db', 'Entity').get_perceptual_algorithm()
+        if self.index is None or self.index.algorithm != algorithm:
+            self.index = PerceptualHashIndex(self.conn, self.get_app().get_user_path('phash_index.npz'), algorithm)
+        return self.index
+
+    def find_dupes(self, distance=None):
+        """Load in the current set the groups of images whose perceptual hashes differ by at most a distance.
+
+        :param distance: maximum number of different bits between two images of a group
+        """
+        distance = int(distance if distance is not None else self.get_config_value('distance', 2))
+        threading.Thread(target=self._threaded_find_dupes, args=(self.get_index(), distance)).start()
+
+    def _threaded_find_dupes(self, index, distance):
+        self.start_progress("Searching similar images...")
+        self.set_progress_max_count(1)
+        clusters = index.find_clusters(distance)
+        self.stop_progress()
+        self.write_duplicates(clusters)
+        Clock.schedule_once(lambda dt: self.show_duplicates(len(clusters)), 0)
+
+    def dedupe(self):
+        """Load in the current set the groups of files with identical contents, in all the repositories."""
+        threading.Thread(target=self._threaded_dedupe).start()
+
+    def _threaded_dedupe(self):
+        db = self.lookup('db', 'Entity')
+        stored_algorithm = db.get_hash_algorithm()
+        algorithm = stored_algorithm or DEFAULT_ALGORITHM
+
+        self.start_progress("Searching duplicates...")
+
+        def open_file(file_id):
+            repo_key, name = self.conn.execute('select repo_key, name from file where id=?', (file_id,)).fetchone()
+            return self.get_session().get_filesystem(repo_key).openbin(name)
+
+        def known_digests(file_id):
+            row = self.conn.execute('select digest from file_hash where file_key=? and algorithm=?',
+                                    (file_id, algorithm)).fetchone()
+            return row[0] if row is not None else None
+
+        def on_digest(file_id, digest):
+            if stored_algorithm is not None:
+                with db.update_lock, self.conn:
+                    self.conn.execute('insert or replace into file_hash (file_key, algorithm, digest) values (?,?,?)',
+                                      (file_id, algorithm, digest))
+
+        candidates = self.conn.execute(
+            'select size, file_key from core_tags where size in (select size from core_tags group by size having count(*)>1) order by size, file_key').fetchall()
+        self.set_progress_max_count(max(1, len(candidates)))
+
+        def iter_candidates():
+            # a file may be opened twice, for its partial and its full hash, so the progress follows the candidates
+            for candidate in candidates:
+                self.tick_progress()
+                yield candidate
+
+        clusters = list(find_exact_duplicates(iter_candidates(), open_file, algorithm, known_digests=known_digests,
+                                              on_digest=on_digest))
+        self.stop_progress()
+        self.write_duplicates(clusters)
+        Clock.schedule_once(lambda dt: self.show_duplicates(len(clusters)), 0)
+
+    def write_duplicates(self, clusters):
+        """Write groups of files in the duplicate set, each group being adjacent. To call from a background thread, as it
+        waits for the updates of the catalog.
+
+        :param clusters: list of lists of file ids
+        """
+        with self.lookup('db', 'Entity').update_lock, self.conn:
+            self.conn.execute('drop table if exists duplicate_set')
+            self.conn.execute('create temporary table duplicate_set (position integer primary key, file_key int, cluster int)')
+            for cluster_id, cluster in enumerate(clusters):
+                self.conn.executemany('insert into duplicate_set (file_key, cluster) values (?,?)',
+                                      [(int(file_key), cluster_id) for file_key in cluster])
+
+    def show_duplicates(self, count):
+        """Load the duplicate set in the current set.
+
+        :param count: number of groups in the duplicate set
+        """
+        self.lookup('sqliteSetManager', 'SetManager').query_to_current_set(
+            'select file_key as id from duplicate_set order by position')
+        self.notify("{} groups of duplicates found".format(count))
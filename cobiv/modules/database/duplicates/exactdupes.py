@@ -0,0 +1,91 @@
+import logging
+from itertools import groupby
+
+from cobiv.modules.database.sqlitedb.scan.hashing import new_hasher, hash_stream
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_SIZE = 65536
+""" Number of bytes hashed at the beginning and at the end of a file for the partial hash """
+
+
+def partial_hash(stream, size, algorithm, partial_size=PARTIAL_SIZE):
+    """Hash the beginning and the end of a file.
+
+    :param stream: binary file object, positioned at the beginning of the file
+    :param size: size of the file
+    :param algorithm: resolved hash algorithm
+    :param partial_size: number of bytes hashed at each end
+    :return: hexadecimal digest
+    """
+    hasher = new_hasher(algorithm)
+    hasher.update(stream.read(partial_size))
+    if size > partial_size:
+        stream.seek(max(partial_size, size - partial_size))
+        hasher.update(stream.read(partial_size))
+    return hasher.hexdigest()
+
+
+def _split_groups(file_ids, key):
+    """Split a group of files by a key, keeping only the subgroups of more than one file.
+
+    :param key: function giving the key of a file, or None if the file can't be read
+    """
+    keys = {}
+    for file_id in file_ids:
+        value = key(file_id)
+        if value is not None:
+            keys.setdefault(value, []).append(file_id)
+    return [group for group in keys.values() if len(group) > 1]
+
+
+def find_exact_duplicates(candidates, open_file, algorithm, partial_size=PARTIAL_SIZE, known_digests=None,
+                          on_digest=None):
+    """Find the files with identical contents, reading as few bytes as possible.
+
+    Files are grouped by size first, then files sharing their size are compared by a hash of their beginning and end,
+    and only files still colliding are fully hashed. Files smaller than twice the partial size are completely read by
+    the partial hash, so they are not hashed again.
+
+    :param candidates: iterable of (size, file_id), sorted by size
+    :param open_file: function opening a file by id as a binary file object
+    :param algorithm: resolved hash algorithm
+    :param partial_size: number of bytes hashed at each end of the files
+    :param known_digests: function giving the already known full digest of a file, or None
+    :param on_digest: function called with (file_id, digest) for each full digest computed
+    :return: generator of lists of file ids with identical contents
+    """
+
+    def read_hash(file_id, size, full):
+        try:
+            with open_file(file_id) as stream:
+                if full:
+                    return hash_stream(stream, algorithm)
+                return partial_hash(stream, size, algorithm, partial_size)
+        except Exception as e:
+            logger.error("Could not read file {}: {}".format(file_id, e))
+            return None
+
+    def full_hash(file_id, size):
+        digest = known_digests(file_id) if known_digests is not None else None
+        if digest is None:
+            digest = read_hash(file_id, size, True)
+            if digest is not None and on_digest is not None:
+                on_digest(file_id, digest)
+        return digest
+
+    for size, group in groupby(candidates, key=lambda candidate: candidate[0]):
+        file_ids = [file_id for candidate_size, file_id in group]
+        if len(file_ids) < 2:
+            continue
+        if known_digests is not None and all(known_digests(file_id) is not None for file_id in file_ids):
+            for subgroup in _split_groups(file_ids, known_digests):
+                yield subgroup
+            continue
+
+        for subgroup in _split_groups(file_ids, lambda file_id: read_hash(file_id, size, False)):
+            if size <= partial_size * 2:
+                yield subgroup
+            else:
+                for duplicates in _split_groups(subgroup, lambda file_id: full_hash(file_id, size)):
+                    yield duplicates
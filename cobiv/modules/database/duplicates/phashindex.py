@@ -0,0 +1,171 @@
+import logging
+import os
+
+import numpy as np
+
+MAX_DISTANCE = 10
+""" Maximum Hamming distance accepted, as chunks get too small to be selective beyond """
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values):
+    """Count the bits set in an array of 64 bits integers."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def split_chunks(count, bits=64):
+    """Split a hash in chunks of nearly equal sizes.
+
+    :param count: number of chunks
+    :param bits: size of the hash
+    :return: list of (shift, mask)
+    """
+    chunks = []
+    shift = 0
+    for i in range(count):
+        size = bits // count + (1 if i < bits % count else 0)
+        chunks.append((shift, (1 << size) - 1))
+        shift += size
+    return chunks
+
+
+def connected_components(size, first, second):
+    """Label the connected components of a graph, each node getting the smallest node of its component.
+
+    :param size: number of nodes
+    :param first: array of the first nodes of the edges
+    :param second: array of the second nodes of the edges
+    :return: array of labels
+    """
+    labels = np.arange(size)
+    while True:
+        smallest = np.minimum(labels[first], labels[second])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, first, smallest)
+        np.minimum.at(new_labels, second, smallest)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+class PerceptualHashIndex(object):
+    """Multi-index hash table of the perceptual hashes of the catalog.
+
+    To find the hashes within a Hamming distance, hashes are split in distance + 1 chunks: two hashes within the
+    distance have at least one identical chunk. The candidate pairs are found by sorting the hashes on each chunk, and
+    only those pairs are compared.
+
+    The hashes are read from the catalog when first needed and cached in a file, reused as long as the hashes of the
+    catalog don't change.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, conn, cache_path, algorithm):
+        """Constructor
+
+        :param conn: SQLite connection
+        :param cache_path: path of the cache file, ending with .npz
+        :param algorithm: perceptual hash algorithm of the indexed hashes
+        """
+        self.conn = conn
+        self.cache_path = cache_path
+        self.algorithm = algorithm
+        self.signature = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=np.uint64)
+
+    def _get_signature(self):
+        # integer sums, as a float sum of the hashes loses their low bits. The hashes are summed by halves so that the
+        # sums don't overflow.
+        row = self.conn.execute('select count(*), coalesce(sum(file_key), 0), coalesce(sum(value & 4294967295), 0), '
+                                'coalesce(sum(value >> 32), 0) from file_phash where algorithm=?',
+                                (self.algorithm,)).fetchone()
+        return np.array(tuple(row), dtype=np.int64)
+
+    def load(self):
+        """Load the hashes, from the cache file if still valid or else from the catalog."""
+        signature = self._get_signature()
+        if self.signature is not None and np.array_equal(self.signature, signature):
+            return
+
+        if os.path.exists(self.cache_path):
+            try:
+                with np.load(self.cache_path) as cache:
+                    if str(cache['algorithm']) == self.algorithm and np.array_equal(cache['signature'], signature):
+                        self.ids, self.values, self.signature = cache['ids'], cache['values'], signature
+                        return
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.warning("Could not read perceptual hash cache {}: {}".format(self.cache_path, e))
+
+        rows = self.conn.execute('select file_key, value from file_phash where algorithm=? order by file_key',
+                                 (self.algorithm,)).fetchall()
+        self.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        self.values = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows)).view(np.uint64)
+        self.signature = signature
+
+        temp_path = self.cache_path[:-len('.npz')] + '.tmp.npz'
+        try:
+            np.savez(temp_path, ids=self.ids, values=self.values, signature=signature, algorithm=self.algorithm)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            self.logger.warning("Could not write perceptual hash cache {}: {}".format(self.cache_path, e))
+
+    def find_pairs(self, distance):
+        """Find the pairs of hashes within a Hamming distance.
+
+        :param distance: maximum number of different bits
+        :return: (first, second) arrays of indexes in the loaded hashes, a pair being possibly given more than once
+        """
+        distance = max(0, min(int(distance), MAX_DISTANCE))
+        size = len(self.values)
+        found_first, found_second = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        if size < 2:
+            return found_first[0], found_second[0]
+
+        positions = np.arange(size)
+        index_bits = np.uint64(int(size - 1).bit_length())
+        # at least two chunks, so that a chunk packed with an index holds in 64 bits
+        for shift, mask in split_chunks(max(2, distance + 1)):
+            # sorting the chunks packed with their index is much faster than an argsort
+            keys = (self.values >> np.uint64(shift)) & np.uint64(mask)
+            packed = np.sort((keys << index_bits) | positions.astype(np.uint64))
+            order = (packed & ((np.uint64(1) << index_bits) - np.uint64(1))).astype(np.int64)
+            sorted_keys = packed >> index_bits
+            sorted_values = self.values[order]
+
+            # end of the run of identical keys of each position
+            run_ends = np.append(np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1, size)
+            run_end = np.repeat(run_ends, np.diff(np.concatenate(([0], run_ends))))
+
+            active = positions[run_end - positions > 1]
+            offset = 1
+            while len(active) > 0:
+                close = active[popcount64(sorted_values[active] ^ sorted_values[active + offset]) <= distance]
+                found_first.append(order[close])
+                found_second.append(order[close + offset])
+                offset += 1
+                active = active[active + offset < run_end[active]]
+
+        return np.concatenate(found_first), np.concatenate(found_second)
+
+    def find_clusters(self, distance):
+        """Group the images whose hashes are within a Hamming distance of each other, transitively.
+
+        :param distance: maximum number of different bits
+        :return: list of arrays of file ids, ordered by their smallest file id
+        """
+        self.load()
+        first, second = self.find_pairs(distance)
+        if len(first) == 0:
+            return []
+
+        labels = connected_components(len(self.values), first, second)
+        nodes = np.unique(np.concatenate((first, second)))
+        nodes = nodes[np.lexsort((nodes, labels[nodes]))]
+        bounds = np.flatnonzero(np.diff(labels[nodes])) + 1
+        return [self.ids[cluster] for cluster in np.split(nodes, bounds)]
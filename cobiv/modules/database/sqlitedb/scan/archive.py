@@ -0,0 +1,296 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+from os.path import expanduser
+
+from fs import errors
+from fs import path as fspath
+from fs.base import FS
+from fs.enums import ResourceType
+from fs.info import Info
+from fs.mode import Mode
+from fs.opener import Opener, registry
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_PATH = os.path.join(expanduser('~'), '.cobiv', 'archives')
+""" Default directory of the member indexes, one file per archive """
+
+LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+ENCRYPTED = -1
+""" Compression recorded for encrypted members, which are read through zipfile """
+
+ArchiveMember = namedtuple('ArchiveMember', ['offset', 'compressed_size', 'size', 'compression', 'crc', 'modified'])
+""" Member of an archive: offset of its data in the archive, after the local header, sizes, compression method, CRC
+and modification timestamp """
+
+
+def to_member_path(name):
+    """Convert the name of an archive member to an absolute path, or None if it goes out of the archive."""
+    try:
+        return fspath.abspath(fspath.normpath(name.replace('\\', '/')))
+    except errors.IllegalBackReference:
+        return None
+
+
+def build_index(archive_path):
+    """Read the central directory of an archive and the local header of each member, to locate the data of the
+    members.
+
+    :param archive_path: system path of the archive
+    :return: (ArchiveMember by member path, list of the paths of the explicit directories)
+    """
+    members, directories = {}, []
+    with open(archive_path, 'rb') as fd, zipfile.ZipFile(fd) as archive:
+        for info in archive.infolist():
+            path = to_member_path(info.filename)
+            if path is None or path == '/':
+                continue
+            if info.is_dir():
+                directories.append(path)
+                continue
+
+            fd.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(fd.read(LOCAL_HEADER.size))
+            if header[0] != LOCAL_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile("Bad local header of member {}".format(info.filename))
+            offset = info.header_offset + LOCAL_HEADER.size + header[10] + header[11]
+            compression = ENCRYPTED if info.flag_bits & 0x1 else info.compress_type
+            members[path] = ArchiveMember(offset, info.compress_size, info.file_size, compression, info.CRC,
+                                          time.mktime(info.date_time + (0, 0, -1)))
+    return members, directories
+
+
+def get_index_filename(index_path, archive_path):
+    return os.path.join(index_path, hashlib.sha1(archive_path.encode('utf-8')).hexdigest() + '.json')
+
+
+def load_index(archive_path, index_path):
+    """Load the index of an archive from its index file, or build it if the archive changed since it was saved.
+
+    :param archive_path: absolute system path of the archive
+    :param index_path: directory of the index files, or None not to keep the index
+    :return: (ArchiveMember by member path, list of the paths of the explicit directories)
+    """
+    stat_result = os.stat(archive_path)
+    filename = get_index_filename(index_path, archive_path) if index_path is not None else None
+
+    if filename is not None and os.path.exists(filename):
+        try:
+            with open(filename, 'r') as fd:
+                content = json.load(fd)
+            if content['version'] == INDEX_VERSION and content['size'] == stat_result.st_size and \
+                    content['modified'] == stat_result.st_mtime:
+                return {path: ArchiveMember(*values) for path, values in content['members'].items()}, \
+                       content['directories']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Could not read the index of {}: {}".format(archive_path, e))
+
+    members, directories = build_index(archive_path)
+
+    if filename is not None:
+        content = {'version': INDEX_VERSION, 'path': archive_path, 'size': stat_result.st_size,
+                   'modified': stat_result.st_mtime, 'members': members, 'directories': directories}
+        try:
+            os.makedirs(index_path, exist_ok=True)
+            # write then rename, so that the workers of updatedb never read an incomplete index
+            fd, temp_filename = tempfile.mkstemp(dir=index_path, suffix='.tmp')
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(content, temp_file)
+            os.replace(temp_filename, filename)
+        except OSError as e:
+            logger.warning("Could not save the index of {}: {}".format(archive_path, e))
+
+    return members, directories
+
+
+class ArchiveFS(FS):
+    """Read only filesystem of a zip or cbz archive.
+
+    The offsets of the members are kept in an index file, so that opening the archive again doesn't parse its central
+    directory nor its local headers. The archive is opened once, and each member is read with a single seek, which
+    makes reading the pages of a large archive as fast as reading the files of a folder.
+    """
+
+    _meta = {
+        'case_insensitive': False,
+        'invalid_path_chars': '\0',
+        'max_path_length': None,
+        'max_sys_path_length': None,
+        'network': False,
+        'read_only': True,
+        'supports_rename': False,
+        'thread_safe': True,
+        'unicode_paths': True,
+        'virtual': False,
+    }
+
+    def __init__(self, archive_path, index_path=INDEX_PATH):
+        """Constructor
+
+        :param archive_path: system path of the archive
+        :param index_path: directory of the index files, or None not to keep the index
+        """
+        super(ArchiveFS, self).__init__()
+        self.archive_path = os.path.abspath(expanduser(archive_path))
+        self.modified = os.stat(self.archive_path).st_mtime
+        self.members, explicit_directories = load_index(self.archive_path, index_path)
+
+        self.directories = {'/': {}}
+        for path in explicit_directories:
+            self._add_entry(path, True)
+        for path in self.members:
+            self._add_entry(path, False)
+
+        self._file = open(self.archive_path, 'rb')
+        self._archive = None
+        self._archive_infos = None
+
+    def __repr__(self):
+        return "ArchiveFS({!r})".format(self.archive_path)
+
+    def _add_entry(self, path, is_dir):
+        if is_dir:
+            if path in self.directories:
+                return
+            self.directories[path] = {}
+        parent, name = fspath.split(path)
+        if parent not in self.directories:
+            self._add_entry(parent, True)
+        self.directories[parent][name] = is_dir
+
+    def _get_member(self, path):
+        path = fspath.abspath(fspath.normpath(path))
+        member = self.members.get(path)
+        if member is None:
+            if path in self.directories:
+                raise errors.FileExpected(path)
+            raise errors.ResourceNotFound(path)
+        return member
+
+    def _make_info(self, name, path, is_dir, namespaces):
+        raw_info = {'basic': {'name': name, 'is_dir': is_dir}}
+        if 'details' in (namespaces or ()):
+            if is_dir:
+                raw_info['details'] = {'type': int(ResourceType.directory), 'size': 0, 'modified': self.modified}
+            else:
+                member = self.members[path]
+                raw_info['details'] = {'type': int(ResourceType.file), 'size': member.size,
+                                       'modified': member.modified}
+        return Info(raw_info)
+
+    def get_member_offset(self, path):
+        """Get the offset of a member in the archive, to read several members in the order of the archive.
+
+        :param path: path of the member
+        :return: offset of its data, or None if the member doesn't exist
+        """
+        member = self.members.get(fspath.abspath(fspath.normpath(path)))
+        return member.offset if member is not None else None
+
+    def getinfo(self, path, namespaces=None):
+        self.check()
+        path = fspath.abspath(fspath.normpath(path))
+        if path in self.directories:
+            return self._make_info(fspath.basename(path), path, True, namespaces)
+        if path in self.members:
+            return self._make_info(fspath.basename(path), path, False, namespaces)
+        raise errors.ResourceNotFound(path)
+
+    def listdir(self, path):
+        self.check()
+        path = fspath.abspath(fspath.normpath(path))
+        if path in self.directories:
+            return list(self.directories[path])
+        if path in self.members:
+            raise errors.DirectoryExpected(path)
+        raise errors.ResourceNotFound(path)
+
+    def scandir(self, path, namespaces=None, page=None):
+        names = self.listdir(path)
+        path = fspath.abspath(fspath.normpath(path))
+        children = self.directories[path]
+        infos = (self._make_info(name, fspath.join(path, name), children[name], namespaces) for name in names)
+        if page is not None:
+            start, end = page
+            return iter(list(infos)[start:end])
+        return infos
+
+    def readbytes(self, path):
+        self.check()
+        member = self._get_member(path)
+        with self._lock:
+            if member.compression not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                return self._read_with_zipfile(path)
+            self._file.seek(member.offset)
+            data = self._file.read(member.compressed_size)
+
+        if member.compression == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        if zlib.crc32(data) != member.crc:
+            raise errors.ResourceError(path, msg="Bad CRC of member {} in {}".format(path, self.archive_path))
+        return data
+
+    getbytes = readbytes
+
+    def _read_with_zipfile(self, path):
+        # members compressed with other methods are rare in image archives, let zipfile read them
+        if self._archive is None:
+            self._archive = zipfile.ZipFile(self.archive_path)
+            self._archive_infos = {to_member_path(info.filename): info for info in self._archive.infolist()}
+        info = self._archive_infos.get(fspath.abspath(fspath.normpath(path)))
+        if info is None:
+            raise errors.ResourceNotFound(path)
+        return self._archive.read(info)
+
+    def openbin(self, path, mode='r', buffering=-1, **options):
+        self.check()
+        _mode = Mode(mode)
+        if _mode.create or _mode.writing:
+            raise errors.ResourceReadOnly(path)
+        return io.BytesIO(self.readbytes(path))
+
+    def makedir(self, path, permissions=None, recreate=False):
+        raise errors.ResourceReadOnly(path)
+
+    def remove(self, path):
+        raise errors.ResourceReadOnly(path)
+
+    def removedir(self, path):
+        raise errors.ResourceReadOnly(path)
+
+    def setinfo(self, path, info):
+        raise errors.ResourceReadOnly(path)
+
+    def close(self):
+        if not self.isclosed():
+            self._file.close()
+            if self._archive is not None:
+                self._archive.close()
+        super(ArchiveFS, self).close()
+
+
+@registry.install
+class ArchiveOpener(Opener):
+    """Open zip:// and cbz:// repositories as ArchiveFS. Archives opened for writing are left to pyfilesystem. The
+    directory of the index files can be given with the 'index' parameter of the url."""
+
+    protocols = ['zip', 'cbz']
+
+    def open_fs(self, fs_url, parse_result, writeable, create, cwd):
+        if create or writeable:
+            from fs.opener.zipfs import ZipOpener
+            return ZipOpener().open_fs(fs_url, parse_result, writeable, create, cwd)
+        archive_path = os.path.join(cwd, expanduser(parse_result.resource))
+        return ArchiveFS(archive_path, index_path=parse_result.params.get('index', INDEX_PATH))
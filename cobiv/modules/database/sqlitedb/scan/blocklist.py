@@ -0,0 +1,101 @@
+import hashlib
+import math
+import time
+
+MIN_CAPACITY = 1024
+""" Smallest number of digests a Bloom filter is sized for """
+
+
+class BloomFilter(object):
+    """Set of digests answering membership in constant time with a small memory footprint, at the cost of false
+    positives: a digest never added can be reported as present, but an added digest is always reported as present.
+
+    Filters are picklable, so that they can be given to the worker processes of the tag extractor.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """Constructor
+
+        :param capacity: number of digests the filter is sized for
+        :param error_rate: probability of false positives when the filter holds `capacity` digests
+        """
+        self.capacity = max(MIN_CAPACITY, int(capacity))
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        # double hashing: k positions derived from two 64 bits halves of a single hash
+        value = hashlib.blake2b(digest.encode('ascii'), digest_size=16).digest()
+        first = int.from_bytes(value[:8], 'little')
+        second = int.from_bytes(value[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def __len__(self):
+        return self.count
+
+
+class Blocklist(object):
+    """Content digests of the files deleted from Cobiv, so that they are not imported again when they reappear.
+
+    The digests are stored in the blocked_hash table and loaded in a Bloom filter, checked before a new file is read.
+    As the filter can give false positives, a hit is confirmed by the table.
+    """
+
+    def __init__(self, conn, algorithm):
+        """Constructor
+
+        :param conn: SQLite connection
+        :param algorithm: resolved algorithm of the digests
+        """
+        self.conn = conn
+        self.algorithm = algorithm
+        self.filter = None
+
+    def load(self):
+        """Load the digests of the table in a new filter, sized with room for future deletions."""
+        rows = self.conn.execute('select digest from blocked_hash where algorithm=?', (self.algorithm,)).fetchall()
+        bloom_filter = BloomFilter(len(rows) * 2)
+        for row in rows:
+            bloom_filter.add(row[0])
+        self.filter = bloom_filter
+
+    def get_filter(self):
+        """Get the Bloom filter of the blocked digests, loading it when first needed."""
+        if self.filter is None:
+            self.load()
+        return self.filter
+
+    def might_contain(self, digest):
+        return digest is not None and digest in self.get_filter()
+
+    def contains(self, digest):
+        """Check exactly if a digest is blocked."""
+        if not self.might_contain(digest):
+            return False
+        return self.conn.execute('select 1 from blocked_hash where algorithm=? and digest=?',
+                                 (self.algorithm, digest)).fetchone() is not None
+
+    def add(self, cursor, digest, name):
+        """Block a digest. The row is written with the cursor, in the transaction of the caller.
+
+        :param cursor: cursor of the transaction
+        :param digest: content digest of the deleted file
+        :param name: name of the deleted file, kept for information
+        """
+        cursor.execute('insert or replace into blocked_hash (algorithm, digest, name, deleted_date) values (?,?,?,?)',
+                       (self.algorithm, digest, name, time.time()))
+        bloom_filter = self.get_filter()
+        bloom_filter.add(digest)
+        if len(bloom_filter) > bloom_filter.capacity:
+            self.load()
@@ -0,0 +1,72 @@
+import hashlib
+import logging
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALGORITHM = 'blake2b'
+HASH_CHUNK_SIZE = 1024 * 1024
+""" Number of bytes read at once when hashing a stream """
+
+
+def resolve_algorithm(algorithm):
+    """Get the name of the algorithm actually used for a configured algorithm.
+
+    xxhash algorithms ('xxhash' standing for 'xxh64') need the xxhash package, and fall back to the default algorithm
+    when it is not installed. Other names are hashlib algorithms, except the variable length ones (shake) whose
+    digest needs a length.
+
+    :param algorithm: configured algorithm, or None to disable hashing
+    :return: name of the algorithm, or None
+    """
+    if algorithm is None or algorithm == '' or algorithm == 'none':
+        return None
+    if algorithm == 'xxhash':
+        algorithm = 'xxh64'
+    if algorithm.startswith('xxh'):
+        if xxhash is None or not hasattr(xxhash, algorithm):
+            logger.warning("{} is not available, using {} instead".format(algorithm, DEFAULT_ALGORITHM))
+            return DEFAULT_ALGORITHM
+        return algorithm
+    if algorithm not in hashlib.algorithms_available or hashlib.new(algorithm).digest_size == 0:
+        logger.warning("Unknown hash algorithm {}, using {} instead".format(algorithm, DEFAULT_ALGORITHM))
+        return DEFAULT_ALGORITHM
+    return algorithm
+
+
+def new_hasher(algorithm):
+    """Create a hasher for a resolved algorithm, with the update/hexdigest interface of hashlib."""
+    if algorithm.startswith('xxh'):
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def hash_stream(stream, algorithm, chunk_size=HASH_CHUNK_SIZE):
+    """Hash a binary stream from its current position, reading it in chunks.
+
+    :param stream: binary file object
+    :param algorithm: resolved algorithm
+    :param chunk_size: number of bytes read at once
+    :return: hexadecimal digest
+    """
+    hasher = new_hasher(algorithm)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_bytes(data, algorithm):
+    """Hash a bytes string already in memory.
+
+    :return: hexadecimal digest
+    """
+    hasher = new_hasher(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest()
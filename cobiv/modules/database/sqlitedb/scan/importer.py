@@ -0,0 +1,149 @@
+import logging
+import os
+
+from fs import path as fspath
+from fs.errors import FSError, FileExists, NoSysPath
+from fs.tools import copy_file_data
+
+from cobiv.modules.database.sqlitedb.scan.hashing import hash_stream
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 100
+""" Number of staged files moved and registered in the catalog at once """
+
+
+def iter_staged_files(staging_fs, file_filter=None, path='/'):
+    """List the files of a staging folder, in the order of their paths. Directories are listed as the walk reaches them,
+    so that the first files are given without waiting for the whole folder to be listed.
+
+    :param staging_fs: filesystem of the staging folder
+    :param file_filter: function telling if a file name must be imported
+    :param path: path of the directory to list
+    :return: generator of paths
+    """
+    # a directory sorts as its path followed by a separator, so that files come in the order of their full path
+    for info in sorted(staging_fs.scandir(path), key=lambda info: info.name + '/' if info.is_dir else info.name):
+        child = fspath.join(path, info.name)
+        if info.is_dir:
+            yield from iter_staged_files(staging_fs, file_filter, child)
+        elif file_filter is None or file_filter(info.name):
+            yield child
+
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+class Importer(object):
+    """Move the files of a staging folder into a repository, leaving out the files whose content is already in the
+    catalog.
+
+    Each file is hashed once and looked up in the file_hash index, the blocklist and the files imported before it, so
+    duplicates never reach the repository. A file keeps its path relative to the staging folder, with a number added to
+    its name if the repository already has a file there. Files are linked then removed when the staging folder and the
+    repository are on the same local filesystem, and copied then removed otherwise, so that a file appearing at the
+    destination meanwhile is never replaced: the staged file is then left in place as failed.
+    """
+
+    def __init__(self, conn, staging_fs, repo_fs, hash_algorithm, blocklist=None, delete_duplicates=False):
+        """Constructor
+
+        :param conn: SQLite connection
+        :param staging_fs: filesystem of the staging folder
+        :param repo_fs: filesystem of the repository
+        :param hash_algorithm: resolved algorithm of the digests of file_hash, or None to import without deduplicating
+        :param blocklist: blocklist of the deleted files, whose content is not imported again
+        :param delete_duplicates: True to remove the duplicates from the staging folder, False to leave them there
+        """
+        self.conn = conn
+        self.staging_fs = staging_fs
+        self.repo_fs = repo_fs
+        self.hash_algorithm = hash_algorithm
+        self.blocklist = blocklist
+        self.delete_duplicates = delete_duplicates
+        self.digests = set()
+        """ digests of the files imported by this importer """
+        self.destination_digests = {}
+        """ digest of each file imported by this importer by name in the repository """
+
+    def hash_file(self, name):
+        with self.staging_fs.openbin(name) as stream:
+            return hash_stream(stream, self.hash_algorithm)
+
+    def is_duplicate(self, digest):
+        if digest in self.digests:
+            return True
+        if self.conn.execute('select 1 from file_hash where algorithm=? and digest=? limit 1',
+                             (self.hash_algorithm, digest)).fetchone() is not None:
+            return True
+        return self.blocklist is not None and self.blocklist.contains(digest)
+
+    def get_destination(self, name):
+        """Get a free name for a staged file in the repository, numbering it like 'photo_1.jpg' when taken."""
+        base, extension = fspath.splitext(name)
+        destination = name
+        index = 0
+        while self.repo_fs.exists(destination):
+            index += 1
+            destination = '{}_{}{}'.format(base, index, extension)
+        return destination
+
+    def move(self, name, destination):
+        """Move a staged file into the repository, without copying its content when both are on the same local
+        filesystem.
+
+        :raise FileExists: if a file appeared at the destination since it was chosen
+        """
+        self.repo_fs.makedirs(fspath.dirname(destination), recreate=True)
+        try:
+            source_path = self.staging_fs.getsyspath(name)
+            # a link, unlike a rename, fails instead of replacing an existing file
+            os.link(source_path, self.repo_fs.getsyspath(destination))
+            os.remove(source_path)
+            return
+        except NoSysPath:
+            pass
+        except FileExistsError:
+            raise FileExists(destination)
+        except OSError as e:
+            # other filesystem, or no hard links
+            logger.debug("Could not link {}: {}".format(name, e))
+
+        with self.staging_fs.openbin(name) as source, self.repo_fs.openbin(destination, 'x') as target:
+            copy_file_data(source, target)
+        self.staging_fs.remove(name)
+
+    def import_files(self, names):
+        """Move the staged files whose content is not in the catalog yet into the repository.
+
+        :param names: paths of the files in the staging folder
+        :return: (names of the moved files in the repository, paths of the duplicates, paths of the failed files)
+        """
+        moved, duplicates, failed = [], [], []
+        for name in names:
+            try:
+                digest = self.hash_file(name) if self.hash_algorithm is not None else None
+                if digest is not None and self.is_duplicate(digest):
+                    duplicates.append(name)
+                    if self.delete_duplicates:
+                        self.staging_fs.remove(name)
+                    continue
+
+                destination = self.get_destination(name)
+                self.move(name, destination)
+                moved.append(destination)
+                if digest is not None:
+                    self.digests.add(digest)
+                    self.destination_digests[destination] = digest
+            except (FSError, OSError) as e:
+                logger.error("Could not import {}: {}".format(name, e))
+                failed.append(name)
+        return moved, duplicates, failed
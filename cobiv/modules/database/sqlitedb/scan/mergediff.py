@@ -0,0 +1,85 @@
+from fs import path as fspath
+
+from cobiv.modules.database.sqlitedb.scan.scanstate import subtree_range
+
+CHUNK_SIZE = 1000
+""" Number of file names read at once from the catalog """
+BATCH_SIZE = 1000
+""" Maximum number of additions and removals given in one batch """
+
+
+def iter_catalog_names(conn, repo_id, chunk_size=CHUNK_SIZE, root='/'):
+    """Read the names of the files of a repository in the catalog, in name order.
+
+    Names are read in chunks starting after the last name read, so files added or removed meanwhile before that name
+    don't disturb the iteration.
+
+    :param conn: SQLite connection
+    :param repo_id: id of the repository
+    :param chunk_size: number of names read in one query
+    :param root: path of the directory whose subtree is read, '/' for the whole repository
+    :return: generator of file names
+    """
+    last_name, end = subtree_range(root)
+    while True:
+        rows = conn.execute('select name from file where repo_key=? and name>? and name<? order by name limit ?',
+                            (repo_id, last_name, end, chunk_size)).fetchall()
+        for row in rows:
+            yield row[0]
+        if len(rows) < chunk_size:
+            break
+        last_name = rows[-1][0]
+
+
+def merge_diff(walk, catalog_names, batch_size=BATCH_SIZE, on_directory=None):
+    """Merge-join a sorted walk of a repository with the sorted names of its files in the catalog.
+
+    Files of the catalog in a directory which didn't change since the last scan are kept as is.
+
+    :param walk: iterable of (path, entry) in path order, as given by ScanState.walk
+    :param catalog_names: iterable of the names of the files in the catalog, in name order
+    :param batch_size: maximum number of additions and removals in one batch
+    :param on_directory: function called with the path of each directory of the walk
+    :return: generator of (to_add, to_remove) batches, to_add being a list of (name, ScanEntry) and to_remove a list
+        of names
+    """
+    unchanged_paths = set()
+    to_add, to_remove = [], []
+
+    names = iter(catalog_names)
+    current = next(names, None)
+    for path, entry in walk:
+        if entry is None or entry.is_dir:
+            if entry is None:
+                unchanged_paths.add(path)
+            if on_directory is not None:
+                on_directory(path)
+            continue
+
+        while current is not None and current < path:
+            if fspath.dirname(current) not in unchanged_paths:
+                to_remove.append(current)
+                if len(to_add) + len(to_remove) >= batch_size:
+                    yield to_add, to_remove
+                    to_add, to_remove = [], []
+            current = next(names, None)
+
+        if current == path:
+            current = next(names, None)
+        else:
+            to_add.append((path, entry))
+
+        if len(to_add) + len(to_remove) >= batch_size:
+            yield to_add, to_remove
+            to_add, to_remove = [], []
+
+    while current is not None:
+        if fspath.dirname(current) not in unchanged_paths:
+            to_remove.append(current)
+            if len(to_remove) >= batch_size:
+                yield to_add, to_remove
+                to_add, to_remove = [], []
+        current = next(names, None)
+
+    if len(to_add) > 0 or len(to_remove) > 0:
+        yield to_add, to_remove
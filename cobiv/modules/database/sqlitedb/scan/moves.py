@@ -0,0 +1,162 @@
+from cobiv.modules.database.sqlitedb.scan.hashing import hash_stream
+
+MOVE_WINDOW = 10000
+""" Maximum number of removed files held back while waiting for the file they were moved to """
+DATE_TOLERANCE = 1e-05
+""" Difference under which two modification dates are equal, as in the check of the modified files """
+
+
+class MoveDetector(object):
+    """Pair the files removed from a repository with the files added to it during a walk, so that moved or renamed
+    files keep their id, tags and sets instead of being removed and read again.
+
+    An added file is paired with a removed file of the same size and modification date. When several removed files
+    match, or when only the size matches, the content hash of the added file is compared to the hashes of the removed
+    files in the catalog.
+
+    As the walk goes in name order, a file can be removed in a batch and added in a later one. Removed files are held
+    back meanwhile, at most `window` of them, and are given back as removals once the walk is over. A file added
+    before its removal is found is paired with a file of the catalog which no longer exists in the repository.
+    """
+
+    def __init__(self, conn, repo_id, repo_fs, hash_algorithm=None, window=MOVE_WINDOW):
+        """Constructor
+
+        :param conn: SQLite connection
+        :param repo_id: id of the repository
+        :param repo_fs: filesystem of the repository
+        :param hash_algorithm: resolved algorithm of the digests of the catalog, or None to pair by date only
+        :param window: maximum number of removed files held back
+        """
+        self.conn = conn
+        self.repo_id = repo_id
+        self.repo_fs = repo_fs
+        self.hash_algorithm = hash_algorithm
+        self.window = window
+        self.pending = {}
+        self.pending_by_size = {}
+        self.done_names = set()
+        self.moved_ids = set()
+
+    def match(self, to_add, to_remove):
+        """Pair the additions and the removals of a batch of differences with each other and with the removals held
+        back.
+
+        :param to_add: list of (name, ScanEntry) of the new files
+        :param to_remove: list of names of the removed files
+        :return: (to_add, to_remove, moves), with the files left to add, the removals to apply now and the list of
+            (file id, new name, ScanEntry) of the moved files
+        """
+        to_remove = self._hold(to_remove)
+
+        added, moves = [], []
+        for name, entry in to_add:
+            file_id = self._find_source(name, entry)
+            if file_id is None:
+                added.append((name, entry))
+            else:
+                moves.append((file_id, name, entry))
+
+        return added, to_remove + self._release(len(self.pending) - self.window), moves
+
+    def flush(self):
+        """Give back all the removals held back, once the walk is over."""
+        return self._release(len(self.pending))
+
+    def first_pending(self):
+        """Get the first name of the removals held back, or None."""
+        return min(self.pending) if len(self.pending) > 0 else None
+
+    def _hold(self, names):
+        """Hold back removed files with their size and date.
+
+        :return: names to remove now, for files with no details in the catalog
+        """
+        names = [name for name in names if name not in self.done_names]
+        found = set()
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            rows = self.conn.execute('select f.name, f.id, t.size, t.file_date from file f, core_tags t '
+                                     'where f.repo_key=? and f.id=t.file_key and f.name in (%s)' %
+                                     ','.join('?' * len(chunk)), [self.repo_id] + chunk).fetchall()
+            for name, file_id, size, file_date in rows:
+                if file_id in self.moved_ids or size is None:
+                    continue
+                self.pending[name] = (file_id, int(size), file_date)
+                self.pending_by_size.setdefault(int(size), set()).add(name)
+                found.add(name)
+        to_remove = [name for name in names if name not in found]
+        self.done_names.update(to_remove)
+        return to_remove
+
+    def _release(self, count):
+        names = sorted(self.pending)[:max(0, count)]
+        for name in names:
+            self._take(name)
+        self.done_names.update(names)
+        return names
+
+    def _take(self, name):
+        file_id, size, file_date = self.pending.pop(name)
+        names = self.pending_by_size[size]
+        names.discard(name)
+        if len(names) == 0:
+            del self.pending_by_size[size]
+        return file_id
+
+    @staticmethod
+    def _same_date(a, b):
+        return a is not None and b is not None and abs(float(a) - float(b)) <= DATE_TOLERANCE
+
+    def _find_source(self, name, entry):
+        """Find the removed file an added file was moved from.
+
+        :return: id of the removed file, or None if the file is new
+        """
+        if entry is None or entry.size is None:
+            return None
+
+        same_size = {}
+        for old_name in self.pending_by_size.get(entry.size, ()):
+            file_id, size, file_date = self.pending[old_name]
+            same_size[old_name] = (file_id, file_date)
+        candidates = {old_name: file_id for old_name, (file_id, file_date) in same_size.items()
+                      if self._same_date(file_date, entry.modified)}
+
+        if entry.modified is not None:
+            # file moved to a name before its old one, the removal not being found yet
+            rows = self.conn.execute('select f.name, f.id from file f, core_tags t where f.repo_key=? and '
+                                     'f.id=t.file_key and t.size=? and t.file_date between ? and ?',
+                                     (self.repo_id, entry.size, entry.modified - DATE_TOLERANCE,
+                                      entry.modified + DATE_TOLERANCE)).fetchall()
+            for old_name, file_id in rows:
+                if old_name not in self.pending and old_name not in self.done_names and \
+                        file_id not in self.moved_ids and not self.repo_fs.exists(old_name):
+                    candidates[old_name] = file_id
+
+        if len(candidates) != 1:
+            if len(candidates) == 0:
+                candidates = {old_name: file_id for old_name, (file_id, file_date) in same_size.items()}
+            candidates = self._match_digest(name, candidates)
+        if len(candidates) == 0:
+            return None
+
+        old_name, file_id = sorted(candidates.items())[0]
+        if old_name in self.pending:
+            self._take(old_name)
+        self.done_names.add(old_name)
+        self.moved_ids.add(file_id)
+        return file_id
+
+    def _match_digest(self, name, candidates):
+        """Keep the candidates whose content digest is the one of the added file."""
+        if self.hash_algorithm is None or len(candidates) == 0:
+            return {}
+        ids = list(candidates.values())
+        digests = dict(self.conn.execute('select file_key, digest from file_hash where algorithm=? and file_key in (%s)'
+                                         % ','.join('?' * len(ids)), [self.hash_algorithm] + ids).fetchall())
+        if len(digests) == 0:
+            return {}
+        with self.repo_fs.openbin(name) as stream:
+            digest = hash_stream(stream, self.hash_algorithm)
+        return {old_name: file_id for old_name, file_id in candidates.items() if digests.get(file_id) == digest}
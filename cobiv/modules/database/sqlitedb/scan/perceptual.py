@@ -0,0 +1,60 @@
+import numpy as np
+from PIL import Image
+
+PERCEPTUAL_ALGORITHMS = ('dhash', 'phash')
+
+PHASH_SIZE = 32
+""" Side of the grey image transformed by the DCT of the phash """
+
+
+def _dct_matrix(size):
+    k = np.arange(size)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2.0 / size)
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def bits_to_int64(bits):
+    """Pack 64 booleans into a signed 64 bits integer, as stored by SQLite."""
+    value = int(np.packbits(bits.ravel().astype(np.uint8)).view('>u8')[0])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _grey(img, size):
+    # JPEG images are decoded directly at the smallest scale still larger than the thumbnail
+    img.draft('L', size)
+    return img.convert('L').resize(size, Image.BILINEAR)
+
+
+def dhash(img):
+    """Difference hash: compare each pixel of a 9x8 grey thumbnail with its right neighbour.
+
+    :param img: PIL image
+    :return: signed 64 bits integer
+    """
+    pixels = np.asarray(_grey(img, (9, 8)), dtype=np.int16)
+    return bits_to_int64(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(img):
+    """DCT hash: compare the 8x8 lowest frequencies of a 32x32 grey thumbnail with their median.
+
+    :param img: PIL image
+    :return: signed 64 bits integer
+    """
+    pixels = np.asarray(_grey(img, (PHASH_SIZE, PHASH_SIZE)), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].ravel()
+    return bits_to_int64(low > np.median(low[1:]))
+
+
+def perceptual_hash(img, algorithm):
+    """Compute the perceptual hash of an image.
+
+    :param img: PIL image, not loaded yet so that JPEG files can be decoded at a reduced size
+    :param algorithm: 'dhash' or 'phash'
+    :return: signed 64 bits integer
+    """
+    return phash(img) if algorithm == 'phash' else dhash(img)
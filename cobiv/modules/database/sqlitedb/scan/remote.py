@@ -0,0 +1,191 @@
+import heapq
+import threading
+from collections import namedtuple
+
+from fs import path as fspath
+from fs.errors import ResourceNotFound
+
+from cobiv.modules.database.sqlitedb.scan.scanner import ScanEntry, to_file_date
+
+CONNECTIONS = 8
+""" Default number of connections listing directories at the same time """
+WINDOW = 1000
+""" Default maximum number of directories listed ahead of the walk """
+URGENT = ''
+""" Sort key of the directories the walk is waiting for, listed before the others """
+
+Listing = namedtuple('Listing', ['modified', 'entries'])
+""" Directory listed ahead: modification timestamp, None if unknown or False if the directory doesn't exist, and list of
+ScanEntry, None when the directory is unchanged and wasn't listed """
+
+
+def walk_order(path):
+    """Sort key of a directory in the order of the walk of ScanState, where a directory sorts as its path followed by a
+    separator."""
+    return path if path == '/' else path + '/'
+
+
+class RemoteScanner(object):
+    """Scanner of a remote repository, listing directories ahead of the walk on a pool of connections.
+
+    Walking a remote repository one directory at a time is bound by the latency of each listing. This scanner walks
+    the tree on its own in several threads, each with its own connection, listing first the directories the walk of
+    ScanState will ask for next, so that their listing is ready when asked. The modification time of a directory is
+    taken from the listing of its parent instead of being asked for each of them, and the unchanged directories are not
+    listed, their subdirectories being taken from the saved scan state.
+    """
+
+    def __init__(self, open_filesystem, root='/', recursive=True, saved_dirs=None, connections=CONNECTIONS,
+                 window=WINDOW):
+        """Constructor
+
+        :param open_filesystem: function opening a new connection to the repository
+        :param root: path of the directory the walk starts from
+        :param recursive: False to list only the root directory ahead
+        :param saved_dirs: (modification time, subdirectory paths) of the directories saved by the last scan by path,
+            to skip the listing of unchanged directories, or None to list all of them
+        :param connections: number of connections listing directories at the same time
+        :param window: maximum number of directories listed ahead of the walk
+        """
+        self.open_filesystem = open_filesystem
+        self.recursive = recursive
+        self.saved_dirs = saved_dirs or {}
+        self.window = window
+
+        self.condition = threading.Condition()
+        self.queued = []
+        """ heap of (sort key, path) of the directories to list """
+        self.pending = set()
+        self.listings = {}
+        """ Listing or exception by path of the directories listed and not taken yet by the walk, None while listing """
+        self.dir_modified = {}
+        """ modification time of the directories found in the listing of their parent """
+        self.filesystems = []
+        self.local = threading.local()
+        self.closed = False
+
+        self._enqueue([root])
+        self.threads = [threading.Thread(target=self._run, daemon=True) for i in range(max(1, connections))]
+        for thread in self.threads:
+            thread.start()
+
+    def _get_filesystem(self):
+        repo_fs = getattr(self.local, 'repo_fs', None)
+        if repo_fs is None:
+            repo_fs = self.open_filesystem()
+            self.local.repo_fs = repo_fs
+            with self.condition:
+                self.filesystems.append(repo_fs)
+        return repo_fs
+
+    def _enqueue(self, paths, key=None):
+        with self.condition:
+            for path in paths:
+                if key is None and (path in self.pending or path in self.listings):
+                    continue
+                self.pending.add(path)
+                heapq.heappush(self.queued, (key if key is not None else walk_order(path), path))
+            self.condition.notify_all()
+
+    def _next_path(self):
+        """Take the next directory to list, to call with the condition held.
+
+        :return: path, or None if there is nothing to list until the walk goes on
+        """
+        while len(self.queued) > 0:
+            key, path = self.queued[0]
+            if path not in self.pending:
+                heapq.heappop(self.queued)
+                continue
+            if key != URGENT and len(self.listings) >= self.window:
+                return None
+            heapq.heappop(self.queued)
+            self.pending.discard(path)
+            self.listings[path] = None
+            return path
+        return None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                path = self._next_path()
+                while path is None and not self.closed:
+                    self.condition.wait()
+                    path = self._next_path()
+                if self.closed:
+                    return
+            try:
+                listing = self._list(path)
+            except Exception as e:
+                listing = e
+            with self.condition:
+                self.listings[path] = listing
+                self.condition.notify_all()
+
+    def _scandir(self, repo_fs, path):
+        entries, subdirs = [], []
+        for info in repo_fs.scandir(path, namespaces=['details']):
+            entries.append(ScanEntry(info.name, info.is_dir, info.size, to_file_date(info.modified)))
+            if info.is_dir:
+                subdir = fspath.join(path, info.name)
+                subdirs.append(subdir)
+                if info.modified is not None:
+                    self.dir_modified[subdir] = info.modified.timestamp()
+        return entries, subdirs
+
+    def _list(self, path):
+        repo_fs = self._get_filesystem()
+        modified = self.dir_modified.get(path)
+        try:
+            if modified is None:
+                info = repo_fs.getinfo(path, namespaces=['details'])
+                modified = info.modified.timestamp() if info.modified is not None else None
+
+            saved = self.saved_dirs.get(path)
+            if saved is not None and modified is not None and saved[0] == modified:
+                entries, subdirs = None, saved[1]
+            else:
+                entries, subdirs = self._scandir(repo_fs, path)
+        except ResourceNotFound:
+            return Listing(False, None)
+
+        if self.recursive:
+            self._enqueue(subdirs)
+        return Listing(modified, entries)
+
+    def _take(self, path, release):
+        with self.condition:
+            if path not in self.listings:
+                self._enqueue([path], key=URGENT)
+            while self.listings.get(path) is None:
+                self.condition.wait()
+            listing = self.listings[path]
+            if release or not isinstance(listing, Listing) or listing.entries is None:
+                del self.listings[path]
+                self.condition.notify_all()
+        if not isinstance(listing, Listing):
+            raise listing
+        return listing
+
+    def get_dir_modified(self, path):
+        """Get the modification time of a directory, see FsScanner.get_dir_modified."""
+        return self._take(path, release=False).modified
+
+    def scandir(self, path):
+        """List the entries of a directory, see FsScanner.scandir."""
+        listing = self._take(path, release=True)
+        if listing.modified is False:
+            raise ResourceNotFound(path)
+        if listing.entries is None:
+            # the directory was seen as unchanged, but the walk lists it all the same
+            return self._scandir(self._get_filesystem(), path)[0]
+        return listing.entries
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        for repo_fs in self.filesystems:
+            repo_fs.close()
@@ -0,0 +1,101 @@
+import os
+import time
+from collections import namedtuple
+
+from fs.errors import ResourceNotFound
+from fs.osfs import OSFS
+from fs.time import epoch_to_datetime
+
+ScanEntry = namedtuple('ScanEntry', ['name', 'is_dir', 'size', 'modified'])
+""" Entry of a directory. For files, modified is a timestamp comparable to core_tags.file_date """
+
+
+def to_file_date(modified):
+    """Convert a modification datetime to the timestamp stored in core_tags.file_date.
+
+    :param modified: datetime given by the filesystem, or None
+    :return: timestamp, or None
+    """
+    return time.mktime(modified.timetuple()) if modified is not None else None
+
+
+def create_scanner(repo_fs):
+    """Create the fastest scanner for a repository: local repositories are listed natively, the others through
+    pyfilesystem."""
+    if isinstance(repo_fs, OSFS):
+        return OsScanner(repo_fs.getsyspath('/'))
+    return FsScanner(repo_fs)
+
+
+class FsScanner(object):
+    """Scanner listing the directories of a repository through pyfilesystem."""
+
+    def __init__(self, repo_fs):
+        self.repo_fs = repo_fs
+
+    def get_dir_modified(self, path):
+        """Get the modification time of a directory.
+
+        :param path: path of the directory in the repository
+        :return: timestamp, None if the filesystem doesn't support it, or False if the directory doesn't exist
+        """
+        try:
+            info = self.repo_fs.getinfo(path, namespaces=['details'])
+        except ResourceNotFound:
+            return False
+        return info.modified.timestamp() if info.modified is not None else None
+
+    def scandir(self, path):
+        """List the entries of a directory.
+
+        :param path: path of the directory in the repository
+        :return: list of ScanEntry
+        """
+        return [ScanEntry(info.name, info.is_dir, info.size, to_file_date(info.modified)) for info in
+                self.repo_fs.scandir(path, namespaces=['details'])]
+
+
+class OsScanner(object):
+    """Scanner listing the directories of a local repository with os.scandir, taking the size and the modification time
+    of the files from the directory entries without building pyfilesystem infos.
+
+    Timestamps are converted as pyfilesystem does, so both scanners give the same values for the same repository.
+    """
+
+    def __init__(self, root_path):
+        """Constructor
+
+        :param root_path: system path of the root of the repository
+        """
+        self.root_path = root_path
+
+    def _to_sys_path(self, path):
+        return os.path.join(self.root_path, *[part for part in path.split('/') if part])
+
+    def get_dir_modified(self, path):
+        """Get the modification time of a directory, see FsScanner.get_dir_modified."""
+        try:
+            stat_result = os.stat(self._to_sys_path(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        return epoch_to_datetime(stat_result.st_mtime).timestamp()
+
+    def scandir(self, path):
+        """List the entries of a directory, see FsScanner.scandir. Entries which can't be read, like broken links, are
+        skipped."""
+        entries = []
+        try:
+            with os.scandir(self._to_sys_path(path)) as it:
+                for dir_entry in it:
+                    try:
+                        if dir_entry.is_dir():
+                            entries.append(ScanEntry(dir_entry.name, True, None, None))
+                        else:
+                            stat_result = dir_entry.stat()
+                            entries.append(ScanEntry(dir_entry.name, False, stat_result.st_size,
+                                                     to_file_date(epoch_to_datetime(stat_result.st_mtime))))
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            raise ResourceNotFound(path)
+        return entries
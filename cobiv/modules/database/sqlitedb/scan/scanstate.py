@@ -0,0 +1,163 @@
+import time
+
+from fs import path as fspath
+
+from cobiv.modules.database.sqlitedb.scan.scanner import ScanEntry
+
+RECENT_DELAY = 2.0
+""" Directories modified less than this delay before being listed are listed again on the next scan, as a change
+happening in the same tick of a coarse filesystem clock would not change their modification time """
+
+
+def subtree_range(path):
+    """Bounds of the paths under a directory, usable in a 'path>? and path<?' clause.
+
+    :param path: path of the directory
+    :return: lower bound, upper bound
+    """
+    prefix = path.rstrip('/') + '/'
+    return prefix, prefix[:-1] + '0'
+
+
+class ScanState(object):
+    """Persistent state of the directories of a repository, with their modification time and number of images.
+
+    The state allows walking a repository while listing only the directories whose modification time changed since the
+    last scan. The state of a directory is saved only once the catalog has been updated with the result of its scan,
+    which may happen while the walk goes on.
+    """
+
+    def __init__(self, conn, repo_id, root='/'):
+        """Constructor
+
+        :param conn: SQLite connection
+        :param repo_id: id of the repository
+        :param root: path of the directory the walk starts from, '/' for the whole repository
+        """
+        self.conn = conn
+        self.repo_id = repo_id
+        self.root = root
+        self.to_save = []
+        self.to_remove = []
+
+    def walk(self, scanner, recursive=True, file_filter=None, force=False):
+        """Walk the directories of the repository, in the order of the full paths of the files.
+
+        Directories are given before their content, with a ScanEntry when they are listed, or None when they didn't
+        change. The files of unchanged directories are not given.
+
+        :param scanner: scanner of the repository
+        :param recursive: False to walk only the root directory of the walk
+        :param file_filter: function telling if a file name must be part of the walk
+        :param force: True to list all directories, even unchanged ones
+        :return: generator of (path, entry)
+        """
+        pending = [iter([(self.root, None)])]
+        while len(pending) > 0:
+            item = next(pending[-1], None)
+            if item is None:
+                pending.pop()
+                continue
+
+            path, entry = item
+            if entry is not None:
+                yield path, entry
+                continue
+
+            listing = self._list_directory(scanner, path, file_filter, force)
+            if listing is None:
+                continue
+            dir_entry, files, subdirs = listing
+            yield path, dir_entry
+
+            children = [(fspath.join(path, e.name), e) for e in files]
+            if recursive:
+                children.extend((subdir, None) for subdir in subdirs)
+            # a directory sorts as its path followed by a separator, so that files come in the order of their full path
+            children.sort(key=lambda child: child[0] if child[1] is not None else child[0] + '/')
+            pending.append(iter(children))
+
+    def _list_directory(self, scanner, path, file_filter, force):
+        """List a directory if it changed since the last scan.
+
+        :return: None if the directory doesn't exist, or (directory entry, files, subdirectory paths), the directory
+            entry being None and files empty when the directory didn't change
+        """
+        modified = scanner.get_dir_modified(path)
+        if modified is False:
+            return None
+
+        row = self.conn.execute('select mtime from scan_state where repo_key=? and path=?',
+                                (self.repo_id, path)).fetchone()
+        if not force and row is not None and modified is not None and row[0] == modified:
+            subdirs = [r[0] for r in self.conn.execute('select path from scan_state where repo_key=? and parent=?',
+                                                       (self.repo_id, path)).fetchall()]
+            return None, [], subdirs
+
+        entries = scanner.scandir(path)
+        subdirs = [fspath.join(path, e.name) for e in entries if e.is_dir]
+        files = [e for e in entries if not e.is_dir and (file_filter is None or file_filter(e.name))]
+
+        if modified is not None and modified > time.time() - RECENT_DELAY:
+            modified = None
+        parent = fspath.dirname(path) if path != '/' else None
+        self.to_save.append((self.repo_id, path, parent, modified, len(files)))
+
+        if row is not None:
+            children = self.conn.execute('select path from scan_state where repo_key=? and parent=?',
+                                         (self.repo_id, path)).fetchall()
+            self.to_remove.extend((path, r[0]) for r in children if r[0] not in subdirs)
+
+        return ScanEntry(fspath.basename(path), True, None, modified), files, subdirs
+
+    def get_saved_dirs(self):
+        """Get the directories saved by the last scan under the root of the walk.
+
+        :return: dictionary of (modification time, subdirectory paths) by path
+        """
+        rows = self.conn.execute('select path,parent,mtime from scan_state where repo_key=? and (path=? or path>? and path<?)',
+                                 (self.repo_id, self.root) + subtree_range(self.root)).fetchall()
+        saved_dirs = {row[0]: (row[2], []) for row in rows}
+        for path, parent, mtime in rows:
+            if parent in saved_dirs and path != self.root:
+                saved_dirs[parent][1].append(path)
+        return saved_dirs
+
+    def get_listed_paths(self, before=None):
+        """Get the paths of the directories listed by the walk and not saved yet.
+
+        :param before: if given, only the directories whose whole subtree sorts before this name
+        :return: list of paths
+        """
+        return [row[1] for row in self.to_save if before is None or subtree_range(row[1])[1] <= before]
+
+    def take(self, before=None):
+        """Take out the directories listed by the walk and ready to be saved, to write them later.
+
+        :param before: if given, only the directories whose whole subtree sorts before this name
+        :return: (rows, removed paths) to give to write
+        """
+        paths = set(self.get_listed_paths(before))
+        rows = [row for row in self.to_save if row[1] in paths]
+        removed_paths = [path for parent, path in self.to_remove if parent in paths]
+        self.to_save = [row for row in self.to_save if row[1] not in paths]
+        self.to_remove = [(parent, path) for parent, path in self.to_remove if parent not in paths]
+        return rows, removed_paths
+
+    def write(self, rows, removed_paths):
+        """Write directories taken out of the state, in the current transaction."""
+        for path in removed_paths:
+            self.conn.execute('delete from scan_state where repo_key=? and (path=? or path>? and path<?)',
+                              (self.repo_id, path) + subtree_range(path))
+        self.conn.executemany('insert or replace into scan_state (repo_key,path,parent,mtime,entries) values (?,?,?,?,?)',
+                              rows)
+
+    def save(self, before=None):
+        """Save the directories listed by the walk.
+
+        :param before: if given, only the directories whose whole subtree sorts before this name are saved, the others
+            being kept for a later call
+        """
+        rows, removed_paths = self.take(before)
+        with self.conn:
+            self.write(rows, removed_paths)
@@ -0,0 +1,98 @@
+import logging
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+from fs import path as fspath
+from fs.errors import FSError
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_EXTENSION = '.xmp'
+
+RDF_NS = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+
+SidecarUpdate = namedtuple('SidecarUpdate', ['file_id', 'name', 'sidecar', 'keywords'])
+""" Change of the sidecar of an image: id of the image, None for a new image, name of the image, ScanEntry of the
+sidecar with its full path as name or None if it was removed, and its keywords """
+
+
+def is_sidecar(name):
+    return name.lower().endswith(SIDECAR_EXTENSION)
+
+
+def match_sidecars(entries):
+    """Pair the images of a directory listing with their sidecar, either 'photo.jpg.xmp' or 'photo.xmp'. The first
+    form is preferred when both exist.
+
+    :param entries: list of ScanEntry of a directory
+    :return: (entries without the sidecars, ScanEntry of the sidecar by image name)
+    """
+    sidecars = {e.name[:-len(SIDECAR_EXTENSION)]: e for e in entries if not e.is_dir and is_sidecar(e.name)}
+    if len(sidecars) == 0:
+        return entries, {}
+
+    others = [e for e in entries if e.is_dir or not is_sidecar(e.name)]
+    result = {}
+    for entry in others:
+        if entry.is_dir:
+            continue
+        sidecar = sidecars.get(entry.name, sidecars.get(fspath.splitext(entry.name)[0]))
+        if sidecar is not None:
+            result[entry.name] = sidecar
+    return others, result
+
+
+def read_keywords(data):
+    """Read the keywords of an XMP sidecar, from its dc:subject bag.
+
+    :param data: content of the sidecar
+    :return: list of keywords, empty if the sidecar can't be parsed
+    """
+    try:
+        root = ElementTree.fromstring(data)
+    except ElementTree.ParseError as e:
+        logger.warning("Could not parse sidecar: {}".format(e))
+        return []
+
+    keywords = []
+    for subject in root.iter(DC_NS + 'subject'):
+        for item in subject.iter(RDF_NS + 'li'):
+            keyword = (item.text or '').strip()
+            if len(keyword) > 0 and keyword not in keywords:
+                keywords.append(keyword)
+    return keywords
+
+
+def read_sidecar(repo_fs, name):
+    """Read the keywords of a sidecar file, or an empty list if it can't be read."""
+    try:
+        return read_keywords(repo_fs.getbytes(name))
+    except (FSError, OSError) as e:
+        logger.warning("Could not read sidecar {}: {}".format(name, e))
+        return []
+
+
+class SidecarScanner(object):
+    """Scanner taking the sidecars out of the listings of another scanner, so that the walk gives only images. The
+    sidecars found are kept by image path, in the same directory pass. The sidecars of the directories skipped as
+    unchanged are not listed, so their edits in place are left to the watcher."""
+
+    def __init__(self, scanner, sidecars):
+        """Constructor
+
+        :param scanner: scanner of the repository
+        :param sidecars: dictionary filled with the ScanEntry of the sidecar of each image by image path, the name of
+            the entry being the full path of the sidecar
+        """
+        self.scanner = scanner
+        self.sidecars = sidecars
+
+    def get_dir_modified(self, path):
+        return self.scanner.get_dir_modified(path)
+
+    def scandir(self, path):
+        entries, sidecars = match_sidecars(self.scanner.scandir(path))
+        for name, entry in sidecars.items():
+            self.sidecars[fspath.join(path, name)] = entry._replace(name=fspath.join(path, entry.name))
+        return entries
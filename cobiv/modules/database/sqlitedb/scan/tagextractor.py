@@ -0,0 +1,335 @@
+import concurrent.futures
+import importlib.util
+import inspect
+import io
+import logging
+import sys
+import threading
+from collections import namedtuple
+
+from PIL import Image
+from fs import open_fs
+
+from cobiv.modules.core.thumbloader.thumbnail import create_thumbnail, thumbnail_to_bytes
+# installs the opener of zip and cbz repositories, in the application and in the workers
+from cobiv.modules.database.sqlitedb.scan import archive  # noqa: F401
+from cobiv.modules.database.sqlitedb.scan.hashing import hash_bytes, hash_stream
+from cobiv.modules.database.sqlitedb.scan.perceptual import perceptual_hash
+from cobiv.modules.database.sqlitedb.scan.sidecar import read_sidecar
+from cobiv.modules.database.sqlitedb.scan.throttle import lower_io_priority
+from cobiv.modules.io.reader.tagreader import TagReader
+
+logger = logging.getLogger(__name__)
+
+_worker_readers = []
+""" Tag readers instantiated in a worker process """
+_worker_hash_algorithm = None
+""" Hash algorithm used in a worker process """
+_worker_perceptual_algorithm = None
+""" Perceptual hash algorithm used in a worker process """
+_worker_blocked = None
+""" Bloom filter of the blocked digests in a worker process """
+
+FileData = namedtuple('FileData', ['rows', 'digest', 'perceptual_hash', 'thumbnail', 'table_rows'])
+""" Data read from a file: tag rows, -1 for invalid images or BLOCKED, content digest, perceptual hash and PNG data of
+the thumbnail, None when not computed, and list of (table name, values by column) written by the readers having their
+own table """
+BLOCKED = -2
+""" Rows of a file whose digest is probably blocked, left unread """
+_worker_filesystems = {}
+""" Filesystems opened in a worker process, by repository path """
+
+
+def read_file_tags(file_id, name, repo_fs, readers):
+    """Read the tags of an image file. Only the header is read to get the image properties, and the rest of the file
+    is read only if a reader asks for it.
+
+    :param file_id: id of the file in the catalog
+    :param name: path of the file in the repository
+    :param repo_fs: filesystem of the repository
+    :param readers: list of TagReader instances to apply on the file
+    :return: list of tag rows (file_id, category, kind, type, value), or -1 if the file is not a valid image
+    """
+    return read_file(file_id, name, repo_fs, readers).rows
+
+
+def read_file(file_id, name, repo_fs, readers, hash_algorithm=None, perceptual_algorithm=None, blocked=None,
+              thumbnail_size=None, known_digest=None):
+    """Read the tags of an image file and hash its content, opening the file only once.
+
+    The content is hashed in chunks from the stream, unless a reader already needed the whole content in memory.
+    When some digests are blocked, the content is hashed first, and the file is not read any further if its digest is
+    in the filter.
+
+    When a thumbnail is asked for, the whole file is read at once and everything is done from memory, so that the file
+    is transferred only once from a remote repository. So is a file to hash whose stream can't seek back or comes from
+    a network filesystem, as it would be read again after the hash.
+
+    :param hash_algorithm: resolved hash algorithm, or None to skip hashing
+    :param perceptual_algorithm: perceptual hash algorithm, or None to skip it
+    :param blocked: BloomFilter of the blocked digests, or None
+    :param thumbnail_size: size of the thumbnail to create, or None to skip it
+    :param known_digest: digest of the content already computed with hash_algorithm, or None. The file is then neither
+        hashed again nor checked against the blocked digests.
+    :return: FileData, with BLOCKED rows if the digest is probably blocked
+    """
+    to_add = []
+    table_rows = []
+    digest = known_digest
+    image_hash = None
+    thumbnail = None
+    content = None
+
+    with repo_fs.openbin(name) as file_stream:
+        stream = file_stream
+        hashed = hash_algorithm is not None and digest is None
+        if thumbnail_size is not None or hashed and _must_buffer(repo_fs, file_stream):
+            content = file_stream.read()
+            stream = io.BytesIO(content)
+
+        if hashed and blocked is not None and len(blocked) > 0:
+            digest = hash_bytes(content, hash_algorithm) if content is not None else hash_stream(stream, hash_algorithm)
+            if digest in blocked:
+                return FileData(BLOCKED, digest, None, None, [])
+            stream.seek(0)
+
+        try:
+            img = Image.open(stream)
+
+            to_add.append((file_id, 0, 'width', 1, str(img.size[0])))
+            to_add.append((file_id, 0, 'height', 1, str(img.size[1])))
+            to_add.append((file_id, 0, 'format', 0, img.format))
+
+            if img.info:
+                for i, v in img.info.items():
+                    if i == "tags":
+                        tag_list = v.split(",")
+                        for tag in tag_list:
+                            to_add.append((file_id, 1, 'tag', 0, tag.strip()))
+        except OSError as e:
+            logger.error("Could not open file {}!".format(name))
+            logger.error(e, exc_info=True)
+            return FileData(-1, None, None, None, [])
+        except:
+            pass
+
+        if perceptual_algorithm is not None:
+            try:
+                image_hash = perceptual_hash(img, perceptual_algorithm)
+            except Exception as e:
+                logger.warning("Could not compute the perceptual hash of {}: {}".format(name, e))
+
+        if thumbnail_size is not None:
+            try:
+                thumbnail = thumbnail_to_bytes(create_thumbnail(Image.open(io.BytesIO(content)), thumbnail_size))
+            except Exception as e:
+                logger.warning("Could not create the thumbnail of {}: {}".format(name, e))
+
+        if content is None and any(reader.data_mode == TagReader.CONTENT for reader in readers):
+            stream.seek(0)
+            content = stream.read()
+
+        header = b''
+        header_size = max([reader.header_size for reader in readers if reader.data_mode == TagReader.HEADER] or [0])
+        if header_size > 0:
+            if content is not None:
+                header = content[:header_size]
+            else:
+                stream.seek(0)
+                header = stream.read(header_size)
+
+        for reader in readers:
+            if reader.data_mode == TagReader.CONTENT:
+                data = content
+            elif reader.data_mode == TagReader.HEADER:
+                data = header[:reader.header_size]
+            else:
+                stream.seek(0)
+                data = stream
+            reader.read_file_tags(file_id, data, to_add)
+            if reader.tablename is not None:
+                if data is stream:
+                    stream.seek(0)
+                values = reader.read_file_values(file_id, data)
+                if values is not None:
+                    table_rows.append((reader.tablename, values))
+
+        if hash_algorithm is not None and digest is None:
+            if content is not None:
+                digest = hash_bytes(content, hash_algorithm)
+            else:
+                stream.seek(0)
+                digest = hash_stream(stream, hash_algorithm)
+
+    return FileData(to_add, digest, image_hash, thumbnail, table_rows)
+
+
+def _must_buffer(repo_fs, stream):
+    """Tell if a file read more than once must be kept in memory, as its stream can't seek back or comes from a
+    network filesystem."""
+    try:
+        seekable = stream.seekable()
+    except (AttributeError, OSError):
+        seekable = False
+    return not seekable or repo_fs.getmeta().get('network', False)
+
+
+def _get_reader_spec(reader):
+    """Locate the module file of a tag reader. Plugin modules are not always registered in sys.modules, so the file
+    is found from the code of the methods defined by the class itself."""
+    cls = type(reader)
+    module = sys.modules.get(cls.__module__)
+    module_file = getattr(module, '__file__', None)
+    if module_file is None:
+        for attr in vars(cls).values():
+            if inspect.isfunction(attr):
+                module_file = attr.__code__.co_filename
+                break
+    return module_file, cls.__name__
+
+
+def _load_reader(module_file, class_name):
+    """Instantiate a tag reader from the file of its module, as plugins are not importable by name."""
+    try:
+        spec = importlib.util.spec_from_file_location('cobiv_worker_' + class_name, module_file)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return getattr(module, class_name)()
+    except Exception as e:
+        logger.error("Could not load tag reader {} in worker!".format(class_name))
+        logger.error(e, exc_info=True)
+        return None
+
+
+def _init_worker(reader_specs, hash_algorithm, perceptual_algorithm, blocked, ionice):
+    global _worker_readers, _worker_hash_algorithm, _worker_perceptual_algorithm, _worker_blocked
+    if ionice:
+        lower_io_priority(whole_process=True)
+    _worker_readers = [reader for reader in (_load_reader(*spec) for spec in reader_specs) if reader is not None]
+    _worker_hash_algorithm = hash_algorithm
+    _worker_perceptual_algorithm = perceptual_algorithm
+    _worker_blocked = blocked
+
+
+def _get_worker_filesystem(repo_path):
+    repo_fs = _worker_filesystems.get(repo_path)
+    if repo_fs is None:
+        repo_fs = open_fs(repo_path)
+        _worker_filesystems[repo_path] = repo_fs
+    return repo_fs
+
+
+def _extract(repo_path, file_id, name, thumbnail_size, known_digest):
+    return file_id, read_file(file_id, name, _get_worker_filesystem(repo_path), _worker_readers, _worker_hash_algorithm,
+                              _worker_perceptual_algorithm, _worker_blocked, thumbnail_size, known_digest)
+
+
+def _read_sidecar(repo_path, key, name):
+    return key, read_sidecar(_get_worker_filesystem(repo_path), name)
+
+
+class TagExtractor(object):
+    """Extract the tags, the content hash and the perceptual hash of image files, either in the calling thread or in a
+    pool of worker processes.
+
+    With workers, at most `window` files by call of extract are in flight at the same time, and results are given back
+    in the order they complete. Several threads can extract at the same time, sharing the workers. Tag readers are
+    instantiated again in each worker, so they must not rely on the running application.
+    """
+
+    def __init__(self, readers, workers=0, window=None, hash_algorithm=None, perceptual_algorithm=None, blocked=None,
+                 ionice=False):
+        """Constructor
+
+        :param readers: list of TagReader instances
+        :param workers: number of worker processes. 0 extracts the tags in the calling thread.
+        :param window: maximum number of files submitted to the workers and not yet collected
+        :param hash_algorithm: resolved hash algorithm of the content, or None to skip hashing
+        :param perceptual_algorithm: perceptual hash algorithm, or None to skip it
+        :param blocked: BloomFilter of the blocked digests, copied to the workers when they start, or None
+        :param ionice: True to give the lowest I/O priority to the workers
+        """
+        self.readers = readers
+        self.hash_algorithm = hash_algorithm
+        self.perceptual_algorithm = perceptual_algorithm
+        self.blocked = blocked
+        self.ionice = ionice
+        self.workers = max(0, workers)
+        self.window = max(1, window if window is not None else self.workers * 4)
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                specs = [_get_reader_spec(reader) for reader in self.readers]
+                self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                                   initargs=(specs, self.hash_algorithm,
+                                                                             self.perceptual_algorithm, self.blocked,
+                                                                             self.ionice))
+            return self.pool
+
+    def extract(self, repo_path, repo_fs, files, thumbnail_size=None, digests=None):
+        """Extract the tags of a list of files.
+
+        :param repo_path: url of the repository, opened again by the workers
+        :param repo_fs: filesystem of the repository, used when extracting in the calling thread
+        :param files: iterable of (file_id, name)
+        :param thumbnail_size: size of the thumbnails to create in the same pass, or None
+        :param digests: digests of the contents already known by name, which are not computed again, or None
+        :return: generator of (file_id, FileData)
+        """
+        digests = digests if digests is not None else {}
+        if self.workers == 0 or repo_path is None:
+            for file_id, name in files:
+                yield file_id, read_file(file_id, name, repo_fs, self.readers, self.hash_algorithm,
+                                         self.perceptual_algorithm, self.blocked, thumbnail_size, digests.get(name))
+            return
+
+        for result in self._map(_extract, ((repo_path, file_id, name, thumbnail_size, digests.get(name))
+                                           for file_id, name in files)):
+            yield result
+
+    def read_sidecars(self, repo_path, repo_fs, sidecars):
+        """Read the keywords of XMP sidecars.
+
+        :param repo_path: url of the repository, opened again by the workers
+        :param repo_fs: filesystem of the repository, used when reading in the calling thread
+        :param sidecars: iterable of (key, name of the sidecar)
+        :return: generator of (key, list of keywords)
+        """
+        if self.workers == 0 or repo_path is None:
+            for key, name in sidecars:
+                yield key, read_sidecar(repo_fs, name)
+            return
+
+        for result in self._map(_read_sidecar, ((repo_path, key, name) for key, name in sidecars)):
+            yield result
+
+    def _map(self, fn, calls):
+        """Call a function in the workers for each set of arguments, with at most `window` calls in flight.
+
+        :return: generator of the results, in the order they complete
+        """
+        pool = self._get_pool()
+        pending = set()
+        try:
+            for args in calls:
+                pending.add(pool.submit(fn, *args))
+                if len(pending) >= self.window:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+            while len(pending) > 0:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+IDLE_DELAY = 2.0
+""" Seconds without navigation after which a scan backed off goes on """
+BACKOFF_STEP = 0.1
+""" Longest sleep of a scan backed off, so that it notices quickly a cancellation or the end of the navigation """
+
+
+def lower_io_priority(whole_process=False):
+    """Give the lowest I/O priority to the calling thread, with psutil.
+
+    On Linux the priority is set for the calling thread only. Elsewhere it can only be set for the whole process, which
+    is done only if asked for, as the user interface would be slowed down too.
+
+    :param whole_process: True if the whole process may be given the lowest priority
+    :return: True if the priority was lowered
+    """
+    if psutil is None or not hasattr(psutil.Process, 'ionice'):
+        return False
+    try:
+        if hasattr(psutil, 'IOPRIO_CLASS_IDLE'):
+            psutil.Process(threading.get_native_id()).ionice(psutil.IOPRIO_CLASS_IDLE)
+        elif whole_process and hasattr(psutil, 'IOPRIO_VERYLOW'):
+            psutil.Process().ionice(psutil.IOPRIO_VERYLOW)
+        else:
+            return False
+        return True
+    except (psutil.Error, OSError, ValueError) as e:
+        logger.warning("Could not lower the I/O priority: {}".format(e))
+        return False
+
+
+class IoThrottle(object):
+    """Limit the reads of a scan to a number of bytes and a number of files per second, shared by all the threads of
+    the scan, and pause it while the user navigates.
+
+    Reads are accounted once done: each read books a time slot as long as it takes to read its bytes or one file at the
+    configured rates, and the next read waits for the end of the slots booked before.
+    """
+
+    def __init__(self, bytes_per_second=None, files_per_second=None, idle_delay=IDLE_DELAY, cancelled=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        """Constructor
+
+        :param bytes_per_second: maximum number of bytes read per second, or None
+        :param files_per_second: maximum number of files read per second, or None
+        :param idle_delay: seconds without navigation before a paused scan goes on, 0 to never pause
+        :param cancelled: function telling if the scan was cancelled, to stop waiting
+        """
+        self.bytes_per_second = bytes_per_second if bytes_per_second else None
+        self.files_per_second = files_per_second if files_per_second else None
+        self.idle_delay = idle_delay
+        self.cancelled = cancelled
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_time = None
+        self.last_activity = None
+
+    def notify_activity(self):
+        """Tell that the user is navigating, so that the scan backs off."""
+        self.last_activity = self.clock()
+
+    def is_active(self):
+        return self.last_activity is not None and self.clock() - self.last_activity < self.idle_delay
+
+    def consume(self, files=1, size=0):
+        """Account for files read, blocking the calling thread as long as the rates or the navigation require.
+
+        :param files: number of files read
+        :param size: number of bytes read
+        """
+        while True:
+            # read once, the clock may move and the activity may be notified meanwhile
+            last_activity = self.last_activity
+            remaining = self.idle_delay - (self.clock() - last_activity) if last_activity is not None else 0
+            if remaining <= 0:
+                break
+            if self.cancelled is not None and self.cancelled():
+                return
+            self.sleep(min(BACKOFF_STEP, remaining))
+
+        duration = 0
+        if self.files_per_second is not None:
+            duration = files / float(self.files_per_second)
+        if self.bytes_per_second is not None and size is not None:
+            duration = max(duration, size / float(self.bytes_per_second))
+        if duration == 0:
+            return
+
+        with self.lock:
+            now = self.clock()
+            start = max(now, self.next_time) if self.next_time is not None else now
+            self.next_time = start + duration
+        if start > now:
+            self.sleep(start - now)
@@ -7,18 +7,20 @@ class CustomTableStrategy(DefaultSearchStrategy):
     """Common search strategy for custom tables. Given a custom table with a least a file key column, the strategy maps
     automatically all the specified fields of the table to be sortable and searchable"""
 
-    def __init__(self, tablename, fields, file_key="file_key"):
+    def __init__(self, tablename, fields, file_key="file_key", numeric_fields=()):
         """Constructor
 
         :param tablename: Name of the SQL table
         :param fields: list of columns of the table to map as searchable and sortable
         :param file_key: column name that is the foreign key to the file id
+        :param numeric_fields: columns holding only numbers, compared without a cast so that their index is used
         """
         super(CustomTableStrategy, self).__init__()
 
         self.tablename = tablename
         self.file_key_name = file_key
         self.fields = fields
+        self.numeric_fields = set(numeric_fields)
 
         self.operator_functions = {
             'in': [self.prepare_in, self.parse_in, self.join_query_core_tags],
@@ -84,17 +86,20 @@ class CustomTableStrategy(DefaultSearchStrategy):
             result += self.add_query(result, " or ", '%s like "%s"' % (kind, value))
         return result
 
+    def as_number(self, kind):
+        return kind if kind in self.numeric_fields else 'cast(%s as float)' % kind
+
     def parse_greater_than(self, kind, value):
-        return 'cast(%s as float)>%s' % (kind, value)
+        return '%s>%s' % (self.as_number(kind), value)
 
     def parse_lower_than(self, kind, value):
-        return 'cast(%s as float)<%s' % (kind, value)
+        return '%s<%s' % (self.as_number(kind), value)
 
     def parse_greater_equals(self, kind, value):
-        return 'cast(%s as float)>=%s' % (kind, value)
+        return '%s>=%s' % (self.as_number(kind), value)
 
     def parse_lower_equals(self, kind, value):
-        return 'cast(%s as float)<=%s' % (kind, value)
+        return '%s<=%s' % (self.as_number(kind), value)
 
     def parse_between(self, kind, sets_values):
         result = ''
@@ -104,7 +109,7 @@ class CustomTableStrategy(DefaultSearchStrategy):
             for val_from in it:
                 val_to = next(it)
                 subquery += self.add_query(subquery, ' or ',
-                                           'cast(%s as float) between %s and %s' % (kind, val_from, val_to))
+                                           '%s between %s and %s' % (self.as_number(kind), val_from, val_to))
 
             result += self.add_query(result, ' and ', '(%s)' % subquery)
 
@@ -116,11 +121,11 @@ class CustomTableStrategy(DefaultSearchStrategy):
             for value in values:
                 date_from = fn_from(value)
                 date_to = fn_to(value)
-                subquery += self.add_query(subquery, ' or ', 'cast(%s as float) between %s and %s' % (kind,
-                                                                                                      time.mktime(
-                                                                                                          date_from.timetuple()),
-                                                                                                      time.mktime(
-                                                                                                          date_to.timetuple())))
+                subquery += self.add_query(subquery, ' or ', '%s between %s and %s' % (self.as_number(kind),
+                                                                                      time.mktime(
+                                                                                          date_from.timetuple()),
+                                                                                      time.mktime(
+                                                                                          date_to.timetuple())))
         return "(%s)" % subquery
 
     # Joins
@@ -25,6 +25,10 @@ class SearchManager(Entity):
 
         self.strategies = []
         self.strategies.append(CustomTableStrategy(tablename="core_tags", fields=['path', 'size', 'file_date', 'ext','filename']))
+        for reader in self.lookups('TagReader'):
+            if reader.tablename is not None:
+                self.strategies.append(CustomTableStrategy(tablename=reader.tablename, fields=reader.fields,
+                                                           numeric_fields=reader.numeric_fields))
         self.strategies.append(DefaultSearchStrategy())
 
     def render_text(self, original_text):
@@ -155,8 +159,9 @@ By default:
         ref_table, ref_col = sql_tables[0]
         join_query = ref_table
         if len(sql_tables) > 1:
+            # files missing from a table, like images without EXIF fields, are kept and sorted as null
             for tablename, colname in sql_tables[1:]:
-                join_query += " inner join %s on %s.%s=%s.%s" % (tablename, tablename, colname, ref_table, ref_col)
+                join_query += " left join %s on %s.%s=%s.%s" % (tablename, tablename, colname, ref_table, ref_col)
 
         query = 'create temporary table %s as select %s from %s' % (
             TEMP_PRESORT_TABLE, ', '.join(sql_fields), join_query)
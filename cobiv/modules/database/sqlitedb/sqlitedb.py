@@ -1,20 +1,46 @@
 import logging
+import queue
 import sqlite3
 import threading
+from collections import namedtuple
 
-import os, io, time
+import os
 from fs import open_fs
+from fs import path as fspath
+from fs.errors import ResourceNotFound
+from fs.opener.parse import parse_fs_url
 
-from PIL import Image
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.factory import Factory
 
 from cobiv.modules.core.entity import Entity
 from cobiv.modules.core.session.cursor import CursorInterface
+from cobiv.modules.database.sqlitedb.scan.perceptual import PERCEPTUAL_ALGORITHMS
+from cobiv.modules.database.sqlitedb.scan.mergediff import merge_diff, iter_catalog_names
+from cobiv.modules.database.sqlitedb.scan.scanner import create_scanner, to_file_date, ScanEntry
+from cobiv.modules.database.sqlitedb.scan.scanstate import ScanState
+from cobiv.modules.database.sqlitedb.scan.blocklist import Blocklist
+from cobiv.modules.database.sqlitedb.scan.moves import MoveDetector, MOVE_WINDOW
+from cobiv.modules.database.sqlitedb.scan.remote import RemoteScanner, CONNECTIONS, WINDOW
+from cobiv.modules.database.sqlitedb.scan.sidecar import SidecarScanner, SidecarUpdate
+from cobiv.modules.database.sqlitedb.scan.throttle import IoThrottle, IDLE_DELAY, lower_io_priority
+from cobiv.modules.database.sqlitedb.scan.hashing import resolve_algorithm, DEFAULT_ALGORITHM, hash_stream
+from cobiv.modules.database.sqlitedb.scan.importer import Importer, iter_staged_files, iter_chunks, IMPORT_BATCH_SIZE
+from cobiv.modules.database.sqlitedb.scan.tagextractor import TagExtractor, read_file_tags, read_file, BLOCKED
 from cobiv.modules.database.sqlitedb.search.searchmanager import TEMP_SORT_TABLE, TEMP_PRESORT_TABLE
 
 SUPPORTED_IMAGE_FORMATS = ["jpg", "gif", "png"]
+SCANNED_IMAGE_FORMATS = ["jpg", "jpeg", "png"]
 CURRENT_SET_NAME = '_current'
+TAG_BATCH_SIZE = 1000
+FILE_KEY_TABLES = ['tag', 'core_tags', 'file_hash', 'file_phash', 'exif_tags', 'sidecar']
+""" Tables holding rows by file, deleted with their file """
+
+UpdateBatch = namedtuple('UpdateBatch', ['repo_id', 'new_files', 'to_remove', 'moves', 'modified_files',
+                                         'sidecar_updates', 'scan_state', 'scan_rows', 'removed_dirs', 'checkpoint'])
+""" Changes of a repository to write in one transaction. scan_state is None when the changes don't come from a scan,
+and checkpoint is None in the last batch of a scan """
 
 
 def is_close(a, b, rel_tol=1e-09, abs_tol=0.0):
@@ -430,6 +456,9 @@ class SqliteDb(Entity):
     conn = None
     search_manager = None
     set_manager = None
+    blocklist = None
+    throttle = None
+    update_lock = threading.RLock()
 
     def init_test_db(self, session):
 
@@ -452,7 +481,7 @@ class SqliteDb(Entity):
         c = self.conn.execute('select id,path from repository')
         for repo_key, path in c.fetchall():
             fs = open_fs(path)
-            self.session.add_filesystem(repo_key, fs)
+            self.session.add_filesystem(repo_key, fs, path)
 
     def close_db(self):
         self.conn.close()
@@ -460,6 +489,7 @@ class SqliteDb(Entity):
     def ready(self):
 
         self.get_app().register_event_observer('on_current_set_change', self.on_current_set_change)
+        self.get_app().register_event_observer('on_navigation', self.on_navigation)
 
         if not os.path.exists(self.get_app().get_user_path('thumbnails')):
             os.makedirs(self.get_app().get_user_path('thumbnails'))
@@ -485,6 +515,10 @@ class SqliteDb(Entity):
         self.session.set_action("ls-tag", self.list_tags, "viewer")
         self.session.set_action("ls-tag", self.list_tags, "browser")
         self.session.set_action("updatedb", self.updatedb)
+        self.session.set_action("import", self.import_files)
+        self.session.set_action("rm-file", self.delete_current_file)
+        self.session.set_action("rm-file-mark", self.delete_marked_files, "browser")
+        self.session.set_action("gc", self.gc)
         self.session.set_action("mark-all", self.mark_all)
         self.session.set_action("mark-invert", self.invert_marked)
         self.session.set_action("rnc", self.reenumerate_current_set_positions)
@@ -497,8 +531,12 @@ class SqliteDb(Entity):
         except sqlite3.OperationalError:
             pass
 
+        interrupted_repositories = []
         if must_initialize:
             self.create_database()
+        else:
+            self.upgrade_database()
+            interrupted_repositories = self.get_interrupted_repositories()
         with self.conn:
             self.conn.execute('create temporary table marked (file_key int, position int PRIMARY KEY)')
             self.conn.execute('create temporary table current_set as select * from set_detail where 1=2')
@@ -507,7 +545,12 @@ class SqliteDb(Entity):
         c = self.conn.execute('select id,path from repository')
         for repo_key, path in c.fetchall():
             fs = open_fs(path)
-            self.session.add_filesystem(repo_key, fs)
+            self.session.add_filesystem(repo_key, fs, path)
+
+        # resumed once the session is set up, as the update uses the same connection
+        if len(interrupted_repositories) > 0:
+            self.logger.info("resuming the update of repositories {}".format(interrupted_repositories))
+            Clock.schedule_once(lambda dt: self.updatedb(repo_ids=interrupted_repositories), 0)
 
     def create_database(self, sameThread=False):
         with self.conn:
@@ -515,6 +558,7 @@ class SqliteDb(Entity):
             script = fd.read()
             self.conn.executescript(script)
             fd.close()
+        self.upgrade_database()
 
         self.create_catalogue("default")
 
@@ -522,6 +566,14 @@ class SqliteDb(Entity):
         self.add_repository("default", repos)
         self.updatedb(sameThread=sameThread)
 
+    def upgrade_database(self):
+        """Create the tables added since the creation of the database."""
+        with self.conn:
+            fd = open(os.path.abspath(os.path.dirname(__file__)) + '/../../../resources/sql/sqlite_db_upgrade.sql')
+            script = fd.read()
+            self.conn.executescript(script)
+            fd.close()
+
     def create_catalogue(self, name):
         try:
             with self.conn:
@@ -531,216 +583,914 @@ class SqliteDb(Entity):
             return False
 
     def add_repository(self, catalogue, path_list, recursive=True):
+        repo_ids = []
         for path in path_list:
             try:
                 with self.conn:
                     c = self.conn.execute('insert into repository (catalog_key,path,recursive) values (?,?,?)',
                                           (catalogue, path, 1 if recursive else 0))
-                return c.lastrowid
+                repo_ids.append(c.lastrowid)
             except sqlite3.IntegrityError:
-                return False
+                pass
+        return repo_ids
+
+    def updatedb(self, path=None, sameThread=False, repo_ids=None):
+        """Update the catalog with the changes of the repositories.
+
+        With updatedb.skip_unchanged_dirs, the directories whose modification time didn't change are not listed. Editing
+        an image or a sidecar in place doesn't change the time of its directory, so such an edit is applied by the
+        watcher of the local repositories, or by an update of the directory given as path, which lists its whole
+        subtree, but not by a full update.
 
-    def updatedb(self, sameThread=False):
+        :param path: if given, only the directory at this path is updated, with all its subdirectories. It is either
+            the system path of a directory in a local repository, or a path like /2026/trip in the repositories.
+        """
         if sameThread:
-            self._threaded_updatedb()
+            self._threaded_updatedb(repo_ids, path)
         else:
-            threading.Thread(target=self._threaded_updatedb).start()
+            threading.Thread(target=self._threaded_updatedb, args=(repo_ids, path)).start()
 
-    def _threaded_updatedb(self):
-        self.start_progress("Initializing update...")
-        c = self.conn.execute('select id, path, recursive from repository')
-        differences = []
-        thread_max_files = 1
+    def _threaded_updatedb(self, repo_ids=None, path=None):
+        self.start_progress("Updating files...")
+        if path is None:
+            self.set_progress_max_count(max(1, self.conn.execute('select count(*) from scan_state').fetchone()[0]) + 1)
+        else:
+            self.set_progress_max_count(1)
+        self.update_repositories(repo_ids, path)
+        self.stop_progress()
 
-        rows = c.fetchall()
-        self.set_progress_max_count(len(rows))
-        for repo_id, repo_path, recursive in rows:
-            to_add, to_remove = self._update_get_diff(repo_id, repo_path, recursive)
-            differences.append((repo_id, repo_path, to_add, to_remove))
-            thread_max_files += len(to_add) * 2 + len(to_remove) + (2 if len(to_add) > 0 else 0)
-            self.tick_progress()
+    def update_repositories(self, repo_ids=None, path=None):
+        """Update repositories in the catalog.
+
+        Repositories are walked and read concurrently, one thread by repository with at most `updatedb.walkers` of them
+        at the same time, so a slow repository doesn't hold up the others. Their changes are written by the calling
+        thread only.
+
+        :param repo_ids: ids of the repositories to update, or None for all of them
+        :param path: if given, only the directory at this path is updated, see updatedb
+        """
+        rows = self.conn.execute('select id, path, recursive from repository').fetchall()
+        rows = [row for row in rows if repo_ids is None or row[0] in repo_ids]
+        roots = self._get_update_roots(rows, path)
+
+        with self.update_lock:
+            self.throttle = self.create_throttle()
+            extractor = self.create_tag_extractor()
+            batches = queue.Queue(maxsize=max(2, len(rows) * 2))
+            slots = threading.Semaphore(max(1, int(self.get_global_config_value('updatedb.walkers', 4))))
+            walkers = [threading.Thread(target=self._walk_repository,
+                                        args=(repo_id, repo_path, recursive, extractor, batches, slots,
+                                              roots[repo_id]))
+                       for repo_id, repo_path, recursive in rows if repo_id in roots]
+            running = 0
+            try:
+                for walker in walkers:
+                    walker.start()
+                    running += 1
+
+                failed_repo_ids = set()
+                while running > 0:
+                    batch = batches.get()
+                    if batch is None:
+                        running -= 1
+                    elif not self.cancel_operation and batch.repo_id not in failed_repo_ids:
+                        try:
+                            self._write_batch(batch)
+                        except Exception as e:
+                            # the following batches of the repository are dropped, to resume from the last checkpoint
+                            self.logger.error("Could not update repository {}".format(batch.repo_id))
+                            self.logger.error(e, exc_info=True)
+                            failed_repo_ids.add(batch.repo_id)
+            finally:
+                # the batches left are dropped, so that no walker stays blocked on the full queue
+                while running > 0:
+                    if batches.get() is None:
+                        running -= 1
+                for walker in walkers:
+                    walker.join()
+                extractor.close()
+                self.throttle = None
 
-        if thread_max_files > 0:
+            self.tick_progress(caption="Regenerate default set...")
+            self.set_manager.regenerate_default()
 
-            self.reset_progress("Updating files...")
-            self.set_progress_max_count(thread_max_files)
+    def _walk_repository(self, repo_id, repo_path, recursive, extractor, batches, slots, root='/'):
+        """Compare a repository with the catalog and read its new and modified files, giving the changes to write as
+        UpdateBatch in a queue, followed by None once done.
 
-            repo_fs, current_repo_id = None, None
-            for repo_id, repo_path, to_add, to_remove in differences:
-                if repo_id != current_repo_id:
-                    if current_repo_id is not None:
-                        repo_fs.close()
-                    current_repo_id = repo_id
-                    repo_fs = open_fs(repo_path)
+        Each batch is written with a checkpoint, the name of the last file handled. The state of the directories whose
+        files are all before the checkpoint is written as well, so an interrupted update resumes with the directories it
+        didn't finish. The checkpoint is removed with the last batch.
 
-                self._update_dir(repo_id, repo_fs, to_add, to_remove)
-                if len(to_add) > 0:
-                    self.update_tags(repo_id, repo_fs, to_add)
+        :param root: path of the directory to update, '/' for the whole repository
+        """
+        try:
+            with slots:
                 if self.cancel_operation:
-                    break
+                    return
+                if self.get_global_config_value('updatedb.throttle.ionice', False):
+                    lower_io_priority()
+                repo_fs = open_fs(repo_path)
+                try:
+                    scan_state = ScanState(self.conn, repo_id, root)
+                    entries = {}
+                    sidecars = {} if self.get_global_config_value('updatedb.sidecars', True) else None
+                    thumbnail_size = self.get_import_thumbnail_size(repo_path)
+                    detector = self.create_move_detector(repo_id, repo_fs)
+                    for to_add, to_remove in self._update_get_diff(repo_id, repo_fs, recursive, scan_state, entries,
+                                                                   sidecars, repo_path):
+                        checkpoint = max([name for name, entry in to_add] + to_remove)
+                        moves = []
+                        if detector is not None:
+                            to_add, to_remove, moves = detector.match(to_add, to_remove)
+                            # directories holding removals held back are saved once the removals are written
+                            first_pending = detector.first_pending()
+                            if first_pending is not None:
+                                checkpoint = min(checkpoint, first_pending)
+                        self.set_progress_max_count(self._progress_max_count + len(to_add) * 2 + len(to_remove) + 2)
+                        new_files = self._read_new_files(repo_fs, to_add, repo_path, extractor, thumbnail_size)
+                        if new_files is None:
+                            return
+                        batches.put(self._create_batch(repo_id, repo_fs, scan_state, entries, new_files, to_remove,
+                                                       moves, checkpoint, sidecars, extractor, repo_path))
+                        if self.cancel_operation:
+                            return
+
+                    to_remove = detector.flush() if detector is not None else []
+                    batches.put(self._create_batch(repo_id, repo_fs, scan_state, entries, [], to_remove, [], None,
+                                                   sidecars, extractor, repo_path))
+                finally:
+                    repo_fs.close()
+        except Exception as e:
+            self.logger.error("Could not update repository {}".format(repo_path))
+            self.logger.error(e, exc_info=True)
+        finally:
+            batches.put(None)
+
+    def _create_batch(self, repo_id, repo_fs, scan_state, entries, new_files, to_remove, moves, checkpoint,
+                      sidecars=None, extractor=None, repo_path=None):
+        """Create the batch of a chunk of differences, with the modified files, the changed sidecars and the state of
+        the directories done.
+
+        :param moves: list of (file id, new name, ScanEntry) of the moved files
+        :param entries: ScanEntry of the files of the listed directories by name, those of the directories done being
+            taken out
+        :param checkpoint: name of the last file handled, or None for the last batch of the repository
+        :param sidecars: ScanEntry of the sidecars of the listed images by image name, or None to ignore the sidecars
+        :param extractor: extractor reading the sidecars
+        """
+        paths = scan_state.get_listed_paths(checkpoint)
+        modified_files = []
+        sidecar_updates = []
+        if sidecars is not None:
+            changed = [(None, f, sidecars[f]) for f, size, modified_date, data in new_files if f in sidecars]
+            changed.extend(self._check_sidecars(repo_id, paths, entries, moves, sidecars))
+            sidecar_updates = self._read_sidecars(extractor, repo_path, repo_fs, changed)
+        if len(paths) > 0:
+            modified_files = self._read_modified_files(repo_fs, self._check_modified_files(repo_id, repo_fs, paths=paths,
+                                                                                           entries=entries))
+            done = set(paths)
+            for name in [name for name in entries if os.path.dirname(name) in done]:
+                del entries[name]
+            if sidecars is not None:
+                for name in [name for name in sidecars if os.path.dirname(name) in done]:
+                    del sidecars[name]
+        scan_rows, removed_dirs = scan_state.take(checkpoint)
+        return UpdateBatch(repo_id, new_files, to_remove, moves, modified_files, sidecar_updates, scan_state, scan_rows,
+                           removed_dirs, checkpoint)
+
+    def _check_sidecars(self, repo_id, paths, entries, moves, sidecars):
+        """Find the images of the catalog whose sidecar was added, modified or removed.
+
+        :param paths: directories whose images are checked
+        :param entries: ScanEntry of the files of the walk by name
+        :param moves: list of (file id, new name, ScanEntry) of the moved files, checked under their new name
+        :param sidecars: ScanEntry of the sidecars by image name
+        :return: list of (file id, image name, ScanEntry of the sidecar or None)
+        """
+        result = []
+        moved_ids = set()
+        for file_id, name, entry in moves:
+            moved_ids.add(file_id)
+            row = self.conn.execute('select name, size, modified from sidecar where file_key=?', (file_id,)).fetchone()
+            if self._is_sidecar_changed(row, sidecars.get(name)):
+                result.append((file_id, name, sidecars.get(name)))
+
+        for path in paths:
+            rows = self.conn.execute(
+                'select f.id,f.name,s.name,s.size,s.modified from file f inner join core_tags t on f.id=t.file_key '
+                'left join sidecar s on s.file_key=f.id where f.repo_key=? and t.path=?', (repo_id, path)).fetchall()
+            for file_id, name, sidecar_name, size, modified in rows:
+                # removed images are left to the removal
+                if file_id in moved_ids or name not in entries:
+                    continue
+                row = (sidecar_name, size, modified) if sidecar_name is not None else None
+                if self._is_sidecar_changed(row, sidecars.get(name)):
+                    result.append((file_id, name, sidecars.get(name)))
+        return result
 
-            if repo_fs is not None:
-                repo_fs.close()
+    @staticmethod
+    def _is_sidecar_changed(row, entry):
+        """Compare the (name, size, modification date) of a sidecar in the catalog with its ScanEntry."""
+        if row is None or entry is None:
+            return row is not None or entry is not None
+        name, size, modified = row
+        return name != entry.name or size != entry.size or entry.modified is None or modified is None or \
+            not is_close(float(modified), entry.modified, abs_tol=1e-05, rel_tol=0)
 
-            self.tick_progress(caption="Regenerate default set...")
-            self.set_manager.regenerate_default()
+    def _read_sidecars(self, extractor, repo_path, repo_fs, changed):
+        """Read the keywords of changed sidecars, in the workers of the extractor.
 
-        self.stop_progress()
+        :param changed: list of (file id, image name, ScanEntry of the sidecar or None)
+        :return: list of SidecarUpdate
+        """
+        to_read = [(index, sidecar.name) for index, (file_id, name, sidecar) in enumerate(changed) if sidecar is not None]
+        keywords = dict(extractor.read_sidecars(repo_path, repo_fs, to_read)) if len(to_read) > 0 else {}
+        return [SidecarUpdate(file_id, name, sidecar, keywords.get(index, []))
+                for index, (file_id, name, sidecar) in enumerate(changed)]
 
-    def _update_get_diff(self, repo_id, path, recursive):
+    @staticmethod
+    def get_system_root(repo_path):
+        """Get the system path of a local repository.
 
-        repo_fs = open_fs(path)
+        :param repo_path: url of the repository
+        :return: system path, or None if the repository is not local
+        """
+        if '://' not in repo_path:
+            return repo_path
+        parsed = parse_fs_url(repo_path)
+        return parsed.resource if parsed.protocol == 'osfs' else None
+
+    def _get_update_roots(self, rows, path):
+        """Locate the directory to update in the repositories.
 
-        if recursive:
+        A system path is looked for in the local repositories first. Any other path is a path in each repository,
+        repositories which are not recursive being left out.
+
+        :param rows: list of (id, path, recursive) of the repositories
+        :param path: path given to updatedb, or None
+        :return: path of the directory to update by repository id
+        """
+        if path is None:
+            return {row[0]: '/' for row in rows}
 
-            result = [path for path in repo_fs.walk.files(filter=['*.jpg', '*.jpeg', '*.png'])]
+        sys_path = os.path.normpath(path)
+        for repo_id, repo_path, recursive in rows:
+            sys_root = self.get_system_root(repo_path)
+            if sys_root is None or not os.path.isabs(sys_path):
+                continue
+            sys_root = os.path.abspath(sys_root)
+            if sys_path == sys_root or sys_path.startswith(sys_root.rstrip(os.sep) + os.sep):
+                root = fspath.normpath('/' + os.path.relpath(sys_path, sys_root).replace(os.sep, '/'))
+                return {repo_id: root} if root == '/' or recursive else {}
+
+        root = fspath.abspath(fspath.normpath(path.replace('\\', '/')))
+        return {repo_id: root for repo_id, repo_path, recursive in rows if root == '/' or recursive}
+
+    def find_repository(self, repository=None):
+        """Find a repository from its id, its url or the system path of a local repository.
+
+        :param repository: id, url or system path, or None for the first repository
+        :return: id of the repository, or None if not found
+        """
+        rows = self.conn.execute('select id, path from repository order by id').fetchall()
+        if repository is None:
+            return rows[0][0] if len(rows) > 0 else None
+        repository = str(repository)
+        for repo_id, repo_path in rows:
+            sys_root = self.get_system_root(repo_path)
+            if repository == str(repo_id) or repository == repo_path or sys_root is not None and \
+                    os.path.abspath(sys_root) == os.path.abspath(repository):
+                return repo_id
+        return None
+
+    def import_files(self, staging_path, repository=None, sameThread=False):
+        """Move the new images of a staging folder into a repository and add them to the catalog, see import_staging.
+
+        :param staging_path: url or system path of the staging folder
+        :param repository: id, url or system path of the repository, or None for the first repository
+        """
+        repo_id = self.find_repository(repository)
+        if repo_id is None:
+            self.notify("Unknown repository {}".format(repository), is_error=True)
+            return
+        if sameThread:
+            self._threaded_import(staging_path, repo_id)
         else:
-            result = [f for f in repo_fs.listdir('/') if
-                      repo_fs.getinfo(f, namespaces=['details']).is_file and f.split('.')[
-                          -1] in SUPPORTED_IMAGE_FORMATS]
+            threading.Thread(target=self._threaded_import, args=(staging_path, repo_id)).start()
 
-        repo_fs.close()
+    def _threaded_import(self, staging_path, repo_id):
+        self.start_progress("Importing files...")
+        self.set_progress_max_count(1)
+        result = self.import_staging(staging_path, repo_id)
+        self.stop_progress()
+        if result is not None:
+            Clock.schedule_once(lambda dt: self.notify("{} files imported, {} duplicates, {} failed".format(
+                *[len(names) for names in result])), 0)
+
+    def import_staging(self, staging_path, repo_id):
+        """Import the images of a staging folder into a repository in one pass, instead of copying them and running
+        updatedb. The files are hashed and checked against the digests of the catalog as they come, the new ones being
+        moved into the repository and added to the catalog by chunks of IMPORT_BATCH_SIZE. Duplicates are left in the
+        staging folder, unless `import.delete_duplicates` is set.
+
+        :param staging_path: url or system path of the staging folder
+        :param repo_id: id of the repository
+        :return: (names of the imported files, paths of the duplicates, paths of the failed files), or None if the
+            repository doesn't exist
+        """
+        row = self.conn.execute('select path from repository where id=?', (repo_id,)).fetchone()
+        if row is None:
+            return None
+        repo_path = row[0]
 
-        c = self.conn.execute('select name from file where repo_key=?', (repo_id,))
-        existing = [n['name'] for n in c.fetchall()]
+        imported, duplicates, failed = [], [], []
+        with self.update_lock:
+            staging_fs = open_fs(staging_path)
+            repo_fs = open_fs(repo_path)
+            extractor = self.create_tag_extractor()
+            try:
+                importer = Importer(self.conn, staging_fs, repo_fs, self.get_hash_algorithm(),
+                                    blocklist=self.get_blocklist(),
+                                    delete_duplicates=self.get_global_config_value('import.delete_duplicates', False))
+                for names in iter_chunks(iter_staged_files(staging_fs, self.is_scanned_image), IMPORT_BATCH_SIZE):
+                    if self.cancel_operation:
+                        break
+                    self.set_progress_max_count(self._progress_max_count + len(names) * 3)
+                    moved, chunk_duplicates, chunk_failed = importer.import_files(names)
+                    self.tick_progress(size=len(names))
+                    duplicates.extend(chunk_duplicates)
+                    failed.extend(chunk_failed)
+                    # the moved files are in the repository from now on, updatedb adds them if this is interrupted
+                    if not self._update_dir(repo_id, repo_fs, moved, [], repo_path=repo_path, extractor=extractor,
+                                            digests=importer.destination_digests):
+                        break
+                    imported.extend(moved)
+            finally:
+                extractor.close()
+                repo_fs.close()
+                staging_fs.close()
 
-        new_files = set(result) - set(existing)
-        removed_files = set(existing) - set(result)
-        return new_files, removed_files
+            if len(imported) > 0:
+                self.set_manager.regenerate_default()
+        return imported, duplicates, failed
 
-    def _update_dir(self, repo_id, repo_fs, to_add, to_rem):
-        with self.conn:
-            c = self.conn.cursor()
+    def get_interrupted_repositories(self):
+        """Get the ids of the repositories whose last update didn't complete."""
+        return [row[0] for row in self.conn.execute('select repo_key from update_checkpoint').fetchall()]
 
-            # remove old ones
-            if len(to_rem) > 0:
-                query_to_rem = [(n,) for n in to_rem]
-                self.conn.executemany('delete from file where name=?', query_to_rem)
-                self.tick_progress()
+    def update_files(self, repo_id, to_add=(), to_remove=(), to_modify=()):
+        """Apply the changes of some files of a repository to the catalog, without scanning the repository.
 
-            # add new ones
-            if len(to_add) > 0:
-                query_to_add = []
-                query_tag_to_add = []
-                for f in to_add:
-                    if self.cancel_operation:
-                        return
-                    query_to_add.append((repo_id, f, 1, "file"))
-                    file_info = repo_fs.getdetails(f)
-                    modified_date = time.mktime(file_info.modified.timetuple())
-                    query_tag_to_add.append(
-                        (repo_id, f, file_info.size, modified_date, os.path.splitext(f)[1][1:],
-                         os.path.dirname(f), os.path.splitext(os.path.basename(f))[0]))
+        :param repo_id: id of the repository
+        :param to_add: names of the new files
+        :param to_remove: names of the removed files
+        :param to_modify: names of the modified files. Files not yet in the catalog are added.
+        """
+        row = self.conn.execute('select path from repository where id=?', (repo_id,)).fetchone()
+        if row is None:
+            return
+        repo_path = row[0]
+
+        with self.update_lock:
+            existing = {}
+            for name in set(to_add) | set(to_remove) | set(to_modify):
+                file_row = self.conn.execute('select id from file where repo_key=? and name=?',
+                                             (repo_id, name)).fetchone()
+                if file_row is not None:
+                    existing[name] = file_row[0]
+
+            repo_fs = open_fs(repo_path)
+            extractor = self.create_tag_extractor()
+            try:
+                changed = [name for name in set(to_add) | set(to_modify) if repo_fs.isfile(name)]
+                new_files = [name for name in changed if name not in existing]
+                removed_files = [name for name in set(to_remove) if name in existing and not repo_fs.exists(name)]
+
+                self._update_dir(repo_id, repo_fs, new_files, removed_files, repo_path=repo_path, extractor=extractor)
+                self._update_modified_files(repo_fs, [(existing[name], name) for name in changed if name in existing])
+            finally:
+                extractor.close()
+                repo_fs.close()
 
-                    self.tick_progress()
+            if len(new_files) > 0 or len(removed_files) > 0:
+                self.set_manager.regenerate_default()
 
-                c.executemany('insert into file(repo_key, name,searchable,file_type) values(?,?,?,?)', query_to_add)
+    def update_sidecars(self, repo_id, names):
+        """Refresh the keywords of the images whose sidecar changed, without reading the images again.
 
-                c.execute(
-                    'create temporary table t1(repo int,file text,size int,cdate float,ext text, path text, filename text)')
+        :param repo_id: id of the repository
+        :param names: names of the added, modified or removed sidecars
+        """
+        row = self.conn.execute('select path from repository where id=?', (repo_id,)).fetchone()
+        if row is None:
+            return
 
-                c.executemany('insert into t1(repo,file,size,cdate,ext,path, filename) values(?,?,?,?,?,?,?)',
-                              query_tag_to_add)
-                c.execute(
-                    'insert into core_tags (file_key, path, size, file_date, ext, filename) select f.rowid,t.path,t.size,t.cdate,t.ext,t.filename from file f,t1 t where f.repo_key=t.repo and f.name=t.file')
+        with self.update_lock:
+            repo_fs = open_fs(row[0])
+            try:
+                sidecars, entries = {}, {}
+                paths = sorted(set(os.path.dirname(name) for name in names))
+                scanner = SidecarScanner(create_scanner(repo_fs), sidecars)
+                for path in paths:
+                    try:
+                        entries.update((fspath.join(path, e.name), e) for e in scanner.scandir(path) if not e.is_dir)
+                    except ResourceNotFound:
+                        continue
+                changed = self._check_sidecars(repo_id, paths, entries, [], sidecars)
+                updates = self._read_sidecars(TagExtractor([]), None, repo_fs, changed)
+                with self.conn:
+                    self._write_sidecars(self.conn.cursor(), updates, {})
+            finally:
+                repo_fs.close()
 
-                c.execute('drop table t1')
-                self.tick_progress()
+    def _update_get_diff(self, repo_id, repo_fs, recursive, scan_state, entries=None, sidecars=None, repo_path=None):
+        """Compare a repository with the catalog, streaming the differences as they are found.
 
-                name_mapping={}
-                for file_key,name in c.execute('select id,name from file where repo_key=?', (repo_id, )).fetchall():
-                    name_mapping[name]=file_key
+        :param entries: if given, dictionary filled with the ScanEntry of each file of the walk by name
+        :param sidecars: if given, dictionary filled with the ScanEntry of the XMP sidecar of each image of the walk by
+            image name, found in the same listing as the image
+        :param repo_path: if given, url of the repository, to list remote repositories on several connections
+        :return: generator of (to_add, to_remove) batches, see merge_diff
+        """
+        # a targeted update lists all the directories of its subtree
+        skip_unchanged = self.get_global_config_value('updatedb.skip_unchanged_dirs', True) and scan_state.root == '/'
+        remote_scanner = None
+        if repo_path is not None and repo_fs.getmeta().get('network', False):
+            remote_scanner = self.create_remote_scanner(repo_path, scan_state, recursive, skip_unchanged)
+        scanner = remote_scanner if remote_scanner is not None else create_scanner(repo_fs)
+        if sidecars is not None:
+            scanner = SidecarScanner(scanner, sidecars)
+        walk = scan_state.walk(scanner, recursive, file_filter=self.is_scanned_image, force=not skip_unchanged)
+        if entries is not None:
+            walk = self._keep_entries(walk, entries)
+        try:
+            yield from merge_diff(walk, iter_catalog_names(self.conn, repo_id, root=scan_state.root),
+                                  on_directory=lambda path: self.tick_progress())
+        finally:
+            if remote_scanner is not None:
+                remote_scanner.close()
+
+    def create_remote_scanner(self, repo_path, scan_state, recursive, skip_unchanged):
+        """Create the scanner of a remote repository, listing directories ahead of the walk on
+        `updatedb.remote.connections` connections, at most `updatedb.remote.window` directories ahead."""
+        return RemoteScanner(lambda: open_fs(repo_path), root=scan_state.root, recursive=recursive,
+                             saved_dirs=scan_state.get_saved_dirs() if skip_unchanged else None,
+                             connections=int(self.get_global_config_value('updatedb.remote.connections', CONNECTIONS)),
+                             window=int(self.get_global_config_value('updatedb.remote.window', WINDOW)))
+
+    @staticmethod
+    def _keep_entries(walk, entries):
+        for path, entry in walk:
+            if entry is not None and not entry.is_dir:
+                entries[path] = entry
+            yield path, entry
+
+    @staticmethod
+    def is_scanned_image(name):
+        return name.split('.')[-1] in SCANNED_IMAGE_FORMATS
+
+    def create_tag_extractor(self):
+        """Create the extractor used by updatedb to read the tags of new files, configured with `updatedb.workers`
+        worker processes and at most `updatedb.window` files in flight."""
+        workers = int(self.get_global_config_value('updatedb.workers', os.cpu_count() or 1))
+        window = int(self.get_global_config_value('updatedb.window', workers * 4))
+        return TagExtractor(self.get_app().lookups("TagReader"), workers=workers, window=window,
+                            hash_algorithm=self.get_hash_algorithm(),
+                            perceptual_algorithm=self.get_perceptual_algorithm(), blocked=self.get_blocked_filter(),
+                            ionice=self.get_global_config_value('updatedb.throttle.ionice', False))
+
+    def create_throttle(self):
+        """Create the throttle of the reads of updatedb, configured with `updatedb.throttle.bytes_per_second` and
+        `updatedb.throttle.files_per_second`. The scan pauses while the user navigates, until no navigation happened
+        for `updatedb.throttle.idle_delay` seconds."""
+        return IoThrottle(bytes_per_second=self.get_global_config_value('updatedb.throttle.bytes_per_second', None),
+                          files_per_second=self.get_global_config_value('updatedb.throttle.files_per_second', None),
+                          idle_delay=float(self.get_global_config_value('updatedb.throttle.idle_delay', IDLE_DELAY)),
+                          cancelled=lambda: self.cancel_operation)
+
+    def on_navigation(self, *args):
+        throttle = self.throttle
+        if throttle is not None:
+            throttle.notify_activity()
+
+    def _throttle(self, files=1, size=0):
+        throttle = self.throttle
+        if throttle is not None:
+            throttle.consume(files, size)
+
+    def create_move_detector(self, repo_id, repo_fs):
+        """Create the detector pairing the removed and added files of a walk, or None if `updatedb.detect_moves` is
+        disabled. At most `updatedb.move_window` removals are held back while waiting for the file they were moved to."""
+        if not self.get_global_config_value('updatedb.detect_moves', True):
+            return None
+        return MoveDetector(self.conn, repo_id, repo_fs, hash_algorithm=self.get_hash_algorithm(),
+                            window=int(self.get_global_config_value('updatedb.move_window', MOVE_WINDOW)))
 
-                tags_to_add = []
-                invalid_images=[]
-                for f in to_add:
-                    id = name_mapping[f]
-                    lines = self.read_tags(id, f, repo_fs)
-                    if lines==-1:
-                        invalid_images.append((id,))
-                    elif len(lines) > 0:
-                        tags_to_add.extend(lines)
-                    self.tick_progress()
-
-                if len(invalid_images) > 0:
-                    c.executemany('delete from file where id=?', invalid_images)
+    def get_hash_algorithm(self):
+        """Get the algorithm hashing the content of the files, configured with `updatedb.hash`."""
+        return resolve_algorithm(self.get_global_config_value('updatedb.hash', DEFAULT_ALGORITHM))
 
-                if len(tags_to_add) > 0:
-                    c.executemany('insert into tag values (?,?,?,?,?)', tags_to_add)
-                    self.tick_progress()
+    def get_perceptual_algorithm(self):
+        """Get the perceptual hash algorithm of the images, configured with `updatedb.perceptual_hash`."""
+        algorithm = self.get_global_config_value('updatedb.perceptual_hash', 'phash')
+        return algorithm if algorithm in PERCEPTUAL_ALGORITHMS else None
 
-    def update_tags(self, repo_id, repo_fs, to_ignore=[]):
-        with self.conn:
-            c = self.conn.cursor()
+    def get_import_thumbnail_size(self, repo_path):
+        """Get the size of the thumbnails created while reading the new files of a repository, so that the files are
+        read only once. `updatedb.thumbnails` is 'remote' to create them for the repositories which are not local,
+        'all' for all repositories, and 'none' to leave them to the thumbnail loader.
+
+        :param repo_path: url of the repository
+        :return: size of the thumbnails, or None
+        """
+        mode = self.get_global_config_value('updatedb.thumbnails', 'none')
+        if mode == 'all' or mode == 'remote' and self.get_system_root(repo_path) is None:
+            return int(self.get_global_config_value('thumbloader.image_size', 120))
+        return None
+
+    def get_blocklist(self):
+        """Get the blocklist of the digests of deleted files, or None if the content of the files is not hashed."""
+        algorithm = self.get_hash_algorithm()
+        if algorithm is None:
+            return None
+        if self.blocklist is None or self.blocklist.algorithm != algorithm:
+            self.blocklist = Blocklist(self.conn, algorithm)
+        return self.blocklist
 
-            modified_file_ids = self._check_modified_files(repo_id, repo_fs, to_ignore=to_ignore)
-            for file_id, filename in modified_file_ids:
-                file_info = repo_fs.getdetails(filename)
+    def get_blocked_filter(self):
+        blocklist = self.get_blocklist()
+        return blocklist.get_filter() if blocklist is not None else None
 
-                c.execute('update core_tags set size=?,file_date=?,ext=?,path=?,filename=? where file_key=?',
-                          (file_info.size, file_info.modified, os.path.splitext(filename)[1][1:],
-                           os.path.dirname(filename), os.path.splitext(os.path.basename(filename))[0], file_id))
+    def _update_dir(self, repo_id, repo_fs, to_add, to_rem, repo_path=None, extractor=None, digests=None):
+        """Apply a chunk of differences to the catalog, in a single transaction.
 
-                tags_to_add = self.read_tags(file_id, filename, repo_fs=repo_fs)
+        :param digests: digests of the new files already known by name, or None
+        :return: False if the operation was cancelled before the chunk was committed
+        """
+        if extractor is None:
+            extractor = TagExtractor(self.get_app().lookups("TagReader"), hash_algorithm=self.get_hash_algorithm(),
+                                     perceptual_algorithm=self.get_perceptual_algorithm(),
+                                     blocked=self.get_blocked_filter())
+
+        new_files = self._read_new_files(repo_fs, [(name, None) for name in to_add], repo_path, extractor,
+                                         self.get_import_thumbnail_size(repo_path) if repo_path is not None else None,
+                                         digests)
+        if new_files is None:
+            return False
+        self._write_batch(UpdateBatch(repo_id, new_files, to_rem, [], [], [], None, [], [], None))
+        return True
 
-                c.executemany('update tag set value=?,type=? where file_key=? and category=0 and kind=?',
-                              [(tag[4], tag[3], tag[0], tag[2]) for tag in tags_to_add if tag[1] == 0])
-                c.executemany('insert or ignore into tag values (?,?,?,?,?)',
-                              [tag for tag in tags_to_add if tag[1] == 1])
+    def _read_new_files(self, repo_fs, to_add, repo_path, extractor, thumbnail_size=None, digests=None):
+        """Read the details and the data of new files, before anything is written so that readers of the catalog are
+        not blocked meanwhile and an interrupted chunk leaves the catalog untouched.
 
-                self.get_app().fire_event('on_file_content_change', file_id)
+        Files whose content was deleted from Cobiv before are skipped. As the extractor only checks the Bloom filter
+        of the blocklist, a file it stopped at is read again if the blocklist doesn't confirm the digest.
 
-    def _check_modified_files(self, repo_id, repo_fs, to_ignore=[]):
-        result = []
+        :param to_add: list of (name, ScanEntry), the details of the files being read again when the entry is None
+        :param thumbnail_size: size of the thumbnails created while reading the files, or None
+        :param digests: digests of the files already known by name, which are not computed again, or None
+        :return: list of (name, size, modified date, FileData) of the valid images, or None if the operation was
+            cancelled
+        """
+        data_by_index = {}
+        for index, data in extractor.extract(repo_path, repo_fs, [(index, name) for index, (name, entry) in
+                                                                  enumerate(to_add)], thumbnail_size=thumbnail_size,
+                                              digests=digests):
+            if self.cancel_operation:
+                return None
+            if data.rows == BLOCKED:
+                if self.get_blocklist().contains(data.digest):
+                    self.logger.info("skipping deleted file {}".format(to_add[index][0]))
+                    data = None
+                else:
+                    data = read_file(index, to_add[index][0], repo_fs, extractor.readers, extractor.hash_algorithm,
+                                     extractor.perceptual_algorithm, thumbnail_size=thumbnail_size)
+            if data is not None and data.rows != -1:
+                data_by_index[index] = data
+            entry = to_add[index][1]
+            self._throttle(size=entry.size if entry is not None else 0)
+            self.tick_progress()
+
+        new_files = []
+        for index in sorted(data_by_index):
+            f, entry = to_add[index]
+            if entry is None:
+                file_info = repo_fs.getdetails(f)
+                entry = ScanEntry(os.path.basename(f), False, file_info.size, to_file_date(file_info.modified))
+            new_files.append((f, entry.size, entry.modified, data_by_index[index]))
+            self.tick_progress()
+        return new_files
+
+    def _write_batch(self, batch):
+        """Write an UpdateBatch in a single transaction. Thumbnails created with the new files are written once the
+        transaction is committed, as their names come from the ids of the files."""
+        hash_algorithm = self.get_hash_algorithm()
+        perceptual_algorithm = self.get_perceptual_algorithm()
+        thumbnails = []
+        removed_ids = []
+        new_ids = {}
 
         with self.conn:
-            c = self.conn.execute(
-                'select f.id,f.name,t.file_date,t.size from file f,core_tags t where repo_key=? and f.id=t.file_key order by f.id',
-                (repo_id,))
+            c = self.conn.cursor()
 
-            for file_id, filename, file_date, size in c.fetchall():
-                if file_id in to_ignore:
-                    continue
+            # remove old ones
+            if len(batch.to_remove) > 0:
+                for i in range(0, len(batch.to_remove), 500):
+                    names = batch.to_remove[i:i + 500]
+                    removed_ids.extend(row[0] for row in c.execute(
+                        'select id from file where repo_key=? and name in (%s)' % ','.join('?' * len(names)),
+                        [batch.repo_id] + names).fetchall())
+                self._delete_file_rows(c, removed_ids)
+                self.tick_progress()
+
+            # moved files keep their id, so their tags, sets and thumbnail
+            for file_id, f, entry in batch.moves:
+                c.execute('update file set name=? where id=?', (f, file_id))
+                c.execute('update core_tags set path=?,size=?,file_date=?,ext=?,filename=? where file_key=?',
+                          (os.path.dirname(f), entry.size, entry.modified, os.path.splitext(f)[1][1:],
+                           os.path.splitext(os.path.basename(f))[0], file_id))
+
+            # add new ones, keeping the id given to each of them
+            if len(batch.new_files) > 0:
+                query_tag_to_add = []
+                query_hash_to_add = []
+                query_phash_to_add = []
+                tags_to_add = []
+                for f, size, modified_date, data in batch.new_files:
+                    c.execute('insert into file(repo_key, name,searchable,file_type) values(?,?,?,?)',
+                              (batch.repo_id, f, 1, "file"))
+                    file_key = c.lastrowid
+                    new_ids[f] = file_key
+                    query_tag_to_add.append((file_key, os.path.dirname(f), size, modified_date,
+                                             os.path.splitext(f)[1][1:], os.path.splitext(os.path.basename(f))[0]))
+                    tags_to_add.extend((file_key,) + tuple(line[1:]) for line in data.rows)
+                    if data.digest is not None:
+                        query_hash_to_add.append((file_key, hash_algorithm, data.digest))
+                    if data.perceptual_hash is not None:
+                        query_phash_to_add.append((file_key, perceptual_algorithm, data.perceptual_hash))
+                    if data.thumbnail is not None:
+                        thumbnails.append((file_key, data.thumbnail))
+                    self._write_table_rows(c, file_key, data.table_rows)
+                    if len(tags_to_add) >= TAG_BATCH_SIZE:
+                        c.executemany('insert into tag values (?,?,?,?,?)', tags_to_add)
+                        tags_to_add = []
+
+                c.executemany('insert into core_tags (file_key, path, size, file_date, ext, filename) values (?,?,?,?,?,?)',
+                              query_tag_to_add)
+                c.executemany('insert into file_hash (file_key, algorithm, digest) values (?,?,?)', query_hash_to_add)
+                c.executemany('insert into file_phash (file_key, algorithm, value) values (?,?,?)', query_phash_to_add)
+                if len(tags_to_add) > 0:
+                    c.executemany('insert into tag values (?,?,?,?,?)', tags_to_add)
+                self.tick_progress()
 
-                file_info = repo_fs.getdetails(filename)
+            self._write_modified_files(c, batch.modified_files)
+            self._write_sidecars(c, batch.sidecar_updates, new_ids)
+
+            if batch.scan_state is not None:
+                batch.scan_state.write(batch.scan_rows, batch.removed_dirs)
+                # an interrupted targeted update doesn't need to be resumed, and mustn't clear the checkpoint of an
+                # interrupted update of the whole repository
+                if batch.scan_state.root == '/':
+                    if batch.checkpoint is not None:
+                        c.execute('insert or replace into update_checkpoint (repo_key, name) values (?,?)',
+                                  (batch.repo_id, batch.checkpoint))
+                    else:
+                        c.execute('delete from update_checkpoint where repo_key=?', (batch.repo_id,))
+
+        if len(removed_ids) > 0:
+            self.get_app().fire_event('on_file_content_change', *removed_ids)
+        if len(thumbnails) > 0:
+            self._write_thumbnails(thumbnails)
+
+    def _delete_file_rows(self, c, file_ids):
+        """Delete files from the catalog with all the rows referring to them, in the current transaction. The sets
+        holding some of the files are renumbered.
+
+        :param c: cursor of the transaction
+        :param file_ids: ids of the files
+        :return: number of rows deleted
+        """
+        c.execute('create temporary table if not exists removed_file (file_key integer primary key)')
+        c.execute('delete from removed_file')
+        c.executemany('insert or ignore into removed_file (file_key) values (?)', [(file_id,) for file_id in file_ids])
+
+        count = 0
+        for table in FILE_KEY_TABLES:
+            count += c.execute('delete from %s where file_key in (select file_key from removed_file)' % table).rowcount
+
+        head_keys = [row[0] for row in c.execute(
+            'select distinct set_head_key from set_detail where file_key in (select file_key from removed_file)')]
+        count += c.execute('delete from set_detail where file_key in (select file_key from removed_file)').rowcount
+        self._reenumerate_sets(c, head_keys)
+
+        count += c.execute('delete from file_map where parent_key in (select file_key from removed_file) or '
+                           'child_key in (select file_key from removed_file)').rowcount
+        count += c.execute('delete from file where id in (select file_key from removed_file)').rowcount
+        c.execute('delete from removed_file')
+        return count
+
+    @staticmethod
+    def _write_sidecars(c, sidecar_updates, new_ids):
+        """Replace the keywords of the changed sidecars in the tags of their image, in the current transaction. The tags
+        are category 1 tags, like those read from the images, and only the keywords of the previous version of the
+        sidecar are removed. A keyword already in the tags of the image, from its own metadata, is not added twice, and
+        only the keywords added by the sidecar are kept in its row, so that the tags of the image itself stay when the
+        sidecar drops them.
+
+        :param c: cursor of the transaction
+        :param sidecar_updates: list of SidecarUpdate
+        :param new_ids: ids of the new images by name
+        """
+        updates = [(update.file_id if update.file_id is not None else new_ids.get(update.name), update)
+                   for update in sidecar_updates]
+        updates = [(file_id, update) for file_id, update in updates if file_id is not None]
+        if len(updates) == 0:
+            return
 
-                modified_date = time.mktime(file_info.modified.timetuple())
+        file_ids = [file_id for file_id, update in updates]
+        previous = {}
+        for i in range(0, len(file_ids), 500):
+            chunk = file_ids[i:i + 500]
+            previous.update((row[0], row[1]) for row in c.execute(
+                'select file_key, keywords from sidecar where file_key in (%s)' % ','.join('?' * len(chunk)), chunk))
+
+        tags_to_remove = []
+        for file_id, update in updates:
+            old_keywords = previous.get(file_id).split('\n') if previous.get(file_id) else []
+            tags_to_remove.extend((file_id, keyword) for keyword in set(old_keywords))
+        c.executemany("delete from tag where file_key=? and category=1 and kind='tag' and value=?", tags_to_remove)
+
+        rows = []
+        for file_id, update in updates:
+            added = []
+            for keyword in update.keywords:
+                if c.execute("select 1 from tag where file_key=? and category=1 and kind='tag' and value=? limit 1",
+                             (file_id, keyword)).fetchone() is None:
+                    c.execute("insert into tag values (?,1,'tag',0,?)", (file_id, keyword))
+                    added.append(keyword)
+            if update.sidecar is not None:
+                rows.append((file_id, update.sidecar.name, update.sidecar.size, update.sidecar.modified,
+                             '\n'.join(added)))
+
+        c.executemany('delete from sidecar where file_key=?', [(file_id,) for file_id in file_ids])
+        c.executemany('insert into sidecar (file_key, name, size, modified, keywords) values (?,?,?,?,?)', rows)
+
+    @staticmethod
+    def _write_table_rows(c, file_key, table_rows):
+        """Write the values read by the readers having their own table, in the current transaction.
+
+        :param c: cursor of the transaction
+        :param file_key: id of the file
+        :param table_rows: list of (table name, values by column)
+        """
+        for tablename, values in table_rows:
+            fields = sorted(values)
+            c.execute('insert or replace into %s (file_key,%s) values (?%s)' % (tablename, ','.join(fields),
+                                                                                ',?' * len(fields)),
+                      [file_key] + [values[field] for field in fields])
+
+    @staticmethod
+    def _reenumerate_sets(c, head_keys):
+        """Renumber the positions of saved sets from 0, in the current transaction.
+
+        :param c: cursor of the transaction
+        :param head_keys: ids of the sets
+        """
+        for head_key in head_keys:
+            c.execute('create temporary table renum_set as select rowid fkey from set_detail where set_head_key=? '
+                      'order by position', (head_key,))
+            c.execute('create unique index renum_set_idx on renum_set(fkey)')
+            # through negative positions, as the positions are unique in a set
+            c.execute('update set_detail set position=(select -r.rowid from renum_set r where r.fkey=set_detail.rowid) '
+                      'where set_head_key=?', (head_key,))
+            c.execute('update set_detail set position=-position-1 where set_head_key=?', (head_key,))
+            c.execute('drop table renum_set')
+
+    def _write_thumbnails(self, thumbnails):
+        """Write the thumbnails of new files where the thumbnail loader looks for them.
+
+        :param thumbnails: list of (file id, PNG data)
+        """
+        thumb_loader = self.lookup('thumbloader', 'Entity')
+        if thumb_loader is None or thumb_loader.thumb_path is None:
+            return
+        for file_id, data in thumbnails:
+            filename = thumb_loader.get_fullpath_from_file_id(file_id)
+            try:
+                with open(filename + '.tmp', 'wb') as fd:
+                    fd.write(data)
+                os.replace(filename + '.tmp', filename)
+            except OSError as e:
+                self.logger.warning("Could not write thumbnail {}: {}".format(filename, e))
+
+    def update_tags(self, repo_id, repo_fs, to_ignore=[], paths=None):
+        modified_file_ids = self._check_modified_files(repo_id, repo_fs, to_ignore=to_ignore, paths=paths)
+        self._update_modified_files(repo_fs, modified_file_ids)
+
+    def _update_modified_files(self, repo_fs, modified_file_ids):
+        modified_files = self._read_modified_files(repo_fs, modified_file_ids)
+        with self.conn:
+            self._write_modified_files(self.conn.cursor(), modified_files)
 
-                if int(size) != file_info.size or not is_close(float(file_date),
-                                                               modified_date,
-                                                               abs_tol=1e-05, rel_tol=0):
-                    result.append((file_id, filename))
+    def _read_modified_files(self, repo_fs, modified_file_ids):
+        """Read the details and the data of modified files.
 
+        :param modified_file_ids: list of (file id, name)
+        :return: list of (file id, name, details, FileData) of the valid images
+        """
+        readers = self.get_app().lookups("TagReader")
+        hash_algorithm = self.get_hash_algorithm()
+        perceptual_algorithm = self.get_perceptual_algorithm()
+
+        result = []
+        for file_id, filename in modified_file_ids:
+            file_info = repo_fs.getdetails(filename)
+            data = read_file(file_id, filename, repo_fs, readers, hash_algorithm, perceptual_algorithm)
+            result.append((file_id, filename, file_info, data))
+            self._throttle(size=file_info.size)
         return result
 
-    def read_tags(self, node_id, name, repo_fs):
-        to_add = []
+    def _write_modified_files(self, c, modified_files):
+        hash_algorithm = self.get_hash_algorithm()
+        perceptual_algorithm = self.get_perceptual_algorithm()
+        reader_tables = set(reader.tablename for reader in self.get_app().lookups("TagReader")
+                            if reader.tablename is not None)
+        for file_id, filename, file_info, data in modified_files:
+            c.execute('update core_tags set size=?,file_date=?,ext=?,path=?,filename=? where file_key=?',
+                      (file_info.size, to_file_date(file_info.modified), os.path.splitext(filename)[1][1:],
+                       os.path.dirname(filename), os.path.splitext(os.path.basename(filename))[0], file_id))
+
+            tags_to_add = data.rows
+            if tags_to_add == -1:
+                continue
+
+            if data.digest is not None:
+                c.execute('insert or replace into file_hash (file_key, algorithm, digest) values (?,?,?)',
+                          (file_id, hash_algorithm, data.digest))
+            if data.perceptual_hash is not None:
+                c.execute('insert or replace into file_phash (file_key, algorithm, value) values (?,?,?)',
+                          (file_id, perceptual_algorithm, data.perceptual_hash))
+
+            c.executemany('update tag set value=?,type=? where file_key=? and category=0 and kind=?',
+                          [(tag[4], tag[3], tag[0], tag[2]) for tag in tags_to_add if tag[1] == 0])
+            c.executemany('insert or ignore into tag values (?,?,?,?,?)',
+                          [tag for tag in tags_to_add if tag[1] == 1])
+            for tablename in reader_tables:
+                c.execute('delete from %s where file_key=?' % tablename, (file_id,))
+            self._write_table_rows(c, file_id, data.table_rows)
+
+            self.get_app().fire_event('on_file_content_change', file_id)
+
+    def _check_modified_files(self, repo_id, repo_fs, to_ignore=[], paths=None, entries=None):
+        """Find the files of the catalog whose size or modification date changed.
+
+        :param paths: if given, only the files in these directories
+        :param entries: ScanEntry of the files by name, read from the walk, or None to get the details of each file
+        :return: list of (file id, name)
+        """
+        result = []
 
-        data = repo_fs.getbytes(name)
-        try:
-            img = Image.open(io.BytesIO(data))
-
-            to_add.append((node_id, 0, 'width', 1, str(img.size[0])))
-            to_add.append((node_id, 0, 'height', 1, str(img.size[1])))
-            to_add.append((node_id, 0, 'format', 0, img.format))
-
-            if img.info:
-                for i, v in img.info.items():
-                    if i == "tags":
-                        tag_list = v.split(",")
-                        for tag in tag_list:
-                            to_add.append((node_id, 1, 'tag', 0, tag.strip()))
-        except OSError as e:
-            self.logger.error("Could not open file {}!".format(name))
-            self.logger.error(e, exc_info=True)
-            return -1
-        except:
-            pass
+        if paths is None:
+            rows = self.conn.execute(
+                'select f.id,f.name,t.file_date,t.size from file f,core_tags t where repo_key=? and f.id=t.file_key order by f.id',
+                (repo_id,)).fetchall()
+        else:
+            rows = []
+            for path in paths:
+                rows.extend(self.conn.execute(
+                    'select f.id,f.name,t.file_date,t.size from file f,core_tags t where repo_key=? and f.id=t.file_key and t.path=? order by f.id',
+                    (repo_id, path)).fetchall())
+
+        for file_id, filename, file_date, size in rows:
+            if file_id in to_ignore:
+                continue
+
+            if entries is not None:
+                # files of the listed directories missing from the walk are removed, in a batch not written yet
+                entry = entries.get(filename)
+                if entry is None:
+                    continue
+            else:
+                try:
+                    file_info = repo_fs.getdetails(filename)
+                except ResourceNotFound:
+                    # removed, in a batch not written yet
+                    continue
+                entry = ScanEntry(os.path.basename(filename), False, file_info.size, to_file_date(file_info.modified))
 
-        for reader in self.get_app().lookups("TagReader"):
-            reader.read_file_tags(node_id, data, to_add)
+            if int(size) != entry.size or not is_close(float(file_date), entry.modified, abs_tol=1e-05, rel_tol=0):
+                result.append((file_id, filename))
 
-        return to_add
+        return result
+
+    def read_tags(self, node_id, name, repo_fs):
+        row = self.conn.execute('select repo_key from file where id=?', (node_id,)).fetchone()
+        if row is not None:
+            # a file read ahead or shown lately is read from memory
+            repo_fs = self.session.get_cached_filesystem(row[0], store=False, filesystem=repo_fs)
+        return read_file_tags(node_id, name, repo_fs, self.get_app().lookups("TagReader"))
 
     def search_tag(self, *args):
         self.session.cursor.mark_dirty()
@@ -780,6 +1530,145 @@ class SqliteDb(Entity):
         text = '\n'.join([value for kind, value in tags[1]])
         App.get_running_app().root.notify(text)
 
+    def delete_files(self, file_ids):
+        """Delete files from their repositories and from the catalog. The digests of their content are added to the
+        blocklist, so that the files are not imported again if they reappear.
+
+        :param file_ids: ids of the files to delete
+        :return: ids of the deleted files
+        """
+        blocklist = self.get_blocklist()
+        deleted = []
+        for file_id in file_ids:
+            row = self.conn.execute('select repo_key, name from file where id=?', (file_id,)).fetchone()
+            if row is None:
+                continue
+            repo_key, name = row
+            repo_fs = self.session.get_filesystem(repo_key)
+            digest = None
+            try:
+                if blocklist is not None:
+                    digest_row = self.conn.execute('select digest from file_hash where file_key=? and algorithm=?',
+                                                   (file_id, blocklist.algorithm)).fetchone()
+                    if digest_row is not None:
+                        digest = digest_row[0]
+                    else:
+                        with repo_fs.openbin(name) as stream:
+                            digest = hash_stream(stream, blocklist.algorithm)
+                repo_fs.remove(name)
+            except ResourceNotFound:
+                pass
+            except Exception as e:
+                self.logger.error("Could not delete file {}: {}".format(name, e))
+                continue
+            deleted.append((file_id, name, digest))
+
+        ids = [(file_id,) for file_id, name, digest in deleted]
+        with self.conn:
+            c = self.conn.cursor()
+            for file_id, name, digest in deleted:
+                if digest is not None:
+                    blocklist.add(c, digest, name)
+            for table in ['current_set', 'marked']:
+                c.executemany('delete from %s where file_key=?' % table, ids)
+            self._delete_file_rows(c, [file_id for file_id, in ids])
+
+        if len(ids) > 0:
+            self.get_app().fire_event('on_file_content_change', *[file_id for file_id, in ids])
+        return [file_id for file_id, in ids]
+
+    def gc(self):
+        """Purge the rows and the thumbnails left behind by removed files and repositories, then compact the
+        database."""
+        threading.Thread(target=self._threaded_gc).start()
+
+    def _threaded_gc(self):
+        self.start_progress("Collecting garbage...")
+        self.set_progress_max_count(4)
+        rows, size = self.collect_garbage()
+        self.stop_progress()
+        Clock.schedule_once(lambda dt: self.notify("{} rows and {} bytes reclaimed".format(rows, size)), 0)
+
+    def collect_garbage(self):
+        """Purge in bulk the rows referring to missing files, the files of missing repositories, the states of missing
+        repositories and the thumbnails of missing files, then compact the database.
+
+        :return: (number of rows deleted, number of bytes reclaimed)
+        """
+        with self.update_lock:
+            db_size = self._get_database_size()
+            with self.conn:
+                c = self.conn.cursor()
+                file_ids = [row[0] for row in c.execute(
+                    "select id from file where file_type<>'book' and repo_key not in (select id from repository)")]
+                count = self._delete_file_rows(c, file_ids)
+
+                for table in FILE_KEY_TABLES:
+                    count += c.execute('delete from %s where file_key not in (select id from file)' % table).rowcount
+                head_keys = [row[0] for row in c.execute(
+                    'select distinct set_head_key from set_detail where file_key not in (select id from file)')]
+                count += c.execute('delete from set_detail where file_key not in (select id from file) or '
+                                   'set_head_key not in (select id from set_head)').rowcount
+                self._reenumerate_sets(c, head_keys)
+                count += c.execute('delete from file_map where parent_key not in (select id from file) or '
+                                   'child_key not in (select id from file)').rowcount
+                for table in ['scan_state', 'update_checkpoint']:
+                    count += c.execute(
+                        'delete from %s where repo_key not in (select id from repository)' % table).rowcount
+            self.tick_progress()
+
+            thumbnail_size = self._delete_orphan_thumbnails()
+            self.tick_progress()
+
+            try:
+                self.conn.execute('vacuum')
+            except sqlite3.OperationalError as e:
+                self.logger.warning("Could not compact the database: {}".format(e))
+            self.tick_progress()
+            return count, thumbnail_size + max(0, db_size - self._get_database_size())
+
+    def _get_database_size(self):
+        return self.conn.execute('pragma page_count').fetchone()[0] * self.conn.execute('pragma page_size').fetchone()[0]
+
+    def _delete_orphan_thumbnails(self):
+        """Delete the thumbnails of the files missing from the catalog.
+
+        :return: number of bytes reclaimed
+        """
+        thumb_loader = self.lookup('thumbloader', 'Entity')
+        if thumb_loader is None or thumb_loader.thumb_path is None or not os.path.isdir(thumb_loader.thumb_path):
+            return 0
+
+        file_ids = set(row[0] for row in self.conn.execute('select id from file'))
+        size = 0
+        for entry in os.scandir(thumb_loader.thumb_path):
+            file_id, ext = os.path.splitext(entry.name)
+            if ext != '.png' or not file_id.isdigit() or int(file_id) in file_ids:
+                continue
+            try:
+                entry_size = entry.stat().st_size
+                os.remove(entry.path)
+                size += entry_size
+            except OSError as e:
+                self.logger.warning("Could not delete thumbnail {}: {}".format(entry.path, e))
+        return size
+
+    def delete_current_file(self):
+        """Delete the current file, see delete_files."""
+        cursor = self.session.cursor
+        if cursor.file_id is None:
+            return
+        if len(self.delete_files([cursor.file_id])) > 0:
+            cursor.remove()
+            self.execute_cmd("load-set")
+
+    def delete_marked_files(self):
+        """Delete the marked files, see delete_files."""
+        file_ids = [row[0] for row in self.conn.execute('select file_key from marked').fetchall()]
+        if len(self.delete_files(file_ids)) > 0:
+            self.reenumerate_current_set_positions()
+            self.on_current_set_change()
+
     def on_application_quit(self):
         self.cancel_operation = True
 
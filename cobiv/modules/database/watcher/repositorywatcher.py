@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+import time
+
+from fs import open_fs
+from fs.errors import NoSysPath
+from kivy.clock import Clock
+
+from cobiv.modules.core.entity import Entity
+from cobiv.modules.database.sqlitedb.scan.sidecar import is_sidecar
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+ADDED = 'add'
+REMOVED = 'remove'
+MODIFIED = 'modify'
+RESCAN = 'rescan'
+
+
+class RepositoryEventHandler(FileSystemEventHandler):
+    """Forward the filesystem events of a local repository to the watcher, as paths of the repository."""
+
+    def __init__(self, watcher, repo_id, root_path, recursive):
+        super(RepositoryEventHandler, self).__init__()
+        self.watcher = watcher
+        self.repo_id = repo_id
+        self.root_path = root_path
+        self.recursive = recursive
+
+    def to_name(self, sys_path):
+        relative_path = os.path.relpath(sys_path, self.root_path)
+        if relative_path.startswith('..') or (not self.recursive and os.sep in relative_path):
+            return None
+        return '/' + relative_path.replace(os.sep, '/')
+
+    def push(self, kind, sys_path, is_directory):
+        name = self.to_name(sys_path)
+        if name is None:
+            return
+        if is_directory:
+            if kind != MODIFIED:
+                self.watcher.push(self.repo_id, RESCAN, name)
+        elif self.watcher.is_watched_file(name):
+            self.watcher.push(self.repo_id, kind, name)
+
+    def on_created(self, event):
+        self.push(ADDED, event.src_path, event.is_directory)
+
+    def on_deleted(self, event):
+        self.push(REMOVED, event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        self.push(MODIFIED, event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        self.push(REMOVED, event.src_path, event.is_directory)
+        self.push(ADDED, event.dest_path, event.is_directory)
+
+
+class RepositoryWatcher(Entity):
+    """Watch the local repositories and apply their changes to the catalog as soon as they settle.
+
+    Events are coalesced by file and flushed once no new event came during the debounce delay. Changes of directories
+    can't be mapped to files, so they trigger an update of the whole repository, which lists only the modified
+    directories.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self):
+        super(RepositoryWatcher, self).__init__()
+        self.observer = None
+        self.thread = None
+        self.thread_alive = False
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.rescans = set()
+        self.last_event_time = 0
+        self.debounce = 2.0
+        self.db = None
+
+    def get_name(self=None):
+        return "watcher"
+
+    def build_yaml_config(self, config):
+        config[self.get_name()] = {
+            'enabled': True,
+            'debounce': 2.0
+        }
+        return config
+
+    def ready(self):
+        super(RepositoryWatcher, self).ready()
+        self.debounce = float(self.get_config_value('debounce', 2.0))
+        if not self.get_config_value('enabled', True):
+            return
+        if Observer is None:
+            self.logger.info("watchdog is not installed, repositories are not watched")
+            return
+        Clock.schedule_once(lambda dt: self.start(), 0)
+
+    def start(self):
+        self.db = self.lookup('db', 'Entity')
+        conn = self.lookup('sqlite_ds', 'Datasource').get_connection()
+
+        self.observer = Observer()
+        for repo_id, repo_path, recursive in conn.execute('select id, path, recursive from repository').fetchall():
+            try:
+                with open_fs(repo_path) as repo_fs:
+                    root_path = repo_fs.getsyspath('/')
+            except NoSysPath:
+                continue
+            handler = RepositoryEventHandler(self, repo_id, root_path, recursive)
+            self.observer.schedule(handler, root_path, recursive=bool(recursive))
+        self.observer.start()
+
+        self.thread_alive = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def stop(self):
+        self.thread_alive = False
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def on_application_quit(self):
+        self.stop()
+
+    def is_watched_file(self, name):
+        return self.db.is_scanned_image(name) or is_sidecar(name)
+
+    def push(self, repo_id, kind, name):
+        with self.lock:
+            self.last_event_time = time.time()
+            if kind == RESCAN:
+                self.rescans.add(repo_id)
+                return
+
+            changes = self.pending.setdefault(repo_id, {})
+            previous = changes.get(name)
+            if kind == ADDED and previous == REMOVED:
+                kind = MODIFIED
+            elif kind == REMOVED and previous == ADDED:
+                del changes[name]
+                return
+            elif kind == MODIFIED and previous == ADDED:
+                kind = ADDED
+            changes[name] = kind
+
+    def run(self):
+        while self.thread_alive:
+            time.sleep(0.5)
+            if time.time() - self.last_event_time >= self.debounce:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            rescans, self.rescans = self.rescans, set()
+
+        # the changes of the files are applied even when their repository is rescanned, as the rescan doesn't list
+        # the directories which look unchanged, where files are modified in place
+        for repo_id, changes in pending.items():
+            self.logger.debug("applying {} changes in repository {}".format(len(changes), repo_id))
+            sidecars = [name for name in changes if is_sidecar(name)]
+            changes = {name: kind for name, kind in changes.items() if not is_sidecar(name)}
+            self.db.update_files(repo_id,
+                                 to_add=[name for name, kind in changes.items() if kind == ADDED],
+                                 to_remove=[name for name, kind in changes.items() if kind == REMOVED],
+                                 to_modify=[name for name, kind in changes.items() if kind == MODIFIED])
+            # a changed sidecar only refreshes the tags of its image, once the image itself is up to date
+            if len(sidecars) > 0:
+                self.db.update_sidecars(repo_id, sidecars)
+
+        if len(rescans) > 0:
+            self.db.updatedb(sameThread=True, repo_ids=rescans)
@@ -0,0 +1,109 @@
+import io
+import logging
+import time
+from datetime import datetime
+
+from PIL import Image
+
+from cobiv.modules.io.reader.tagreader import TagReader
+
+logger = logging.getLogger(__name__)
+
+EXIF_IFD = 0x8769
+""" Tag of the sub IFD holding the EXIF fields of the photo """
+DATE_TAGS = [0x9003, 0x9004, 0x0132]
+""" DateTimeOriginal, DateTimeDigitized and DateTime, in order of preference for the capture date """
+TEXT_TAGS = {'camera_make': 0x010F, 'camera_model': 0x0110, 'lens': 0xA434}
+NUMBER_TAGS = {'iso': 0x8827, 'exposure_time': 0x829A, 'f_number': 0x829D, 'focal_length': 0x920A,
+               'orientation': 0x0112}
+INTEGER_FIELDS = ['iso', 'orientation']
+
+EXIF_FIELDS = ['capture_date', 'camera_make', 'camera_model', 'lens', 'iso', 'exposure_time', 'f_number',
+               'focal_length', 'orientation']
+EXIF_NUMERIC_FIELDS = ['capture_date', 'iso', 'exposure_time', 'f_number', 'focal_length', 'orientation']
+
+
+def read_exif(data):
+    """Read the EXIF tags of an image, the fields of the EXIF sub IFD included.
+
+    :param data: beginning of the image file
+    :return: dictionary of values by tag number, empty if the image has no EXIF tags
+    """
+    try:
+        exif = Image.open(io.BytesIO(data)).getexif()
+        tags = dict(exif)
+        if hasattr(exif, 'get_ifd'):
+            tags.update(exif.get_ifd(EXIF_IFD))
+        return tags
+    except Exception:
+        return {}
+
+
+def to_number(value):
+    """Convert an EXIF number, rational or not, to a float, or None if it is not a number."""
+    if isinstance(value, (tuple, list)):
+        if len(value) == 2 and isinstance(value[0], int) and isinstance(value[1], int):
+            return value[0] / float(value[1]) if value[1] != 0 else None
+        value = value[0] if len(value) > 0 else None
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def to_text(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if not isinstance(value, str):
+        return None
+    value = value.strip('\x00').strip()
+    return value if len(value) > 0 else None
+
+
+def to_timestamp(value):
+    """Convert an EXIF date to a timestamp comparable to core_tags.file_date, or None if it is not a valid date."""
+    value = to_text(value)
+    if value is None:
+        return None
+    try:
+        return time.mktime(datetime.strptime(value[:19], '%Y:%m:%d %H:%M:%S').timetuple())
+    except (ValueError, OverflowError):
+        return None
+
+
+class ExifReader(TagReader):
+    """Read the capture date, the camera, the lens and the exposure of photos from their EXIF fields, into the typed
+    columns of the exif_tags table. Unlike tags, these columns are indexed and compared as numbers, so that searching
+    and sorting on them doesn't scan the tag table.
+    """
+
+    data_mode = TagReader.HEADER
+    header_size = 65536
+
+    tablename = 'exif_tags'
+    fields = EXIF_FIELDS
+    numeric_fields = EXIF_NUMERIC_FIELDS
+
+    def get_name(self=None):
+        return "exif_reader"
+
+    def read_file_values(self, file_id, data):
+        tags = read_exif(data)
+        if len(tags) == 0:
+            return None
+
+        values = {'capture_date': None}
+        for tag in DATE_TAGS:
+            values['capture_date'] = to_timestamp(tags.get(tag))
+            if values['capture_date'] is not None:
+                break
+        for field, tag in TEXT_TAGS.items():
+            values[field] = to_text(tags.get(tag))
+        for field, tag in NUMBER_TAGS.items():
+            values[field] = to_number(tags.get(tag))
+            if values[field] is not None and field in INTEGER_FIELDS:
+                values[field] = int(values[field])
+
+        if all(value is None for value in values.values()):
+            return None
+        return values
@@ -2,5 +2,43 @@ from cobiv.modules.core.component import Component
 
 
 class TagReader(Component):
-    def read_file_tags(self, file_id, filename, list_to_add):
+    """Base class of the plugins reading tags from the files of a repository.
+
+    A reader declares in `data_mode` how much of the file it needs, so the file is read completely only when a reader
+    really requires it.
+    """
+
+    HEADER = 'header'
+    """ data is a bytes string with the first `header_size` bytes of the file """
+    STREAM = 'stream'
+    """ data is a binary file object, positioned at the beginning of the file """
+    CONTENT = 'content'
+    """ data is a bytes string with the whole content of the file """
+
+    data_mode = CONTENT
+    header_size = 65536
+
+    tablename = None
+    """ table where the reader writes typed values, with a column for each of `fields` and a file_key column """
+    fields = []
+    """ columns of the table of the reader, searchable and sortable like the core tags """
+    numeric_fields = []
+    """ columns of the table holding only numbers """
+
+    def read_file_tags(self, file_id, data, list_to_add):
+        """Read the tags of a file and append them as (file_id, category, kind, type, value) rows.
+
+        :param file_id: id of the file in the catalog
+        :param data: header, stream or content of the file, depending on `data_mode`
+        :param list_to_add: list of tag rows to append to
+        """
         pass
+
+    def read_file_values(self, file_id, data):
+        """Read the typed values of a file for the table of the reader.
+
+        :param file_id: id of the file in the catalog
+        :param data: header, stream or content of the file, depending on `data_mode`
+        :return: dictionary of values by column, or None to write no row
+        """
+        return None
@@ -451,6 +451,7 @@ class Browser(View, FloatLayout):
         self.cursor.go_eol()
 
     def on_id_change(self, instance, value):
+        self.get_app().fire_event('on_navigation')
         if self.selected_image is not None:
             self.selected_image.set_selected(False)
 
@@ -26,6 +26,9 @@ class Viewer(View, ScrollView):
     swipe_frequency = 0
     swipe_direction = 0
 
+    read_ahead_count = 0
+    last_pos = None
+
     def __init__(self, **kwargs):
         super(Viewer, self).__init__(**kwargs)
 
@@ -80,6 +83,9 @@ class Viewer(View, ScrollView):
         app.register_event_observer('on_gesture_pinch', self.on_pinch)
         app.register_event_observer('on_gesture_swipe', self.on_swipe)
         app.register_event_observer('on_stop_gesture_swipe', self.on_stop_swipe)
+        app.register_event_observer('on_file_content_change', self.session.byte_cache.clear)
+        self.session.byte_cache.max_size = int(self.get_config_value('cache_size', 256)) * 1024 * 1024
+        self.read_ahead_count = int(self.get_config_value('read_ahead', 4))
 
     def on_switch(self):
         self.cursor.bind(file_id=self.on_cursor_change)
@@ -92,7 +98,27 @@ class Viewer(View, ScrollView):
         self.load_slide()
 
     def on_cursor_change(self, instance, value):
+        self.get_app().fire_event('on_navigation')
         self.load_slide()
+        self.read_ahead()
+
+    def read_ahead(self):
+        """Read the next images in the direction of the navigation, `read_ahead` of them, so that they are in memory
+        when shown. After a jump, the images on both sides are read."""
+        pos = self.cursor.pos
+        if self.read_ahead_count <= 0 or pos is None or self.cursor.file_id is None:
+            return
+        step = pos - self.last_pos if self.last_pos is not None else 0
+        self.last_pos = pos
+
+        if step == 1:
+            rows = self.cursor.get_next_ids(self.read_ahead_count)
+        elif step == -1:
+            rows = self.cursor.get_previous_ids(self.read_ahead_count)
+        else:
+            half = max(1, self.read_ahead_count // 2)
+            rows = list(self.cursor.get_next_ids(half)) + list(self.cursor.get_previous_ids(half))
+        self.session.byte_cache.read_ahead([(row[3], row[2]) for row in rows if row[4] == 'file'])
 
     def load_slide(self):
         if self.cursor.implementation is None:
@@ -0,0 +1,27 @@
+create table if not exists scan_state (repo_key int, path text, parent text, mtime float, entries int);
+create unique index if not exists scan_state_idx1 on scan_state(repo_key,path);
+create index if not exists scan_state_idx2 on scan_state(repo_key,parent);
+
+create table if not exists update_checkpoint (repo_key int primary key, name text);
+
+create table if not exists file_hash (file_key int primary key, algorithm text, digest text);
+create index if not exists file_hash_idx1 on file_hash(algorithm,digest);
+
+create table if not exists file_phash (file_key int primary key, algorithm text, value int);
+
+drop index if exists core_tags_idx3;
+create index if not exists core_tags_idx4 on core_tags(size,file_date,file_key);
+
+drop index if exists file_idx1;
+create unique index if not exists file_idx2 on file(repo_key,name);
+create index if not exists file_idx3 on file(name);
+
+create table if not exists blocked_hash (algorithm text, digest text, name text, deleted_date float);
+create unique index if not exists blocked_hash_idx1 on blocked_hash(algorithm,digest);
+
+create table if not exists exif_tags (file_key int primary key, capture_date float, camera_make text, camera_model text, lens text, iso int, exposure_time float, f_number float, focal_length float, orientation int);
+create index if not exists exif_tags_idx1 on exif_tags(capture_date);
+create index if not exists exif_tags_idx2 on exif_tags(camera_model);
+create index if not exists exif_tags_idx3 on exif_tags(iso);
+
+create table if not exists sidecar (file_key int primary key, name text, size int, modified float, keywords text);
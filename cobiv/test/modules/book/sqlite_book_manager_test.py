@@ -83,6 +83,9 @@ class TestApp(App):
         else:
             return None
 
+    def lookups(self, category):
+        return []
+
     def fire_event(self, *args, **kwargs):
         pass
 
@@ -0,0 +1,62 @@
+import io
+import unittest
+
+from cobiv.modules.database.duplicates.exactdupes import find_exact_duplicates, partial_hash
+
+
+class CountingBytesIO(io.BytesIO):
+    def __init__(self, data, counter):
+        super(CountingBytesIO, self).__init__(data)
+        self.counter = counter
+
+    def read(self, size=-1):
+        data = super(CountingBytesIO, self).read(size)
+        self.counter[0] += len(data)
+        return data
+
+
+class ExactDupesTest(unittest.TestCase):
+    def setUp(self):
+        big = bytes(range(256)) * 64
+        self.files = {
+            1: b'small',
+            2: b'small',
+            3: b'other',
+            4: big,
+            5: big,
+            6: big[:8000] + b'x' + big[8001:],
+            7: big[:-1] + b'y',
+            8: b'unique size',
+        }
+        self.read_count = [0]
+
+    def open_file(self, file_id):
+        return CountingBytesIO(self.files[file_id], self.read_count)
+
+    def find(self, **kwargs):
+        candidates = sorted((len(data), file_id) for file_id, data in self.files.items())
+        return sorted(sorted(group) for group in
+                      find_exact_duplicates(candidates, self.open_file, 'blake2b', partial_size=1024, **kwargs))
+
+    def test_partial_hash(self):
+        data = bytes(range(256)) * 16
+        self.assertEqual(partial_hash(io.BytesIO(data), len(data), 'blake2b', 1024),
+                         partial_hash(io.BytesIO(data[:2000] + b'x' + data[2001:]), len(data), 'blake2b', 1024))
+        self.assertNotEqual(partial_hash(io.BytesIO(data), len(data), 'blake2b', 1024),
+                            partial_hash(io.BytesIO(data[:-1] + b'x'), len(data), 'blake2b', 1024))
+
+    def test_find_exact_duplicates(self):
+        digests = {}
+        self.assertEqual([[1, 2], [4, 5]], self.find(on_digest=lambda file_id, digest: digests.update({file_id: digest})))
+        # only the files colliding on their partial hash are fully read
+        self.assertEqual([4, 5, 6], sorted(digests))
+        self.assertEqual(5 * 3 + 1024 * 2 * 4 + len(self.files[4]) * 3, self.read_count[0])
+
+    def test_known_digests(self):
+        digests = {4: 'a', 5: 'a', 6: 'b', 7: 'c'}
+        self.assertEqual([[1, 2], [4, 5]], self.find(known_digests=digests.get))
+        self.assertEqual(5 * 3, self.read_count[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
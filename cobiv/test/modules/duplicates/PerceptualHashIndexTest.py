@@ -0,0 +1,74 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from PIL import Image
+
+from cobiv.modules.database.duplicates.phashindex import PerceptualHashIndex, split_chunks
+from cobiv.modules.database.sqlitedb.scan.perceptual import dhash, phash
+
+
+class PerceptualHashIndexTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('create table file_phash (file_key int primary key, algorithm text, value int)')
+        self.path = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.path, 'phash_index.npz')
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.path)
+        super(PerceptualHashIndexTest, self).tearDown()
+
+    def add_hashes(self, values):
+        with self.conn:
+            self.conn.executemany('insert or replace into file_phash (file_key, algorithm, value) values (?,?,?)',
+                                  [(file_key, 'dhash', value) for file_key, value in values.items()])
+
+    def test_split_chunks(self):
+        chunks = split_chunks(3)
+        self.assertEqual([(0, 2 ** 22 - 1), (22, 2 ** 21 - 1), (43, 2 ** 21 - 1)], chunks)
+
+    def test_find_clusters(self):
+        self.add_hashes({1: 0x0F0F, 2: 0x0F0E, 3: -1, 4: -2, 5: 0x7FFF000000000000, 6: 0x0F00, 7: -(2 ** 63), 8: 0x0F0F})
+        index = PerceptualHashIndex(self.conn, self.cache_path, 'dhash')
+
+        self.assertEqual([[1, 8]], [list(c) for c in index.find_clusters(0)])
+        self.assertEqual([[1, 2, 8], [3, 4]], [list(c) for c in index.find_clusters(1)])
+        self.assertEqual([[1, 2, 6, 8], [3, 4]], [list(c) for c in index.find_clusters(3)])
+
+    def test_cache(self):
+        self.add_hashes({1: 10, 2: 11})
+        index = PerceptualHashIndex(self.conn, self.cache_path, 'dhash')
+        self.assertEqual(1, len(index.find_clusters(1)))
+        self.assertTrue(os.path.exists(self.cache_path))
+
+        other_index = PerceptualHashIndex(self.conn, self.cache_path, 'dhash')
+        other_index.load()
+        self.assertEqual([1, 2], list(other_index.ids))
+
+        self.add_hashes({2: 1000})
+        self.assertEqual([], index.find_clusters(1))
+
+        # a change of the low bits of a large hash is seen as well
+        self.add_hashes({1: 2 ** 62, 2: 2 ** 62 + 1})
+        self.assertEqual([], index.find_clusters(0))
+        self.add_hashes({2: 2 ** 62})
+        self.assertEqual([[1, 2]], [list(c) for c in index.find_clusters(0)])
+
+    def test_resized_image(self):
+        with Image.open(self.get_user_path('..', 'sqlitedb', 'images', '0001.jpg')) as img:
+            img.load()
+            resized = img.resize((img.size[0] // 2, img.size[1] // 2))
+            for algorithm in [dhash, phash]:
+                distance = bin((algorithm(img) ^ algorithm(resized)) & (2 ** 64 - 1)).count('1')
+                self.assertLessEqual(distance, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
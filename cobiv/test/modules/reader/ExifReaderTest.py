@@ -0,0 +1,94 @@
+import io
+import os
+import sqlite3
+import time
+import unittest
+from datetime import datetime
+
+from PIL import Image
+from fs.memoryfs import MemoryFS
+
+from cobiv.modules.database.sqlitedb.scan.tagextractor import read_file
+from cobiv.modules.database.sqlitedb.search.customtablestrategy import CustomTableStrategy
+from cobiv.modules.database.sqlitedb.search.searchmanager import SearchManager
+from cobiv.modules.io.reader.exif.exifreader import ExifReader
+
+
+def create_photo():
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera Maker'
+    exif[0x0110] = 'Model 1'
+    exif[0x0112] = 6
+    exif[0x0132] = '2020:01:01 10:00:00'
+    exif.get_ifd(0x8769).update({0x9003: '2019:05:04 12:30:00', 0x8827: 400, 0x829D: 2.8})
+    data = io.BytesIO()
+    Image.new('RGB', (32, 24)).save(data, format='JPEG', exif=exif)
+    return data.getvalue()
+
+
+class ExifReaderTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def test_read_values(self):
+        values = ExifReader().read_file_values(1, create_photo())
+        self.assertEqual(time.mktime(datetime(2019, 5, 4, 12, 30).timetuple()), values['capture_date'])
+        self.assertEqual('Camera Maker', values['camera_make'])
+        self.assertEqual('Model 1', values['camera_model'])
+        self.assertEqual(400, values['iso'])
+        self.assertAlmostEqual(2.8, values['f_number'])
+        self.assertEqual(6, values['orientation'])
+        self.assertIsNone(values['lens'])
+
+    def test_no_exif(self):
+        data = io.BytesIO()
+        Image.new('RGB', (32, 24)).save(data, format='PNG')
+        self.assertIsNone(ExifReader().read_file_values(1, data.getvalue()))
+        self.assertIsNone(ExifReader().read_file_values(1, b'not an image'))
+
+    def test_read_file(self):
+        repo_fs = MemoryFS()
+        repo_fs.writebytes('/photo.jpg', create_photo())
+        data = read_file(1, '/photo.jpg', repo_fs, [ExifReader()])
+        self.assertEqual(1, len(data.table_rows))
+        tablename, values = data.table_rows[0]
+        self.assertEqual('exif_tags', tablename)
+        self.assertEqual('Model 1', values['camera_model'])
+        self.assertEqual(set(ExifReader.fields), set(values))
+
+    def test_search_uses_index(self):
+        conn = sqlite3.connect(':memory:')
+        for script in ['sqlite_db.sql', 'sqlite_db_upgrade.sql']:
+            with open(self.get_user_path('..', '..', '..', 'resources', 'sql', script)) as fd:
+                conn.executescript(fd.read())
+
+        reader = ExifReader()
+        strategy = CustomTableStrategy(tablename=reader.tablename, fields=reader.fields,
+                                       numeric_fields=reader.numeric_fields)
+        container, subqueries = {}, []
+        strategy.prepare(False, container, 'capture_date', '>', ['1000'])
+        strategy.process(container, subqueries)
+        query = subqueries[0][1]
+        self.assertNotIn('cast', query)
+
+        plan = ' '.join(str(row) for row in conn.execute('explain query plan ' + query).fetchall())
+        self.assertIn('exif_tags_idx1', plan)
+        conn.close()
+
+    def test_search_strategy_of_readers(self):
+        class ReaderSearchManager(SearchManager):
+            def lookup(self, name, category):
+                return None
+
+            def lookups(self, category):
+                return [ExifReader()] if category == 'TagReader' else []
+
+        search_manager = ReaderSearchManager()
+        search_manager.ready()
+        strategies = [s for s in search_manager.strategies if s.tablename == 'exif_tags']
+        self.assertEqual(1, len(strategies))
+        self.assertEqual(set(ExifReader.numeric_fields), strategies[0].numeric_fields)
+
+
+if __name__ == "__main__":
+    unittest.main()
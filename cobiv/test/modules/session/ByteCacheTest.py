@@ -0,0 +1,96 @@
+import threading
+import unittest
+
+from fs.errors import ResourceNotFound
+from fs.memoryfs import MemoryFS
+
+from cobiv.modules.core.session.bytecache import ByteCache, CachedFS
+
+
+class CountingFS(MemoryFS):
+    """Filesystem counting the reads of each file, which can be held until released"""
+
+    def __init__(self):
+        super(CountingFS, self).__init__()
+        self.reads = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def readbytes(self, path):
+        self.gate.wait(5)
+        self.reads.append(path)
+        return super(CountingFS, self).readbytes(path)
+
+    getbytes = readbytes
+
+
+class ByteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.repo_fs = CountingFS()
+        for i in range(10):
+            self.repo_fs.writebytes('/{}.jpg'.format(i), bytes([i]) * 100)
+        self.cache = ByteCache(lambda key: self.repo_fs, max_size=350)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_getbytes(self):
+        self.assertEqual(bytes([1]) * 100, self.cache.getbytes(1, '/1.jpg'))
+        self.assertEqual(bytes([1]) * 100, self.cache.getbytes(1, '/1.jpg'))
+        self.assertEqual(['/1.jpg'], self.repo_fs.reads)
+
+        self.cache.getbytes(1, '/2.jpg', store=False)
+        self.assertNotIn((1, '/2.jpg'), self.cache)
+        self.assertRaises(ResourceNotFound, self.cache.getbytes, 1, '/missing.jpg')
+
+    def test_eviction(self):
+        for i in range(4):
+            self.cache.getbytes(1, '/{}.jpg'.format(i))
+        self.assertEqual(300, self.cache.size)
+        self.assertNotIn((1, '/0.jpg'), self.cache)
+
+        self.cache.getbytes(1, '/1.jpg')
+        self.cache.getbytes(1, '/4.jpg')
+        self.assertIn((1, '/1.jpg'), self.cache)
+        self.assertNotIn((1, '/2.jpg'), self.cache)
+
+        self.repo_fs.writebytes('/big.jpg', b'x' * 400)
+        self.cache.getbytes(1, '/big.jpg')
+        self.assertNotIn((1, '/big.jpg'), self.cache)
+        self.assertEqual(300, self.cache.size)
+
+    def test_read_ahead(self):
+        self.repo_fs.gate.clear()
+        self.cache.read_ahead([(1, '/5.jpg'), (1, '/6.jpg')])
+        self.repo_fs.gate.set()
+        # waits for the read ahead instead of reading again
+        self.assertEqual(bytes([5]) * 100, self.cache.getbytes(1, '/5.jpg'))
+        self.assertEqual(bytes([6]) * 100, self.cache.getbytes(1, '/6.jpg'))
+        self.assertEqual(['/5.jpg', '/6.jpg'], sorted(self.repo_fs.reads))
+
+    def test_cancel_read_ahead(self):
+        cache = ByteCache(lambda key: self.repo_fs, workers=1)
+        try:
+            self.repo_fs.gate.clear()
+            cache.read_ahead([(1, '/1.jpg'), (1, '/2.jpg'), (1, '/3.jpg')])
+            cache.read_ahead([(1, '/0.jpg')])
+            self.repo_fs.gate.set()
+            cache.getbytes(1, '/0.jpg')
+            self.assertNotIn('/2.jpg', self.repo_fs.reads)
+            self.assertNotIn('/3.jpg', self.repo_fs.reads)
+        finally:
+            cache.close()
+
+    def test_cached_fs(self):
+        self.cache.getbytes(1, '/1.jpg')
+        cached_fs = CachedFS(self.repo_fs, self.cache, 1, store=False)
+        with cached_fs.openbin('/1.jpg') as stream:
+            self.assertEqual(bytes([1]) * 100, stream.read())
+        self.assertEqual(bytes([2]) * 100, cached_fs.getbytes('/2.jpg'))
+        self.assertEqual(['/1.jpg', '/2.jpg'], self.repo_fs.reads)
+        self.assertNotIn((1, '/2.jpg'), self.cache)
+        self.assertEqual(10, len(cached_fs.listdir('/')))
+
+
+if __name__ == "__main__":
+    unittest.main()
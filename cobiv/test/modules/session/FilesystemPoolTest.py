@@ -0,0 +1,131 @@
+import threading
+import unittest
+
+from fs.memoryfs import MemoryFS
+
+from cobiv.modules.core.session.fspool import FilesystemPool, EVICTION_INTERVAL
+
+
+class NetworkFS(MemoryFS):
+    """Stand-in of a network filesystem"""
+
+    def __init__(self):
+        super(NetworkFS, self).__init__()
+        self.healthy = True
+
+    def getmeta(self, namespace='standard'):
+        meta = dict(super(NetworkFS, self).getmeta(namespace))
+        meta['network'] = True
+        return meta
+
+    def getinfo(self, path, namespaces=None):
+        if not self.healthy:
+            raise IOError("connection lost")
+        return super(NetworkFS, self).getinfo(path, namespaces)
+
+
+class FilesystemPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.opened = []
+        self.pool = FilesystemPool(idle_timeout=100, check_delay=10, opener=self.open, clock=lambda: self.now)
+
+    def open(self, url):
+        filesystem = NetworkFS()
+        self.opened.append((url, filesystem))
+        return filesystem
+
+    def get_in_thread(self, key):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.pool.get(key)))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_shared(self):
+        local_fs = MemoryFS()
+        self.pool.add(1, local_fs, 'mem://')
+        self.assertIs(local_fs, self.pool.get(1))
+        self.assertIs(local_fs, self.get_in_thread(1))
+        self.assertEqual([], self.opened)
+        self.assertRaises(KeyError, self.pool.get, 2)
+
+    def test_by_thread(self):
+        main_fs = NetworkFS()
+        self.pool.add(1, main_fs, 'ftp://host')
+        self.assertIs(main_fs, self.pool.get(1))
+
+        other_fs = self.get_in_thread(1)
+        self.assertIsNot(main_fs, other_fs)
+        self.assertEqual([('ftp://host', other_fs)], self.opened)
+        self.assertIs(main_fs, self.pool.get(1))
+
+    def test_eviction(self):
+        main_fs = NetworkFS()
+        self.pool.add(1, main_fs, 'ftp://host')
+        other_fs = self.get_in_thread(1)
+
+        self.now += EVICTION_INTERVAL + 1
+        self.assertIs(main_fs, self.pool.get(1))
+        # the thread which opened the other handle ended
+        self.assertTrue(other_fs.isclosed())
+        self.assertFalse(main_fs.isclosed())
+
+        self.pool.add(2, NetworkFS(), 'ftp://other')
+        self.now += 101
+        self.pool.get(2)
+        self.assertTrue(main_fs.isclosed())
+        self.assertIsNot(main_fs, self.pool.get(1))
+
+    def test_no_eviction_of_other_threads(self):
+        self.pool.add(1, NetworkFS(), 'ftp://host')
+        self.pool.add(2, NetworkFS(), 'ftp://other')
+        result = []
+        release = threading.Event()
+
+        def hold():
+            result.append(self.pool.get(1))
+            release.wait(5)
+        thread = threading.Thread(target=hold)
+        thread.start()
+        try:
+            while len(result) == 0:
+                release.wait(0.01)
+            self.now += 101
+            self.pool.get(2)
+            # still alive, the thread may be using its handle
+            self.assertFalse(result[0].isclosed())
+        finally:
+            release.set()
+            thread.join()
+
+        self.now += EVICTION_INTERVAL + 1
+        self.pool.get(2)
+        self.assertTrue(result[0].isclosed())
+
+    def test_health_check(self):
+        main_fs = NetworkFS()
+        self.pool.add(1, main_fs, 'ftp://host')
+        main_fs.healthy = False
+        self.now += 5
+        self.assertIs(main_fs, self.pool.get(1))
+
+        self.now += 11
+        new_fs = self.pool.get(1)
+        self.assertIsNot(main_fs, new_fs)
+        self.assertTrue(main_fs.isclosed())
+        self.assertIs(new_fs, self.pool.get(1))
+
+    def test_close(self):
+        main_fs = NetworkFS()
+        local_fs = MemoryFS()
+        self.pool.add(1, main_fs, 'ftp://host')
+        self.pool.add(2, local_fs)
+        self.pool.close()
+        self.assertTrue(main_fs.isclosed())
+        self.assertTrue(local_fs.isclosed())
+        self.assertNotIn(1, self.pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
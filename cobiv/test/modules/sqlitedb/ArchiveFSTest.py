@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from fs import open_fs
+from fs.errors import ResourceNotFound, FileExpected, ResourceReadOnly
+
+from cobiv.modules.database.sqlitedb.scan import archive
+from cobiv.modules.database.sqlitedb.scan.archive import ArchiveFS
+from cobiv.modules.database.sqlitedb.scan.scanner import create_scanner
+
+
+class ArchiveFSTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.path, 'index')
+        self.archive_path = os.path.join(self.path, 'book.cbz')
+        with zipfile.ZipFile(self.archive_path, 'w') as zf:
+            zf.writestr('readme.txt', b'hello' * 100, compress_type=zipfile.ZIP_DEFLATED)
+            zf.writestr('pages/', b'')
+            zf.writestr('pages/001.jpg', b'page 1', compress_type=zipfile.ZIP_STORED)
+            zf.writestr('pages/002.jpg', b'page 2' * 50, compress_type=zipfile.ZIP_DEFLATED)
+            zf.writestr('extra/sub/003.jpg', b'page 3', compress_type=zipfile.ZIP_BZIP2)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_read(self):
+        with ArchiveFS(self.archive_path, index_path=self.index_path) as archive_fs:
+            self.assertEqual(['extra', 'pages', 'readme.txt'], sorted(archive_fs.listdir('/')))
+            self.assertEqual(['001.jpg', '002.jpg'], sorted(archive_fs.listdir('pages')))
+            self.assertEqual(b'hello' * 100, archive_fs.readbytes('/readme.txt'))
+            self.assertEqual(b'page 1', archive_fs.getbytes('/pages/001.jpg'))
+            self.assertEqual(b'page 2' * 50, archive_fs.openbin('/pages/002.jpg').read())
+            self.assertEqual(b'page 3', archive_fs.readbytes('/extra/sub/003.jpg'))
+            self.assertEqual(b'page 3', archive_fs.readbytes('extra//sub/./003.jpg'))
+
+            self.assertTrue(archive_fs.isdir('/extra/sub'))
+            self.assertEqual(300, archive_fs.getinfo('/pages/002.jpg', namespaces=['details']).size)
+            self.assertLess(archive_fs.get_member_offset('/pages/001.jpg'),
+                            archive_fs.get_member_offset('/pages/002.jpg'))
+            self.assertIsNone(archive_fs.get_member_offset('/missing.jpg'))
+
+            self.assertRaises(ResourceNotFound, archive_fs.readbytes, '/missing.jpg')
+            self.assertRaises(FileExpected, archive_fs.readbytes, '/pages')
+            self.assertRaises(ResourceReadOnly, archive_fs.remove, '/readme.txt')
+            self.assertRaises(ResourceReadOnly, archive_fs.openbin, '/new.jpg', 'w')
+
+            entries = create_scanner(archive_fs).scandir('/pages')
+            self.assertEqual([('001.jpg', False, 6), ('002.jpg', False, 300)],
+                             sorted((e.name, e.is_dir, e.size) for e in entries))
+
+    def test_index(self):
+        ArchiveFS(self.archive_path, index_path=self.index_path).close()
+        self.assertEqual(1, len(os.listdir(self.index_path)))
+
+        built = []
+        build_index = archive.build_index
+
+        def count_builds(archive_path):
+            built.append(archive_path)
+            return build_index(archive_path)
+
+        archive.build_index = count_builds
+        try:
+            with ArchiveFS(self.archive_path, index_path=self.index_path) as archive_fs:
+                self.assertEqual(b'page 1', archive_fs.readbytes('/pages/001.jpg'))
+            self.assertEqual([], built)
+
+            with zipfile.ZipFile(self.archive_path, 'a') as zf:
+                zf.writestr('pages/004.jpg', b'page 4')
+            os.utime(self.archive_path, (1000, 1000))
+            with ArchiveFS(self.archive_path, index_path=self.index_path) as archive_fs:
+                self.assertEqual(b'page 4', archive_fs.readbytes('/pages/004.jpg'))
+            self.assertEqual(1, len(built))
+        finally:
+            archive.build_index = build_index
+
+    def test_open_fs(self):
+        with open_fs('zip://' + self.archive_path + '?index=' + self.index_path) as archive_fs:
+            self.assertIsInstance(archive_fs, ArchiveFS)
+            self.assertEqual(b'page 1', archive_fs.getbytes('/pages/001.jpg'))
+        self.assertTrue(os.path.exists(self.index_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
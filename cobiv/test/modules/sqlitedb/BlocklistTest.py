@@ -0,0 +1,83 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import unittest
+
+from fs import open_fs
+
+from cobiv.modules.database.sqlitedb.scan.blocklist import BloomFilter, Blocklist
+from cobiv.modules.database.sqlitedb.scan.tagextractor import read_file, BLOCKED
+
+
+def digest_of(i):
+    return hashlib.blake2b(str(i).encode()).hexdigest()
+
+
+class BlocklistTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        for script in ['sqlite_db.sql', 'sqlite_db_upgrade.sql']:
+            with open(self.get_user_path('..', '..', '..', 'resources', 'sql', script)) as fd:
+                self.conn.executescript(fd.read())
+
+    def tearDown(self):
+        self.conn.close()
+        super(BlocklistTest, self).tearDown()
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(10000, error_rate=0.01)
+        for i in range(10000):
+            bloom_filter.add(digest_of(i))
+
+        self.assertEqual(10000, len(bloom_filter))
+        self.assertTrue(all(digest_of(i) in bloom_filter for i in range(10000)))
+        false_positives = sum(1 for i in range(10000, 20000) if digest_of(i) in bloom_filter)
+        self.assertLess(false_positives, 300)
+
+        copy = pickle.loads(pickle.dumps(bloom_filter))
+        self.assertIn(digest_of(1), copy)
+
+    def test_blocklist(self):
+        blocklist = Blocklist(self.conn, 'blake2b')
+        self.assertFalse(blocklist.contains(digest_of(1)))
+
+        with self.conn:
+            for i in range(2000):
+                blocklist.add(self.conn.cursor(), digest_of(i), 'file%d.jpg' % i)
+
+        self.assertTrue(blocklist.contains(digest_of(1)))
+        self.assertTrue(blocklist.contains(digest_of(1999)))
+        self.assertFalse(blocklist.contains(digest_of(2000)))
+        self.assertFalse(Blocklist(self.conn, 'md5').contains(digest_of(1)))
+
+        reloaded = Blocklist(self.conn, 'blake2b')
+        self.assertTrue(reloaded.might_contain(digest_of(1)))
+        self.assertEqual(2000, len(reloaded.get_filter()))
+
+    def test_read_blocked_file(self):
+        repo_fs = open_fs(self.get_user_path('images'))
+        try:
+            with open(self.get_user_path('images', '0001.jpg'), 'rb') as fd:
+                digest = hashlib.blake2b(fd.read()).hexdigest()
+            bloom_filter = BloomFilter(10)
+            bloom_filter.add(digest)
+
+            data = read_file(1, '/0001.jpg', repo_fs, [], 'blake2b', 'phash', blocked=bloom_filter)
+            self.assertEqual(BLOCKED, data.rows)
+            self.assertEqual(digest, data.digest)
+            self.assertIsNone(data.perceptual_hash)
+
+            data = read_file(2, '/0002.jpg', repo_fs, [], 'blake2b', 'phash', blocked=bloom_filter)
+            self.assertIn((2, 0, 'format', 0, 'JPEG'), data.rows)
+            self.assertIsNotNone(data.perceptual_hash)
+            self.assertEqual(read_file(2, '/0002.jpg', repo_fs, [], 'blake2b').digest, data.digest)
+        finally:
+            repo_fs.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from fs import open_fs
+from fs.memoryfs import MemoryFS
+
+from cobiv.modules.database.sqlitedb.scan.blocklist import Blocklist
+from cobiv.modules.database.sqlitedb.scan.hashing import hash_bytes
+from cobiv.modules.database.sqlitedb.scan.importer import Importer, iter_staged_files, iter_chunks
+
+
+class ImporterTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        for script in ['sqlite_db.sql', 'sqlite_db_upgrade.sql']:
+            with open(self.get_user_path('..', '..', '..', 'resources', 'sql', script)) as fd:
+                self.conn.executescript(fd.read())
+
+        self.path = tempfile.mkdtemp()
+        for folder in ['staging', 'repo']:
+            os.makedirs(os.path.join(self.path, folder))
+        self.staging_fs = open_fs(os.path.join(self.path, 'staging'))
+        self.repo_fs = open_fs(os.path.join(self.path, 'repo'))
+
+    def tearDown(self):
+        self.staging_fs.close()
+        self.repo_fs.close()
+        shutil.rmtree(self.path)
+        self.conn.close()
+
+    def stage(self, name, data):
+        self.staging_fs.makedirs(os.path.dirname(name), recreate=True)
+        self.staging_fs.writebytes(name, data)
+
+    def test_iter_staged_files(self):
+        for name in ['/b.jpg', '/a/c.png', '/a/notes.txt', '/a.jpg']:
+            self.stage(name, b'x')
+        self.assertEqual(['/a.jpg', '/a/c.png', '/b.jpg'],
+                         list(iter_staged_files(self.staging_fs, lambda name: not name.endswith('.txt'))))
+        self.assertEqual([[1, 2], [3, 4], [5]], list(iter_chunks(range(1, 6), 2)))
+
+    def test_import(self):
+        self.conn.execute('insert into file_hash values (1, "sha256", ?)', (hash_bytes(b'in catalog', 'sha256'),))
+        blocklist = Blocklist(self.conn, 'sha256')
+        with self.conn:
+            blocklist.add(self.conn.cursor(), hash_bytes(b'deleted', 'sha256'), '/deleted.jpg')
+        self.repo_fs.makedir('/trip')
+        self.repo_fs.writebytes('/trip/1.jpg', b'already there')
+
+        self.stage('/trip/1.jpg', b'new 1')
+        self.stage('/trip/2.jpg', b'new 2')
+        self.stage('/trip/3.jpg', b'new 2')
+        self.stage('/old.jpg', b'in catalog')
+        self.stage('/gone.jpg', b'deleted')
+
+        importer = Importer(self.conn, self.staging_fs, self.repo_fs, 'sha256', blocklist=blocklist)
+        moved, duplicates, failed = importer.import_files(['/trip/1.jpg', '/trip/2.jpg', '/trip/3.jpg', '/old.jpg',
+                                                           '/gone.jpg', '/missing.jpg'])
+
+        self.assertEqual(['/trip/1_1.jpg', '/trip/2.jpg'], moved)
+        self.assertEqual(['/trip/3.jpg', '/old.jpg', '/gone.jpg'], duplicates)
+        self.assertEqual(['/missing.jpg'], failed)
+        self.assertEqual(b'new 1', self.repo_fs.readbytes('/trip/1_1.jpg'))
+        self.assertEqual(b'already there', self.repo_fs.readbytes('/trip/1.jpg'))
+        self.assertCountEqual(['gone.jpg', 'old.jpg', 'trip'], self.staging_fs.listdir('/'))
+        self.assertEqual(['3.jpg'], self.staging_fs.listdir('/trip'))
+        self.assertEqual({'/trip/1_1.jpg': hash_bytes(b'new 1', 'sha256'),
+                          '/trip/2.jpg': hash_bytes(b'new 2', 'sha256')}, importer.destination_digests)
+
+    def test_destination_taken_meanwhile(self):
+        self.stage('/1.jpg', b'new')
+        importer = Importer(self.conn, self.staging_fs, self.repo_fs, None)
+        importer.get_destination = lambda name: name
+        self.repo_fs.writebytes('/1.jpg', b'appeared')
+        self.assertEqual(([], [], ['/1.jpg']), importer.import_files(['/1.jpg']))
+        self.assertEqual(b'appeared', self.repo_fs.readbytes('/1.jpg'))
+        self.assertEqual(b'new', self.staging_fs.readbytes('/1.jpg'))
+
+        staging_fs = MemoryFS()
+        staging_fs.writebytes('/1.jpg', b'new')
+        importer = Importer(self.conn, staging_fs, self.repo_fs, None)
+        importer.get_destination = lambda name: name
+        self.assertEqual(([], [], ['/1.jpg']), importer.import_files(['/1.jpg']))
+        self.assertEqual(b'appeared', self.repo_fs.readbytes('/1.jpg'))
+
+    def test_delete_duplicates(self):
+        self.stage('/1.jpg', b'same')
+        self.stage('/2.jpg', b'same')
+        importer = Importer(self.conn, self.staging_fs, self.repo_fs, 'sha256', delete_duplicates=True)
+        self.assertEqual((['/1.jpg'], ['/2.jpg'], []), importer.import_files(['/1.jpg', '/2.jpg']))
+        self.assertEqual([], self.staging_fs.listdir('/'))
+
+    def test_copy_between_filesystems(self):
+        staging_fs = MemoryFS()
+        staging_fs.writebytes('/1.jpg', b'data')
+        importer = Importer(self.conn, staging_fs, self.repo_fs, None)
+        self.assertEqual((['/1.jpg'], [], []), importer.import_files(['/1.jpg']))
+        self.assertEqual(b'data', self.repo_fs.readbytes('/1.jpg'))
+        self.assertFalse(staging_fs.exists('/1.jpg'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import sqlite3
+import unittest
+
+from cobiv.modules.database.sqlitedb.scan.mergediff import merge_diff, iter_catalog_names
+from cobiv.modules.database.sqlitedb.scan.scanner import ScanEntry
+
+
+class MergeDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('create table file (id INTEGER PRIMARY KEY, repo_key int, name text)')
+        self.conn.execute('create unique index file_idx1 on file(name)')
+
+    def tearDown(self):
+        self.conn.close()
+        super(MergeDiffTest, self).tearDown()
+
+    def add_files(self, repo_id, *names):
+        with self.conn:
+            self.conn.executemany('insert into file (repo_key,name) values (?,?)', [(repo_id, n) for n in names])
+
+    def file_entry(self, path):
+        return path, ScanEntry(path.split('/')[-1], False, 1, 0.0)
+
+    def dir_entry(self, path, unchanged=False):
+        return path, None if unchanged else ScanEntry(path.split('/')[-1], True, None, 0.0)
+
+    def test_catalog_names(self):
+        self.add_files(1, '/b.jpg', '/a/x.jpg', '/a.jpg', '/c.jpg')
+        self.add_files(2, '/other.jpg')
+        self.assertEqual(['/a.jpg', '/a/x.jpg', '/b.jpg', '/c.jpg'], list(iter_catalog_names(self.conn, 1, chunk_size=3)))
+
+    def test_catalog_names_subtree(self):
+        self.add_files(1, '/a.jpg', '/a/x.jpg', '/a/b/y.jpg', '/a b/z.jpg', '/a0.jpg', '/b.jpg')
+        self.assertEqual(['/a/b/y.jpg', '/a/x.jpg'], list(iter_catalog_names(self.conn, 1, chunk_size=1, root='/a')))
+        self.assertEqual(['/a/b/y.jpg'], list(iter_catalog_names(self.conn, 1, root='/a/b')))
+
+    def test_diff(self):
+        self.add_files(1, '/a.jpg', '/old/x.jpg', '/same/y.jpg', '/z.jpg')
+        walk = [self.dir_entry('/'), self.file_entry('/a.jpg'), self.file_entry('/b.jpg'),
+                self.dir_entry('/same', unchanged=True), self.file_entry('/y.jpg')]
+
+        batches = list(merge_diff(walk, iter_catalog_names(self.conn, 1)))
+        to_add = [name for batch in batches for name, entry in batch[0]]
+        to_remove = [name for batch in batches for name in batch[1]]
+        self.assertEqual(['/b.jpg', '/y.jpg'], to_add)
+        self.assertEqual(['/old/x.jpg', '/z.jpg'], to_remove)
+
+    def test_batches_applied_during_diff(self):
+        self.add_files(1, *['/%03d.jpg' % i for i in range(0, 100, 2)])
+        walk = [self.dir_entry('/')] + [self.file_entry('/%03d.jpg' % i) for i in range(0, 100, 3)]
+
+        directories = []
+        for to_add, to_remove in merge_diff(walk, iter_catalog_names(self.conn, 1, chunk_size=7), batch_size=5,
+                                            on_directory=directories.append):
+            self.assertLessEqual(len(to_add) + len(to_remove), 5)
+            with self.conn:
+                self.conn.executemany('delete from file where name=?', [(n,) for n in to_remove])
+                self.add_files(1, *[name for name, entry in to_add])
+
+        self.assertEqual(['/'], directories)
+        self.assertEqual(['/%03d.jpg' % i for i in range(0, 100, 3)], list(iter_catalog_names(self.conn, 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from fs import open_fs
+
+from cobiv.modules.database.sqlitedb.scan.hashing import hash_bytes
+from cobiv.modules.database.sqlitedb.scan.moves import MoveDetector
+from cobiv.modules.database.sqlitedb.scan.scanner import ScanEntry
+
+
+class MoveDetectorTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        for script in ['sqlite_db.sql', 'sqlite_db_upgrade.sql']:
+            with open(self.get_user_path('..', '..', '..', 'resources', 'sql', script)) as fd:
+                self.conn.executescript(fd.read())
+
+        self.path = tempfile.mkdtemp()
+        shutil.copytree(self.get_user_path('images'), os.path.join(self.path, 'images'))
+        self.repo_fs = open_fs(self.path)
+
+    def tearDown(self):
+        self.repo_fs.close()
+        shutil.rmtree(self.path)
+        self.conn.close()
+        super(MoveDetectorTest, self).tearDown()
+
+    def add_file(self, name, size, file_date, content=None):
+        c = self.conn.execute('insert into file (repo_key, name, searchable, file_type) values (1,?,1,"file")', (name,))
+        file_id = c.lastrowid
+        self.conn.execute('insert into core_tags (file_key, path, size, file_date) values (?,?,?,?)',
+                          (file_id, os.path.dirname(name), size, file_date))
+        if content is not None:
+            self.conn.execute('insert into file_hash values (?,?,?)', (file_id, 'blake2b', hash_bytes(content, 'blake2b')))
+        return file_id
+
+    def entry(self, name, modified=1000.0):
+        return name, ScanEntry(os.path.basename(name), False, self.repo_fs.getsize(name), modified)
+
+    def test_move_after_removal(self):
+        file_id = self.add_file('/a/0001.jpg', self.repo_fs.getsize('/images/0001.jpg'), 1000.0)
+        detector = MoveDetector(self.conn, 1, self.repo_fs)
+
+        self.assertEqual(([], [], []), detector.match([], ['/a/0001.jpg']))
+        self.assertEqual('/a/0001.jpg', detector.first_pending())
+
+        added, removed, moves = detector.match([self.entry('/images/0001.jpg')], [])
+        self.assertEqual(([], []), (added, removed))
+        self.assertEqual([(file_id, '/images/0001.jpg')], [move[:2] for move in moves])
+        self.assertIsNone(detector.first_pending())
+        self.assertEqual([], detector.flush())
+
+    def test_move_before_removal(self):
+        file_id = self.add_file('/z/0001.jpg', self.repo_fs.getsize('/images/0001.jpg'), 1000.0)
+        detector = MoveDetector(self.conn, 1, self.repo_fs)
+
+        added, removed, moves = detector.match([self.entry('/images/0001.jpg')], [])
+        self.assertEqual([(file_id, '/images/0001.jpg')], [move[:2] for move in moves])
+        self.assertEqual(([], [], []), detector.match([], ['/z/0001.jpg']))
+
+    def test_existing_file_not_moved(self):
+        self.add_file('/images/0001.jpg', self.repo_fs.getsize('/images/0001.jpg'), 1000.0)
+        self.repo_fs.copy('/images/0001.jpg', '/images/copy.jpg')
+        detector = MoveDetector(self.conn, 1, self.repo_fs)
+
+        added, removed, moves = detector.match([self.entry('/images/copy.jpg')], [])
+        self.assertEqual([self.entry('/images/copy.jpg')], added)
+        self.assertEqual([], moves)
+
+    def test_match_by_hash(self):
+        content = self.repo_fs.readbytes('/images/0002.jpg')
+        other_id = self.add_file('/a/0001.jpg', len(content), 1000.0, self.repo_fs.readbytes('/images/0001.jpg'))
+        file_id = self.add_file('/a/0002.jpg', len(content), 1000.0, content)
+        detector = MoveDetector(self.conn, 1, self.repo_fs)
+        detector.match([], ['/a/0001.jpg', '/a/0002.jpg'])
+        self.assertEqual([], detector.match([self.entry('/images/0002.jpg')], [])[2])
+
+        detector = MoveDetector(self.conn, 1, self.repo_fs, hash_algorithm='blake2b')
+        detector.match([], ['/a/0001.jpg', '/a/0002.jpg'])
+        added, removed, moves = detector.match([self.entry('/images/0002.jpg', modified=2000.0)], [])
+        self.assertEqual([(file_id, '/images/0002.jpg')], [move[:2] for move in moves])
+        self.assertEqual(['/a/0001.jpg'], detector.flush())
+        self.assertNotEqual(other_id, file_id)
+
+    def test_window(self):
+        for i in range(3):
+            self.add_file('/a/%d.jpg' % i, i + 1, 1000.0)
+        detector = MoveDetector(self.conn, 1, self.repo_fs, window=2)
+
+        self.assertEqual(([], ['/a/0.jpg'], []), detector.match([], ['/a/0.jpg', '/a/1.jpg', '/a/2.jpg']))
+        self.assertEqual('/a/1.jpg', detector.first_pending())
+        self.assertEqual(['/a/1.jpg', '/a/2.jpg'], detector.flush())
+        self.assertEqual(([], [], []), detector.match([], ['/a/0.jpg']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from fs import open_fs
+from fs.wrapfs import WrapFS
+
+from cobiv.modules.database.sqlitedb.scan.remote import RemoteScanner
+from cobiv.modules.database.sqlitedb.scan.scanner import FsScanner
+from cobiv.modules.database.sqlitedb.scan.scanstate import ScanState
+
+
+class SlowFS(WrapFS):
+    """Stand-in of a remote filesystem, each request taking some latency"""
+
+    def __init__(self, wrap_fs, stats, latency=0.02):
+        super(SlowFS, self).__init__(wrap_fs)
+        self.stats = stats
+        self.latency = latency
+
+    def _request(self, path):
+        with self.stats['lock']:
+            self.stats['running'] += 1
+            self.stats['max_running'] = max(self.stats['max_running'], self.stats['running'])
+            self.stats['listed'].append(path)
+        time.sleep(self.latency)
+        with self.stats['lock']:
+            self.stats['running'] -= 1
+
+    def scandir(self, path, namespaces=None, page=None):
+        self._request(path)
+        return super(SlowFS, self).scandir(path, namespaces=namespaces, page=page)
+
+
+class RemoteScannerTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        for script in ['sqlite_db.sql', 'sqlite_db_upgrade.sql']:
+            with open(self.get_user_path('..', '..', '..', 'resources', 'sql', script)) as fd:
+                self.conn.executescript(fd.read())
+
+        self.path = tempfile.mkdtemp()
+        for i in range(4):
+            for j in range(5):
+                dir_path = os.path.join(self.path, 'd{}'.format(i), 's{}'.format(j))
+                os.makedirs(dir_path)
+                for k in range(3):
+                    with open(os.path.join(dir_path, '{}.jpg'.format(k)), 'wb') as fd:
+                        fd.write(b'x' * (k + 1))
+        for root, dirs, files in os.walk(self.path):
+            os.utime(root, (1000000000, 1000000000))
+        self.stats = {'lock': threading.Lock(), 'running': 0, 'max_running': 0, 'listed': []}
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        self.conn.close()
+
+    def open_remote(self):
+        return SlowFS(open_fs(self.path), self.stats)
+
+    def walk(self, scanner, force=True, root='/'):
+        scan_state = ScanState(self.conn, 1, root)
+        result = [(path, entry) for path, entry in scan_state.walk(scanner, force=force)]
+        scan_state.save()
+        return result
+
+    def test_same_walk(self):
+        with open_fs(self.path) as repo_fs:
+            expected = self.walk(FsScanner(repo_fs))
+        self.conn.execute('delete from scan_state')
+
+        scanner = RemoteScanner(self.open_remote, connections=8)
+        try:
+            result = self.walk(scanner)
+        finally:
+            scanner.close()
+
+        self.assertEqual(expected, result)
+        self.assertEqual(25, len(self.stats['listed']))
+        self.assertGreater(self.stats['max_running'], 1)
+
+    def test_skip_unchanged(self):
+        scanner = RemoteScanner(self.open_remote)
+        try:
+            self.walk(scanner, force=False)
+        finally:
+            scanner.close()
+
+        with open(os.path.join(self.path, 'd2', 's3', 'new.jpg'), 'wb') as fd:
+            fd.write(b'new')
+        os.utime(os.path.join(self.path, 'd2', 's3'), (1000000100, 1000000100))
+        del self.stats['listed'][:]
+
+        scanner = RemoteScanner(self.open_remote, saved_dirs=ScanState(self.conn, 1).get_saved_dirs())
+        try:
+            result = self.walk(scanner, force=False)
+        finally:
+            scanner.close()
+
+        self.assertEqual(['/d2/s3/0.jpg', '/d2/s3/1.jpg', '/d2/s3/2.jpg', '/d2/s3/new.jpg'],
+                         [path for path, e in result if e is not None and not e.is_dir])
+        self.assertEqual(['/d2/s3'], self.stats['listed'])
+
+    def test_window(self):
+        scanner = RemoteScanner(self.open_remote, connections=4, window=3)
+        try:
+            time.sleep(0.2)
+            self.assertLessEqual(len(scanner.listings), 3)
+            self.assertEqual(25, len([entry for path, entry in self.walk(scanner) if entry is not None and entry.is_dir]))
+        finally:
+            scanner.close()
+
+    def test_missing_root(self):
+        scanner = RemoteScanner(self.open_remote, root='/missing')
+        try:
+            self.assertEqual([], self.walk(scanner, root='/missing'))
+        finally:
+            scanner.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -41,6 +41,9 @@ class TestApp(App):
         else:
             return None
 
+    def lookups(self, category):
+        return []
+
 
 class SQLiteCursorTest(unittest.TestCase):
     def setUp(self):
@@ -237,6 +237,41 @@ class SQLiteDbTest(unittest.TestCase):
         db.close_db()
         app.stop()
 
+    def _test_remove_file_cascade(self, app, *args):
+        new_filename = self.get_user_path('images', 'test.jpg')
+        shutil.copy(self.get_user_path('images', 'subfolder', '0003.jpg'), new_filename)
+
+        db = self.init_db_with_tags()
+        test_id = db.conn.execute('select id from file where name="/test.jpg"').fetchone()[0]
+        with db.conn:
+            db.conn.execute('insert into tag values (?,1,"tag",0,"removed")', (test_id,))
+
+        os.remove(new_filename)
+        db.updatedb(sameThread=True)
+
+        for table in ['tag', 'core_tags', 'file_hash', 'set_detail']:
+            self.assertEqual(0, db.conn.execute('select count(*) from %s where file_key=?' % table,
+                                                (test_id,)).fetchone()[0])
+        self.assertEqual(3, db.conn.execute('select count(*) from core_tags').fetchone()[0])
+
+        db.close_db()
+        app.stop()
+
+    def _test_gc(self, app, *args):
+        db = self.init_db_with_tags()
+        with db.conn:
+            db.conn.execute('insert into core_tags (file_key, path, size) values (9999, "/", 1)')
+            db.conn.execute('insert into tag values (9999,1,"tag",0,"orphan")')
+            db.conn.execute('insert into file (repo_key, name, searchable, file_type) values (99, "/x.jpg", 1, "file")')
+
+        rows, size = db.collect_garbage()
+        self.assertEqual(3, rows)
+        self.assertEqual(3, db.conn.execute('select count(*) from file').fetchone()[0])
+        self.assertEqual(0, db.collect_garbage()[0])
+
+        db.close_db()
+        app.stop()
+
     def _test_search_tag_category(self, app, *args):
         db = self.init_db_with_categorized_tags()
         c = self.session.cursor
@@ -538,6 +573,12 @@ class SQLiteDbTest(unittest.TestCase):
     def test_update_tags(self):
         self.call_test(self._test_update_tags)
 
+    def test_remove_file_cascade(self):
+        self.call_test(self._test_remove_file_cascade)
+
+    def test_gc(self):
+        self.call_test(self._test_gc)
+
     def test_search_tag_category(self):
         self.call_test(self._test_search_tag_category)
 
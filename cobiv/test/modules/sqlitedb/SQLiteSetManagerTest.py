@@ -77,6 +77,9 @@ class TestApp(App):
         else:
             return self.datasource
 
+    def lookups(self, category):
+        return []
+
     def fire_event(self,*args,**kwargs):
         pass
 
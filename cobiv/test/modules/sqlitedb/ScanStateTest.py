@@ -0,0 +1,128 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from fs import open_fs
+
+from cobiv.modules.database.sqlitedb.scan.scanner import FsScanner
+from cobiv.modules.database.sqlitedb.scan.scanstate import ScanState
+
+
+class ScanStateTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        for script in ['sqlite_db.sql', 'sqlite_db_upgrade.sql']:
+            with open(self.get_user_path('..', '..', '..', 'resources', 'sql', script)) as fd:
+                self.conn.executescript(fd.read())
+
+        self.path = tempfile.mkdtemp()
+        shutil.copytree(self.get_user_path('images'), os.path.join(self.path, 'images'))
+        self.repo_fs = open_fs(self.path)
+
+    def tearDown(self):
+        self.repo_fs.close()
+        shutil.rmtree(self.path)
+        self.conn.close()
+        super(ScanStateTest, self).tearDown()
+
+    def walk(self, force=False):
+        """Walk the repository and return the names of the files by listed directory, or None if unchanged"""
+        scan_state = ScanState(self.conn, 1)
+        result = {}
+        for path, entry in scan_state.walk(FsScanner(self.repo_fs), file_filter=lambda name: name.endswith('.jpg'),
+                                           force=force):
+            if entry is None:
+                result[path] = None
+            elif entry.is_dir:
+                result[path] = []
+            else:
+                result[os.path.dirname(path)].append(entry.name)
+        scan_state.save()
+        return result
+
+    def walk_paths(self):
+        scan_state = ScanState(self.conn, 1)
+        return [path for path, entry in scan_state.walk(FsScanner(self.repo_fs)) if entry is not None and not entry.is_dir]
+
+    def set_dir_mtime(self, path, mtime=1000000000):
+        os.utime(os.path.join(self.path, path), (mtime, mtime))
+
+    def test_walk(self):
+        result = self.walk()
+        self.assertCountEqual(['/', '/images', '/images/subfolder'], result.keys())
+        self.assertCountEqual(['0001.jpg', '0002.jpg'], result['/images'])
+        self.assertCountEqual(['0003.jpg'], result['/images/subfolder'])
+        self.assertEqual(2, self.conn.execute('select entries from scan_state where path="/images"').fetchone()[0])
+
+    def test_walk_order(self):
+        for name in ['a.jpg', 'a0.jpg', 'a', 'a.b', 'a b']:
+            if '.' in name:
+                self.repo_fs.writebytes(name, b'')
+            else:
+                self.repo_fs.makedir(name)
+                self.repo_fs.writebytes(name + '/x.jpg', b'')
+        self.repo_fs.makedir('a.b.d')
+        self.repo_fs.writebytes('a.b.d/y.jpg', b'')
+
+        paths = self.walk_paths()
+        self.assertEqual(sorted(paths), paths)
+        self.assertIn('/a/x.jpg', paths)
+        self.assertIn('/images/subfolder/0003.jpg', paths)
+
+    def test_skip_unchanged(self):
+        for path in ['', 'images', os.path.join('images', 'subfolder')]:
+            self.set_dir_mtime(path)
+        self.walk()
+
+        result = self.walk()
+        self.assertEqual({'/': None, '/images': None, '/images/subfolder': None}, result)
+
+        shutil.copy(os.path.join(self.path, 'images', '0001.jpg'), os.path.join(self.path, 'images', 'new.jpg'))
+        self.set_dir_mtime('images', 1000000100)
+        result = self.walk()
+        self.assertIsNone(result['/images/subfolder'])
+        self.assertCountEqual(['0001.jpg', '0002.jpg', 'new.jpg'], result['/images'])
+
+        result = self.walk(force=True)
+        self.assertIsNotNone(result['/images/subfolder'])
+
+    def test_removed_directory(self):
+        for path in ['', 'images', os.path.join('images', 'subfolder')]:
+            self.set_dir_mtime(path)
+        self.walk()
+
+        shutil.rmtree(os.path.join(self.path, 'images', 'subfolder'))
+        self.set_dir_mtime('images', 1000000100)
+        result = self.walk()
+        self.assertCountEqual(['/', '/images'], result.keys())
+        self.assertCountEqual(['/', '/images'], [r[0] for r in self.conn.execute('select path from scan_state')])
+
+    def test_walk_subtree(self):
+        self.walk()
+        scan_state = ScanState(self.conn, 1, root='/images/subfolder')
+        walk = list(scan_state.walk(FsScanner(self.repo_fs), force=True))
+        self.assertEqual(['/images/subfolder', '/images/subfolder/0003.jpg'], [path for path, entry in walk])
+        self.assertEqual(['/images/subfolder'], scan_state.get_listed_paths())
+        self.assertEqual('/images', scan_state.take()[0][0][2])
+
+    def test_save_before(self):
+        scan_state = ScanState(self.conn, 1)
+        list(scan_state.walk(FsScanner(self.repo_fs)))
+
+        self.assertEqual(['/images/subfolder'], scan_state.get_listed_paths(before='/images/subfolder0'))
+        scan_state.save(before='/images/subfolder0')
+        self.assertEqual(['/images/subfolder'], [r[0] for r in self.conn.execute('select path from scan_state')])
+        self.assertCountEqual(['/', '/images'], scan_state.get_listed_paths())
+
+        scan_state.save()
+        self.assertEqual(3, self.conn.execute('select count(*) from scan_state').fetchone()[0])
+        self.assertEqual([], scan_state.get_listed_paths())
+
+
+if __name__ == "__main__":
+    unittest.main()
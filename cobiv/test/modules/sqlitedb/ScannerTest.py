@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fs import open_fs
+from fs.errors import ResourceNotFound
+from fs.memoryfs import MemoryFS
+
+from cobiv.modules.database.sqlitedb.scan.scanner import FsScanner, OsScanner, create_scanner
+
+
+class ScannerTest(unittest.TestCase):
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        shutil.copytree(self.get_user_path('images'), os.path.join(self.path, 'images'))
+        self.repo_fs = open_fs(self.path)
+
+    def tearDown(self):
+        self.repo_fs.close()
+        shutil.rmtree(self.path)
+        super(ScannerTest, self).tearDown()
+
+    def test_create_scanner(self):
+        self.assertIsInstance(create_scanner(self.repo_fs), OsScanner)
+        self.assertIsInstance(create_scanner(MemoryFS()), FsScanner)
+
+    def test_same_entries(self):
+        fs_scanner = FsScanner(self.repo_fs)
+        os_scanner = create_scanner(self.repo_fs)
+
+        for path in ['/', '/images', '/images/subfolder']:
+            self.assertEqual(fs_scanner.get_dir_modified(path), os_scanner.get_dir_modified(path))
+            expected = {e.name: e for e in fs_scanner.scandir(path)}
+            result = {e.name: e for e in os_scanner.scandir(path)}
+            self.assertCountEqual(expected.keys(), result.keys())
+            for name, entry in result.items():
+                self.assertEqual(expected[name].is_dir, entry.is_dir)
+                if not entry.is_dir:
+                    self.assertEqual(expected[name], entry)
+
+    def test_missing_directory(self):
+        scanner = create_scanner(self.repo_fs)
+        self.assertFalse(scanner.get_dir_modified('/missing'))
+        self.assertRaises(ResourceNotFound, scanner.scandir, '/missing')
+
+    def test_broken_link(self):
+        if not hasattr(os, 'symlink'):
+            return
+        os.symlink(os.path.join(self.path, 'nowhere.jpg'), os.path.join(self.path, 'images', 'broken.jpg'))
+        names = [e.name for e in create_scanner(self.repo_fs).scandir('/images')]
+        self.assertNotIn('broken.jpg', names)
+        self.assertIn('0001.jpg', names)
+
+
+if __name__ == "__main__":
+    unittest.main()
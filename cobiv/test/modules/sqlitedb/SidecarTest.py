@@ -0,0 +1,79 @@
+import sqlite3
+import unittest
+
+from fs.memoryfs import MemoryFS
+
+from cobiv.modules.database.sqlitedb.scan.scanner import FsScanner, ScanEntry
+from cobiv.modules.database.sqlitedb.scan.sidecar import match_sidecars, read_keywords, SidecarScanner, SidecarUpdate
+from cobiv.modules.database.sqlitedb.scan.tagextractor import TagExtractor
+from cobiv.modules.database.sqlitedb.sqlitedb import SqliteDb
+
+XMP = b'''<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">
+   <dc:subject>
+    <rdf:Bag>
+     <rdf:li>beach</rdf:li>
+     <rdf:li> sun </rdf:li>
+     <rdf:li>beach</rdf:li>
+    </rdf:Bag>
+   </dc:subject>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>'''
+
+
+def file_entry(name):
+    return ScanEntry(name, False, 1, 1000.0)
+
+
+class SidecarTest(unittest.TestCase):
+    def test_read_keywords(self):
+        self.assertEqual(['beach', 'sun'], read_keywords(XMP))
+        self.assertEqual([], read_keywords(b'<x:xmpmeta xmlns:x="adobe:ns:meta/"/>'))
+        self.assertEqual([], read_keywords(b'not xml'))
+
+    def test_match_sidecars(self):
+        entries = [file_entry(name) for name in ['a.jpg', 'a.jpg.xmp', 'a.xmp', 'b.png', 'b.xmp', 'c.jpg', 'd.xmp']]
+        entries.append(ScanEntry('e.xmp', True, None, None))
+        others, sidecars = match_sidecars(entries)
+        self.assertEqual(['a.jpg', 'b.png', 'c.jpg', 'e.xmp'], [e.name for e in others])
+        self.assertEqual({'a.jpg': 'a.jpg.xmp', 'b.png': 'b.xmp'}, {k: v.name for k, v in sidecars.items()})
+
+    def test_scanner(self):
+        repo_fs = MemoryFS()
+        repo_fs.makedir('/dir')
+        for name in ['/dir/a.jpg', '/dir/a.xmp', '/dir/b.jpg']:
+            repo_fs.writebytes(name, XMP)
+        sidecars = {}
+        scanner = SidecarScanner(FsScanner(repo_fs), sidecars)
+
+        self.assertEqual(['a.jpg', 'b.jpg'], sorted(e.name for e in scanner.scandir('/dir')))
+        self.assertEqual(['/dir/a.jpg'], list(sidecars))
+        self.assertEqual('/dir/a.xmp', sidecars['/dir/a.jpg'].name)
+
+        extractor = TagExtractor([])
+        self.assertEqual([(1, ['beach', 'sun']), (2, [])],
+                         list(extractor.read_sidecars(None, repo_fs, [(1, '/dir/a.xmp'), (2, '/dir/missing.xmp')])))
+
+    def test_write_sidecars(self):
+        conn = sqlite3.connect(':memory:')
+        conn.execute('create table tag (file_key int, category int, kind text, type int, value)')
+        conn.execute('create table sidecar (file_key int primary key, name text, size int, modified float, keywords text)')
+        conn.execute("insert into tag values (1, 1, 'tag', 0, 'beach')")
+
+        def write(*keywords):
+            SqliteDb._write_sidecars(conn.cursor(), [SidecarUpdate(1, '/a.jpg', file_entry('/a.xmp'), list(keywords))],
+                                     {})
+            return sorted(row[0] for row in conn.execute('select value from tag where file_key=1'))
+
+        self.assertEqual(['beach', 'sun'], write('beach', 'sun'))
+        # the keyword of the image itself stays when the sidecar no longer has it
+        self.assertEqual(['beach', 'sea'], write('sea'))
+        self.assertEqual(['beach'], write())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+import hashlib
+import io
+import os
+import unittest
+
+from PIL import Image
+from fs import open_fs
+from fs.wrapfs import WrapFS
+
+from cobiv.modules.database.sqlitedb.scan.blocklist import BloomFilter
+from cobiv.modules.database.sqlitedb.scan.hashing import DEFAULT_ALGORITHM, resolve_algorithm
+from cobiv.modules.database.sqlitedb.scan.tagextractor import TagExtractor
+from cobiv.modules.io.reader.tagreader import TagReader
+
+
+class SizeReader(TagReader):
+    def read_file_tags(self, file_id, data, list_to_add):
+        if self.data_mode == TagReader.STREAM:
+            data = data.read()
+        list_to_add.append((file_id, 0, self.data_mode, 1, str(len(data))))
+
+
+class HeaderSizeReader(SizeReader):
+    data_mode = TagReader.HEADER
+    header_size = 16
+
+
+class EmptyHeaderReader(SizeReader):
+    data_mode = TagReader.HEADER
+    header_size = 0
+
+
+class StreamSizeReader(SizeReader):
+    data_mode = TagReader.STREAM
+
+
+class ReadCounter(object):
+    def __init__(self, stream, counts):
+        self.stream = stream
+        self.counts = counts
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.counts.append(len(data))
+        return data
+
+    def __getattr__(self, item):
+        return getattr(self.stream, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stream.close()
+
+
+class ReadCountingFS(WrapFS):
+    """Filesystem counting the bytes read from its files"""
+
+    def __init__(self, wrap_fs):
+        super(ReadCountingFS, self).__init__(wrap_fs)
+        self.counts = []
+
+    def openbin(self, path, mode='r', buffering=-1, **options):
+        return ReadCounter(super(ReadCountingFS, self).openbin(path, mode, buffering, **options), self.counts)
+
+
+class ForwardOnlyFS(ReadCountingFS):
+    """Filesystem whose files can't seek, as some remote streams"""
+
+    def openbin(self, path, mode='r', buffering=-1, **options):
+        stream = super(ForwardOnlyFS, self).openbin(path, mode, buffering, **options)
+        stream.seekable = lambda: False
+        stream.seek = None
+        return stream
+
+
+class TagExtractorTest(unittest.TestCase):
+    def extract(self, extractor, files):
+        """Extract files and return the tag rows by file id"""
+        result = {file_id: data.rows for file_id, data in extractor.extract(self.repo_path, self.repo_fs, files)}
+        extractor.close()
+        return result
+
+    def get_user_path(self, *args):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+
+    def setUp(self):
+        self.repo_path = 'osfs://' + self.get_user_path('images')
+        self.repo_fs = open_fs(self.repo_path)
+        self.files = [(1, '/0001.jpg'), (2, '/0002.jpg'), (3, '/subfolder/0003.jpg')]
+
+    def tearDown(self):
+        self.repo_fs.close()
+        super(TagExtractorTest, self).tearDown()
+
+    def test_inline(self):
+        result = self.extract(TagExtractor([]), self.files)
+
+        self.assertCountEqual([1, 2, 3], result.keys())
+        for file_id, rows in result.items():
+            self.assertCountEqual(['width', 'height', 'format'], [row[2] for row in rows])
+            self.assertTrue(all(row[0] == file_id for row in rows))
+        self.assertIn((1, 0, 'format', 0, 'JPEG'), result[1])
+
+    def test_workers(self):
+        expected = self.extract(TagExtractor([]), self.files)
+        result = self.extract(TagExtractor([], workers=2, window=2), self.files)
+
+        self.assertEqual(expected, result)
+
+    def test_reader_data_modes(self):
+        size = os.path.getsize(self.get_user_path('images', '0001.jpg'))
+        result = self.extract(TagExtractor([HeaderSizeReader(), StreamSizeReader(), SizeReader()]), self.files[:1])
+
+        self.assertIn((1, 0, TagReader.HEADER, 1, '16'), result[1])
+        self.assertIn((1, 0, TagReader.STREAM, 1, str(size)), result[1])
+        self.assertIn((1, 0, TagReader.CONTENT, 1, str(size)), result[1])
+
+        result = self.extract(TagExtractor([EmptyHeaderReader()]), self.files[:1])
+        self.assertIn((1, 0, TagReader.HEADER, 1, '0'), result[1])
+
+    def test_invalid_image(self):
+        self.repo_fs.writebytes('/invalid.jpg', b'not an image')
+        try:
+            result = self.extract(TagExtractor([], workers=1), [(4, '/invalid.jpg')])
+        finally:
+            self.repo_fs.remove('/invalid.jpg')
+
+        self.assertEqual({4: -1}, result)
+
+    def test_hash(self):
+        expected = {}
+        for file_id, name in self.files:
+            with open(self.get_user_path('images', *name.split('/')), 'rb') as fd:
+                expected[file_id] = hashlib.blake2b(fd.read()).hexdigest()
+
+        for extractor in [TagExtractor([], hash_algorithm='blake2b'), TagExtractor([SizeReader()], hash_algorithm='blake2b'),
+                          TagExtractor([], workers=2, hash_algorithm='blake2b')]:
+            result = {file_id: data.digest for file_id, data in
+                      extractor.extract(self.repo_path, self.repo_fs, self.files)}
+            extractor.close()
+            self.assertEqual(expected, result)
+
+        result = list(TagExtractor([]).extract(self.repo_path, self.repo_fs, self.files[:1]))
+        self.assertIsNone(result[0][1].digest)
+        self.assertIsNone(result[0][1].perceptual_hash)
+
+    def test_resolve_algorithm(self):
+        self.assertEqual('sha256', resolve_algorithm('sha256'))
+        self.assertEqual(DEFAULT_ALGORITHM, resolve_algorithm('unknown'))
+        self.assertEqual(DEFAULT_ALGORITHM, resolve_algorithm('shake_128'))
+        self.assertIsNone(resolve_algorithm('none'))
+
+    def test_blocked_forward_only(self):
+        size = os.path.getsize(self.get_user_path('images', '0001.jpg'))
+        blocked = BloomFilter(10)
+        blocked.add('blocked digest')
+        forward_only_fs = ForwardOnlyFS(self.repo_fs)
+        data = dict(TagExtractor([HeaderSizeReader(), StreamSizeReader()], hash_algorithm='blake2b',
+                                 blocked=blocked).extract(None, forward_only_fs, self.files[:1]))[1]
+
+        self.assertEqual(size, sum(forward_only_fs.counts))
+        self.assertIn((1, 0, TagReader.STREAM, 1, str(size)), data.rows)
+        expected = dict(TagExtractor([], hash_algorithm='blake2b').extract(None, self.repo_fs, self.files[:1]))[1]
+        self.assertEqual(expected.digest, data.digest)
+
+    def test_known_digest(self):
+        size = os.path.getsize(self.get_user_path('images', '0001.jpg'))
+        counting_fs = ReadCountingFS(self.repo_fs)
+        blocked = BloomFilter(10)
+        blocked.add('blocked digest')
+        data = dict(TagExtractor([], hash_algorithm='blake2b', blocked=blocked).extract(
+            None, counting_fs, self.files[:1], digests={'/0001.jpg': 'known'}))[1]
+        self.assertEqual('known', data.digest)
+        self.assertLess(sum(counting_fs.counts), size)
+
+    def test_perceptual_hash(self):
+        for algorithm in ['dhash', 'phash']:
+            result = {file_id: data.perceptual_hash for file_id, data in
+                      TagExtractor([], perceptual_algorithm=algorithm).extract(self.repo_path, self.repo_fs, self.files)}
+            self.assertTrue(all(isinstance(value, int) and -2 ** 63 <= value < 2 ** 63 for value in result.values()))
+            self.assertEqual(3, len(set(result.values())))
+
+    def test_thumbnail(self):
+        size = os.path.getsize(self.get_user_path('images', '0001.jpg'))
+        counting_fs = ReadCountingFS(self.repo_fs)
+        data = dict(TagExtractor([HeaderSizeReader(), StreamSizeReader()], hash_algorithm='blake2b',
+                                 perceptual_algorithm='phash').extract(None, counting_fs, self.files[:1],
+                                                                       thumbnail_size=120))[1]
+        self.assertEqual(size, sum(counting_fs.counts))
+
+        thumbnail = Image.open(io.BytesIO(data.thumbnail))
+        self.assertEqual('PNG', thumbnail.format)
+        self.assertEqual(120, max(thumbnail.size))
+        expected = dict(TagExtractor([], hash_algorithm='blake2b', perceptual_algorithm='phash').extract(
+            None, self.repo_fs, self.files[:1]))[1]
+        self.assertEqual(expected.digest, data.digest)
+        self.assertEqual(expected.perceptual_hash, data.perceptual_hash)
+        self.assertIsNone(expected.thumbnail)
+
+        extractor = TagExtractor([], workers=2)
+        result = {file_id: data.thumbnail for file_id, data in
+                  extractor.extract(self.repo_path, self.repo_fs, self.files, thumbnail_size=60)}
+        extractor.close()
+        self.assertEqual(60, max(Image.open(io.BytesIO(result[3])).size))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from cobiv.modules.database.sqlitedb.scan.throttle import IoThrottle
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+class ThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def create_throttle(self, **kwargs):
+        return IoThrottle(clock=self.clock.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_unlimited(self):
+        throttle = self.create_throttle()
+        for i in range(100):
+            throttle.consume(size=1000000)
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_files_per_second(self):
+        throttle = self.create_throttle(files_per_second=10)
+        for i in range(11):
+            throttle.consume()
+        self.assertAlmostEqual(100.0 + 1.0, self.clock.now)
+
+    def test_bytes_per_second(self):
+        throttle = self.create_throttle(bytes_per_second=1000, files_per_second=100)
+        throttle.consume(size=2000)
+        throttle.consume(size=10)
+        throttle.consume(size=10)
+        self.assertAlmostEqual(100.0 + 2.01, self.clock.now)
+
+    def test_back_off(self):
+        throttle = self.create_throttle(idle_delay=2.0)
+        throttle.notify_activity()
+        self.clock.now += 0.5
+        throttle.consume()
+        self.assertAlmostEqual(102.0, self.clock.now)
+        self.assertTrue(all(delay <= 0.1 + 1e-09 for delay in self.clock.sleeps))
+
+        throttle.consume()
+        self.assertAlmostEqual(102.0, self.clock.now)
+
+    def test_back_off_end(self):
+        # the clock moves between two reads, up to the end of the back off
+        throttle = self.create_throttle(idle_delay=2.0)
+        clock = self.clock.clock
+        reads = []
+
+        def moving_clock():
+            reads.append(True)
+            if len(reads) == 3:
+                self.clock.now += 2.5
+            return clock()
+        throttle.clock = moving_clock
+        throttle.notify_activity()
+        throttle.consume()
+        self.assertTrue(all(delay >= 0 for delay in self.clock.sleeps))
+
+    def test_cancel_back_off(self):
+        cancelled = []
+        throttle = self.create_throttle(cancelled=lambda: len(cancelled) > 0)
+        throttle.notify_activity()
+        cancelled.append(True)
+        throttle.consume()
+        self.assertEqual([], self.clock.sleeps)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -69,6 +69,8 @@ class ThumbloaderTest(unittest.TestCase):
         self.session = Session()
         self.session.add_filesystem(1, open_fs(u'osfs://images'))
         path = self.get_user_path('thumbs')
+        if not os.path.exists(path):
+            os.makedirs(path)
         [os.remove(os.path.join(path, f)) for f in os.listdir(path)]
 
     def tearDown(self):
@@ -108,20 +110,20 @@ class ThumbloaderTest(unittest.TestCase):
         self.assertEqual(0, len(t.to_cache))
         self.assertEqual(0, len(os.listdir(self.get_user_path('thumbs'))))
 
-        t.append((1, u'/0001.jpg', 1))
+        t.append((1, u'/0001.jpg', 1, 'file'))
         self.assertEqual(1, len(t.to_cache))
         self.wait_for(t, 1)
         self.assertEqual(0, len(t.to_cache))
         self.assertEqual(1, len(os.listdir(self.get_user_path('thumbs'))))
 
-        t.append((1, u'/0001.jpg', 1), (2, u'/0002.jpg', 1),
-                 (3, u'/0003.jpg', 1))
+        t.append((1, u'/0001.jpg', 1, 'file'), (2, u'/0002.jpg', 1, 'file'),
+                 (3, u'/0003.jpg', 1, 'file'))
         self.assertEqual(3, len(t.to_cache))
         self.wait_for(t, 3)
         self.assertEqual(0, len(t.to_cache))
         self.assertEqual(3, len(os.listdir(self.get_user_path('thumbs'))))
 
-        t.append((2, u'/0002.jpg', 1))
+        t.append((2, u'/0002.jpg', 1, 'file'))
         self.assertEqual(1, len(t.to_cache))
         self.wait_for(t, 2)
         self.assertEqual(0, len(t.to_cache))
@@ -133,15 +135,15 @@ class ThumbloaderTest(unittest.TestCase):
     def _test_remove_images(self, app, *args):
         t = self.get_thumbloader(app)
 
-        t.append((1, u'/0001.jpg', 1))
+        t.append((1, u'/0001.jpg', 1, 'file'))
         self.wait_for(t, 1)
         self.assertEqual(1, len(os.listdir(self.get_user_path('thumbs'))))
 
         t.delete_thumbnail(1)
         self.assertEqual(0, len(os.listdir(self.get_user_path('thumbs'))))
 
-        t.append((1, u'/0001.jpg', 1), (2, u'/0002.jpg', 1),
-                 (3, u'/0003.jpg', 1))
+        t.append((1, u'/0001.jpg', 1, 'file'), (2, u'/0002.jpg', 1, 'file'),
+                 (3, u'/0003.jpg', 1, 'file'))
         self.wait_for(t, 4)
         t.delete_thumbnail(2)
         self.assertEqual(2, len(os.listdir(self.get_user_path('thumbs'))))
@@ -151,6 +153,17 @@ class ThumbloaderTest(unittest.TestCase):
         t.stop()
         app.stop()
 
+    def _test_book_then_image(self, app, *args):
+        t = self.get_thumbloader(app)
+
+        t.append((1, u'book', 0, 'book'), (2, u'/0002.jpg', 1, 'file'))
+        self.wait_for(t, 2)
+        self.assertTrue(t.thread.is_alive())
+        self.assertEqual(['2.png'], os.listdir(self.get_user_path('thumbs')))
+
+        t.stop()
+        app.stop()
+
     def test_initialization(self):
         self.call_test(self._test_initialization)
 
@@ -160,6 +173,9 @@ class ThumbloaderTest(unittest.TestCase):
     def test_remove_images(self):
         self.call_test(self._test_remove_images)
 
+    def test_book_then_image(self):
+        self.call_test(self._test_book_then_image)
+
 
 if __name__ == "__main__":
     unittest.main()